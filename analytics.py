@@ -0,0 +1,297 @@
+# Importaciones de bibliotecas externas
+import numpy as np
+import pandas as pd
+
+# Importaciones locales
+from inventory import iter_inventory
+from models import MODEL_FAMILIES
+from preferred_versions import UP_TO_DATE_MESSAGE
+
+# Estado de cumplimiento de cada equipo respecto a la versión preferida de su tren
+COMPLIANT = 'compliant'
+BEHIND = 'behind'
+AHEAD = 'ahead'
+NO_PREFERRED = 'no_preferred'
+UNKNOWN = 'unknown'
+COMPLIANCE_STATES = (COMPLIANT, BEHIND, AHEAD, NO_PREFERRED, UNKNOWN)
+
+# Columnas de los dispositivos que usa el análisis
+FRAME_COLUMNS = (
+    'hostname', 'model', 'serial', 'ip_address', 'sw_version', 'sw_version_prefered', 'app_version',
+    'threat_version', 'av_version', 'wildfire_version', 'status'
+)
+# Versiones de contenido 'release-build' (p. ej. 8834-8850); la de URL filtering es una fecha y no se compara
+CONTENT_COLUMNS = ('app_version', 'threat_version', 'av_version', 'wildfire_version')
+# Tramos de antigüedad del contenido, en releases por detrás del más nuevo de la flota
+CONTENT_AGE_BINS = (-1, 0, 7, 30, np.inf)
+CONTENT_AGE_LABELS = ('current', '1-7', '8-30', '>30')
+
+# Mismas versiones que preferred_versions.VERSION_PATTERN, con mayor, menor y parche obligatorios (como get_train)
+VERSION_COLUMNS_PATTERN = r'^\s*(\d+)\.(\d+)\.(\d+)(?:\.\d+)*(?:-h(\d+))?'
+VERSION_PARTS = ('major', 'minor', 'patch', 'hotfix')
+CONTENT_RELEASE_PATTERN = r'^\s*(\d+)'
+# 'PA-3220' -> 'PA-3200', 'PA-440' -> 'PA-400'; los modelos virtuales no cambian
+SERIES_PATTERN = r'^(PA-\d+)\d\d$'
+# Grupo de los equipos sin valor en una columna de agrupación (sin modelo, sin sitio, ...)
+MISSING_GROUP = '(none)'
+
+# Hojas del reporte y columnas por las que se agrupa cada una
+COMPLIANCE_SHEETS = {
+    'compliance_by_series': ('family', 'series'),
+    'compliance_by_model': ('family', 'series', 'model'),
+    'compliance_by_train': ('family', 'train', 'preferred_version'),
+    'compliance_by_site': ('site',),
+}
+
+
+def load_sites(inventory_path):
+    """
+    Read the site of every device from the inventory (see `inventory.iter_inventory`).
+
+    Args:
+        inventory_path (str): The inventory file.
+
+    Returns:
+        dict: The address of every device with a site mapped to the site. An 'ip:port' address is
+        also added without the port, since the devices report their address without it.
+    """
+    sites = {}
+    for target in iter_inventory(inventory_path):
+        if target.site:
+            sites[target.ip] = target.site
+            host, separator, port = target.ip.rpartition(':')
+            if separator and port.isdigit() and ':' not in host:
+                sites[host] = target.site
+    return sites
+
+
+def _device_columns(devices):
+    # A FleetTable is already columnar; the other sources are read once, one tuple per device
+    if hasattr(devices, 'text_columns'):
+        return {name: devices.text_columns[name] for name in FRAME_COLUMNS}
+    rows = (
+        tuple(device.get(name) for name in FRAME_COLUMNS) if isinstance(device, dict)
+        else tuple(getattr(device, name) for name in FRAME_COLUMNS)
+        for device in devices
+    )
+    return pd.DataFrame.from_records(rows, columns=FRAME_COLUMNS)
+
+
+def _categorical(values):
+    return values.array if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype) else pd.Categorical(values)
+
+
+def _spread(per_category, codes):
+    # Spread the values computed once per distinct value to every device through its code;
+    # the text columns stay categorical and the code -1 (no value) gives NA
+    columns = {}
+    for name, column in per_category.items():
+        if column.dtype == object:
+            labels = pd.Categorical(column)
+            # The appended -1 is picked by the code -1
+            columns[name] = pd.Categorical.from_codes(np.append(labels.codes, -1)[codes], labels.categories)
+        else:
+            columns[name] = column.array.take(codes, allow_fill=True)
+    return pd.DataFrame(columns)
+
+
+def parse_versions(values):
+    """
+    Parse a column of PAN-OS versions into its numeric parts, like `preferred_versions.parse_version`.
+
+    A fleet has a handful of distinct versions, so every distinct value is parsed once and the
+    result is spread to the devices through the categorical codes.
+
+    Args:
+        values (iterable): The version strings.
+
+    Returns:
+        pandas.DataFrame: The 'major', 'minor', 'patch' and 'hotfix' columns (Int16, NA if the value is
+        not a version), a 'key' column (float) that compares like the version tuples and the 'train'.
+    """
+    categorical = _categorical(values)
+    parts = pd.Series(categorical.categories, dtype=object).str.extract(VERSION_COLUMNS_PATTERN).astype('float64')
+    parts.columns = VERSION_PARTS
+    parts['hotfix'] = parts['hotfix'].where(parts['major'].isna(), parts['hotfix'].fillna(0))
+    parts['key'] = parts['major'] * 1e9 + parts['minor'] * 1e6 + parts['patch'] * 1e3 + parts['hotfix']
+    parts = parts.astype({part: 'Int16' for part in VERSION_PARTS})
+    train = (parts['major'].astype('string') + '.' + parts['minor'].astype('string')).astype(object)
+    parts['train'] = train.where(train.notna(), None)
+    return _spread(parts, categorical.codes)
+
+
+def _preferred_from_index(frame, index):
+    # The release of every (family, train) pair of the fleet is looked up once and spread through the pair codes
+    family, major, minor = frame['family'].array, frame['version_major'].array, frame['version_minor'].array
+    pair_codes = family.codes.astype('int64') * (len(frame['train'].cat.categories) + 1) + frame['train'].cat.codes.to_numpy()
+    _, first, inverse = np.unique(pair_codes, return_index=True, return_inverse=True)
+    releases = pd.Series(
+        [index.get(family[position], {}).get((major[position], minor[position])) for position in first], dtype=object
+    )
+    preferred = _spread(pd.DataFrame({'preferred_version': releases}), inverse)['preferred_version']
+    return preferred, frame['family'].isin(list(index)).to_numpy()
+
+
+def build_fleet_frame(devices, index=None, sites=None):
+    """
+    Build a typed DataFrame of the fleet, with the parsed versions and the compliance of every device.
+
+    Every version is split into integer columns ('version_major', 'version_minor', 'version_patch'
+    and 'version_hotfix', the version tuple) and the repeated text columns are categorical. Every
+    computation is vectorized: the models and versions are resolved once per distinct value and
+    spread to the devices through the categorical codes, so 100k devices take well under a second.
+
+    The 'compliance' of a device is `compliant` (on the preferred version of its train), `behind`,
+    `ahead`, `no_preferred` (the release notes have no preferred version for its train) or `unknown`
+    (no version, e.g. unreachable, or a model family without release notes). Without the `index`
+    the preferred version is taken from `sw_version_prefered`, which marks the trains without a
+    preferred release as up to date, so `no_preferred` needs the index.
+
+    The content versions ('app_version', 'threat_version', 'av_version', 'wildfire_version') get a
+    '<column>_release' column and a '<column>_age' column: the releases behind the newest one in
+    the fleet.
+
+    Args:
+        devices (iterable): Device objects, device dictionaries (e.g. a `sinks.JsonlReader`) or a FleetTable.
+        index (dict, optional): The preferred version index (see `preferred_versions.build_preferred_version_index`).
+        sites (dict, optional): The site of every address, see `load_sites`.
+
+    Returns:
+        pandas.DataFrame: One row per device.
+    """
+    frame = pd.DataFrame(_device_columns(devices))
+    for name in ('model', 'sw_version', 'sw_version_prefered', 'status', *CONTENT_COLUMNS):
+        frame[name] = frame[name].astype('category')
+    models = pd.Series(frame['model'].cat.categories, dtype=object)
+    model_columns = _spread(pd.DataFrame({
+        'series': models.str.replace(SERIES_PATTERN, r'\g<1>00', regex=True),
+        'family': models.str[:2].map(MODEL_FAMILIES).astype(object),
+    }), frame['model'].cat.codes.to_numpy())
+    frame['series'] = model_columns['series']
+    frame['family'] = model_columns['family']
+    if sites:
+        frame['site'] = frame['ip_address'].map(sites).astype('category')
+    else:
+        frame['site'] = pd.Categorical([None] * len(frame))
+
+    version = parse_versions(frame['sw_version'])
+    for part in VERSION_PARTS:
+        frame[f'version_{part}'] = version[part]
+    frame['train'] = version['train']
+
+    if index is not None:
+        preferred, family_known = _preferred_from_index(frame, index)
+    else:
+        preferred_column = frame['sw_version_prefered'].astype(object)
+        up_to_date = (preferred_column == UP_TO_DATE_MESSAGE).to_numpy()
+        preferred = pd.Categorical(np.where(up_to_date, frame['sw_version'].astype(object), preferred_column))
+        family_known = preferred_column.notna().to_numpy()
+    frame['preferred_version'] = preferred
+    preferred_key = parse_versions(frame['preferred_version'])['key'].to_numpy(dtype='float64', na_value=np.nan)
+
+    key = version['key'].to_numpy(dtype='float64', na_value=np.nan)
+    comparable = ~np.isnan(key) & ~np.isnan(preferred_key)
+    frame['compliance'] = pd.Categorical(
+        np.select(
+            [
+                np.isnan(key) | ~family_known,
+                np.isnan(preferred_key),
+                comparable & (key == preferred_key),
+                comparable & (key < preferred_key),
+            ],
+            [UNKNOWN, NO_PREFERRED, COMPLIANT, BEHIND],
+            AHEAD
+        ),
+        categories=COMPLIANCE_STATES
+    )
+
+    for name in CONTENT_COLUMNS:
+        releases = pd.Series(frame[name].cat.categories, dtype=object).str.extract(CONTENT_RELEASE_PATTERN)[0]
+        releases = pd.DataFrame({'release': releases.astype('float64').astype('Int64')})
+        release = _spread(releases, frame[name].cat.codes.to_numpy())['release']
+        frame[f'{name}_release'] = release
+        frame[f'{name}_age'] = release.max() - release
+    return frame
+
+
+def compliance_summary(frame, keys):
+    """
+    Count the devices of every compliance state per group, with a vectorized groupby.
+
+    Args:
+        frame (pandas.DataFrame): The fleet, see `build_fleet_frame`.
+        keys (list): The columns to group by; the missing values form the `MISSING_GROUP` group.
+
+    Returns:
+        pandas.DataFrame: The keys, 'devices', one column per compliance state and 'pct_compliant'
+        (the compliant devices over the devices with a known state).
+    """
+    keys = list(keys)
+    if frame.empty:
+        return pd.DataFrame(columns=[*keys, 'devices', *COMPLIANCE_STATES, 'pct_compliant'])
+    # The missing values get their own category, so only the observed groups are counted
+    groups = {}
+    for key in keys:
+        column = frame[key].astype('category')
+        if MISSING_GROUP not in column.cat.categories:
+            column = column.cat.add_categories(MISSING_GROUP)
+        groups[key] = column.fillna(MISSING_GROUP)
+    counts = (
+        frame.groupby([*(groups[key] for key in keys), frame['compliance']], observed=True).size()
+        .unstack('compliance', fill_value=0).reindex(columns=COMPLIANCE_STATES, fill_value=0)
+    )
+    counts.columns = list(COMPLIANCE_STATES)
+    counts.insert(0, 'devices', counts.sum(axis=1))
+    evaluated = counts['devices'] - counts[UNKNOWN]
+    counts['pct_compliant'] = (100 * counts[COMPLIANT] / evaluated.where(evaluated > 0)).round(1)
+    return counts.reset_index()
+
+
+def content_age_summary(frame):
+    """
+    Count the devices of every compliance state per content type and age bucket.
+
+    The age is the number of releases behind the newest content version in the fleet, bucketed
+    by `CONTENT_AGE_BINS` ('current', '1-7', '8-30' and '>30' releases).
+
+    Args:
+        frame (pandas.DataFrame): The fleet, see `build_fleet_frame`.
+
+    Returns:
+        pandas.DataFrame: 'content', 'newest_release', 'age', the device counts and 'pct_compliant'.
+    """
+    summaries = []
+    for name in CONTENT_COLUMNS:
+        age = pd.cut(frame[f'{name}_age'], CONTENT_AGE_BINS, labels=CONTENT_AGE_LABELS)
+        summary = compliance_summary(pd.DataFrame({'age': age, 'compliance': frame['compliance']}), ['age'])
+        summary.insert(0, 'newest_release', frame[f'{name}_release'].max())
+        summary.insert(0, 'content', name)
+        summaries.append(summary)
+    return pd.concat(summaries, ignore_index=True)
+
+
+def build_compliance_sheets(frame):
+    """
+    Build the compliance summaries written as extra sheets of the Excel report.
+
+    Args:
+        frame (pandas.DataFrame): The fleet, see `build_fleet_frame`.
+
+    Returns:
+        dict: The sheet name mapped to its DataFrame. The site sheet is only built if some device has a site.
+    """
+    sheets = {
+        name: compliance_summary(frame, keys) for name, keys in COMPLIANCE_SHEETS.items()
+        if keys != ('site',) or frame['site'].notna().any()
+    }
+    sheets['content_age'] = content_age_summary(frame)
+    return sheets
+
+
+def iter_frame_rows(frame):
+    """
+    Yield the header and the rows of a summary DataFrame, with None for the missing values.
+    """
+    yield list(frame.columns)
+    values = frame.astype(object)
+    yield from values.where(values.notna(), None).itertuples(index=False, name=None)
@@ -0,0 +1,390 @@
+# Importaciones de bibliotecas estándar de Python
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modelos, versiones y features usados para generar datos sintéticos
+SYNTHETIC_MODELS = ('PA-440', 'PA-3220', 'PA-5220', 'PA-VM', 'VM-50', 'M-200')
+SYNTHETIC_VERSIONS = ('10.1.11-h4', '10.1.14', '10.2.9-h1', '10.2.10-h3', '11.0.3', '11.1.2-h3', '11.1.4')
+SYNTHETIC_FEATURES = (
+    'Threat Prevention', 'PAN-DB URL Filtering', 'WildFire License', 'GlobalProtect Gateway',
+    'DNS Security', 'Premium', 'Advanced URL Filtering', 'SD-WAN', 'IoT Security', 'Enterprise DLP'
+)
+SYNTHETIC_DATES = ('May 01, 2024', 'June 11, 2023', 'January 15, 2025', 'March 03, 2024')
+
+DEFAULT_REGRESSION_THRESHOLD = 0.15
+
+# Tiempo máximo de arranque de un intérprete nuevo para cada comando (segundos)
+DEFAULT_STARTUP_BUDGET = 0.5
+STARTUP_COMMANDS = {
+    'startup.cli_help': ['cli.py', '--help'],
+    'startup.collect_imports': ['-c', 'import cli, dotenv, logger, device_data_collector, metrics, sinks'],
+}
+
+
+# ---------------------------------------------------------------------------
+# Fixtures sintéticos
+# ---------------------------------------------------------------------------
+
+def make_system_info_xml(serial='012345678901', model='PA-440', sw_version='10.2.9-h1', padding_kb=0):
+    """
+    Build a `show system info` response. `padding_kb` adds fields that the parser must skip.
+    """
+    padding = ''.join(f'<extra-field-{i}>{"x" * 40}</extra-field-{i}>' for i in range(padding_kb * 1024 // 80))
+    return (
+        '<response status="success"><result><system>'
+        f'<hostname>fw-{serial}</hostname><ip-address>10.0.0.1</ip-address><model>{model}</model>'
+        f'<serial>{serial}</serial><sw-version>{sw_version}</sw-version>'
+        '<global-protect-client-package-version>6.2.1</global-protect-client-package-version>'
+        '<app-version>8834-8850</app-version><av-version>4827-5345</av-version>'
+        '<threat-version>8834-8850</threat-version><wildfire-version>880372-884255</wildfire-version>'
+        '<url-filtering-version>20240601.20194</url-filtering-version>'
+        f'<device-certificate-status>Valid</device-certificate-status>{padding}'
+        '</system></result></response>'
+    ).encode('utf-8')
+
+
+def make_license_xml(n_licenses=10):
+    """
+    Build a `request license info` response with `n_licenses` entries.
+    """
+    entries = ''.join(
+        f'<entry><feature>{SYNTHETIC_FEATURES[i % len(SYNTHETIC_FEATURES)]}</feature>'
+        f'<description>Synthetic license {i}</description><serial>0000{i}</serial>'
+        f'<issued>{SYNTHETIC_DATES[i % len(SYNTHETIC_DATES)]}</issued><expires>Never</expires>'
+        f'<expired>{"yes" if i % 7 == 0 else "no"}</expired><authcode></authcode></entry>'
+        for i in range(n_licenses)
+    )
+    return f'<response status="success"><result><licenses>{entries}</licenses></result></response>'.encode('utf-8')
+
+
+def make_release_html(n_tables=6, versions=8, rows=6, seed=0):
+    """
+    Build a release-notes page with the markup of the support site: h2 sections, h1 version
+    rows and 'P' preferred rows wrapped in span/p/font/em tags.
+    """
+    rng = random.Random(seed)
+    sections = ('PAN-OS for Firewalls', 'Panorama on VM / M-series', 'Prisma Access for Panorama', 'GlobalProtect')
+    parts = ['<html><body><div class="content"><h2>Introduction</h2><p>Guidance</p>']
+    for position, section in enumerate(sections):
+        parts.append(f'<h2 id="s{position}" style="color:#333">{section}</h2>')
+        for _ in range(n_tables):
+            parts.append('<table class="tbl" width="100%"><thead><tr><th>P</th><th>Release</th><th>Date</th><th>Comments</th></tr></thead><tbody>')
+            for version in range(versions):
+                major, minor = 9 + version // 3, version % 3
+                parts.append(f'<tr><td colspan="4"><h1><strong>{major}.{minor}</strong> <em>(notes)</em></h1></td></tr>')
+                for row in range(rows):
+                    parts.append(
+                        f'<tr role="row"><td><span>{"P" if row == 0 else ""}</span></td>'
+                        f'<td><p>{major}.{minor}.{row + 1}-h{rng.randint(1, 9)}</p></td>'
+                        f'<td><font size="2">0{rng.randint(1, 9)}/{rng.randint(10, 28)}/2{rng.randint(0, 4)}</font></td>'
+                        f'<td>Fix &amp; <br/>notes {"x" * rng.randint(10, 200)}</td></tr>'
+                    )
+            parts.append('</tbody></table>')
+    parts.append('</div></body></html>')
+    return ''.join(parts)
+
+
+def make_release_data():
+    """
+    Build the release JSON data (as extracted from the release notes) for the synthetic versions.
+    """
+    trains = {}
+    for version in SYNTHETIC_VERSIONS:
+        train = version.rsplit('.', 1)[0]
+        trains[train] = [version, '01/06/2024', 'Preferred']
+    return [{'PAN-OS for Firewalls': dict(trains)}, {'Panorama on VM / M-series': dict(trains)}]
+
+
+def make_device_info(index, n_licenses=10, rng=None):
+    """
+    Build the parsed data of one device, as returned by `retrieve_data_from_multiple_uris`.
+    """
+    rng = rng or random
+    return [
+        {'system': {
+            'hostname': f'fw-{index:06d}', 'model': rng.choice(SYNTHETIC_MODELS), 'serial': f'{index:012d}',
+            'ip-address': f'10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}',
+            'sw-version': rng.choice(SYNTHETIC_VERSIONS), 'global-protect-client-package-version': '6.2.1',
+            'app-version': '8834-8850', 'av-version': '4827-5345', 'threat-version': '8834-8850',
+            'wildfire-version': '880372-884255', 'url-filtering-version': '20240601.20194',
+            'device-certificate-status': 'Valid'
+        }},
+        {'licenses': {'entry': [
+            {'feature': SYNTHETIC_FEATURES[i % len(SYNTHETIC_FEATURES)],
+             'issued': SYNTHETIC_DATES[i % len(SYNTHETIC_DATES)],
+             'expired': 'yes' if i % 7 == 0 else 'no'}
+            for i in range(n_licenses)
+        ]}}
+    ]
+
+
+def make_devices(n_devices, n_licenses=10, seed=0):
+    """
+    Build a fleet of `n_devices` Device objects.
+    """
+    from device_data_collector import create_device_from_info
+
+    rng = random.Random(seed)
+    return [create_device_from_info(make_device_info(index, n_licenses, rng)) for index in range(n_devices)]
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+def measure(function, repeat=5, min_time=0.05):
+    """
+    Time `function` and return the statistics of the time per call, in seconds.
+
+    Like `timeit`, the number of calls per run is calibrated first so that every run takes
+    at least `min_time` seconds, which keeps the sub-millisecond benchmarks stable.
+
+    Args:
+        function (callable): The function to measure, called without arguments.
+        repeat (int, optional): Number of measured runs. Defaults to 5.
+        min_time (float, optional): Minimum duration of a run in seconds. Defaults to 0.05.
+
+    Returns:
+        dict: The min, median, mean and max time per call, the number of runs and of calls per run.
+    """
+    def timed_run(number):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        return time.perf_counter() - start
+
+    number = 1
+    elapsed = timed_run(number)
+    while elapsed < min_time:
+        number = max(number + 1, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+        elapsed = timed_run(number)
+
+    times = [timed_run(number) / number for _ in range(repeat)]
+    return {
+        'min': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times),
+        'max': max(times), 'runs': repeat, 'number': number
+    }
+
+
+def _chunks(data, size=64 * 1024):
+    return [data[position:position + size] for position in range(0, len(data), size)]
+
+
+def bench_parse(results, repeat, response_kb):
+    import xmltodict
+    from xml_parser import get_field_spec, parse_selected_fields
+
+    system_uri = '<show><system><info></info></system></show>'
+    license_uri = '<request><license><info></info></license></request>'
+    system_xml = make_system_info_xml(padding_kb=response_kb)
+    license_xml = make_license_xml(n_licenses=max(10, response_kb * 4))
+    for name, uri, body in (('system', system_uri, system_xml), ('licenses', license_uri, license_xml)):
+        spec = get_field_spec(uri)
+        chunks = _chunks(body)
+        results[f'parse.{name}.selective.{response_kb}kb'] = measure(lambda: parse_selected_fields(chunks, spec), repeat)
+        text = body.decode('utf-8')
+        results[f'parse.{name}.xmltodict.{response_kb}kb'] = measure(lambda: xmltodict.parse(text), repeat)
+
+
+def bench_create_device(results, repeat, fleet_size):
+    from device_data_collector import create_device_from_info
+
+    rng = random.Random(0)
+    infos = [make_device_info(index, 10, rng) for index in range(fleet_size)]
+    results[f'create_device_from_info.{fleet_size}'] = measure(
+        lambda: [create_device_from_info(info) for info in infos], repeat
+    )
+
+
+def bench_enrich(results, repeat, fleet_size, work_dir):
+    from main import update_device_with_json
+
+    json_file = os.path.join(work_dir, 'release.json')
+    with open(json_file, 'w') as file:
+        json.dump(make_release_data(), file)
+    devices = make_devices(fleet_size)
+    results[f'update_device_with_json.{fleet_size}'] = measure(lambda: update_device_with_json(json_file, devices), repeat)
+
+
+def bench_export(results, repeat, fleet_size, work_dir):
+    from dataframes import save_to_excel
+
+    devices = make_devices(fleet_size)
+    filename = os.path.join(work_dir, 'output.xlsx')
+    results[f'save_to_excel.{fleet_size}'] = measure(lambda: save_to_excel(devices, filename), repeat)
+
+
+def bench_analytics(results, repeat, fleet_size):
+    from analytics import build_compliance_sheets, build_fleet_frame
+    from models import FleetTable
+    from preferred_versions import build_preferred_version_index
+
+    index = build_preferred_version_index(make_release_data())
+    table = FleetTable.from_devices(make_devices(fleet_size))
+    results[f'compliance_sheets.{fleet_size}'] = measure(
+        lambda: build_compliance_sheets(build_fleet_frame(table, index)), max(1, repeat // 2)
+    )
+
+
+def bench_html(results, repeat, n_tables):
+    from html_data_extractor import build_section_index, extract_sections, get_release_sections, process_info_from_tables
+
+    html_content = make_release_html(n_tables=n_tables)
+    sections = get_release_sections()
+
+    def pipeline():
+        return process_info_from_tables(extract_sections(build_section_index(html_content), sections))
+
+    results[f'html_pipeline.{n_tables}_tables'] = measure(pipeline, repeat)
+
+
+def bench_startup(results, repeat):
+    """
+    Time a fresh interpreter running `cli.py --help` and importing what the collect command needs.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name, arguments in STARTUP_COMMANDS.items():
+        command = [sys.executable, *arguments]
+        results[name] = measure(
+            lambda: subprocess.run(command, cwd=directory, stdout=subprocess.DEVNULL, check=True), repeat, min_time=0
+        )
+
+
+def check_startup_budget(results, budget=DEFAULT_STARTUP_BUDGET):
+    """
+    Return the start-up benchmarks whose median exceeds the budget, as (name, median) tuples.
+    """
+    return [
+        (name, stats['median']) for name, stats in results.items()
+        if name.startswith('startup.') and stats['median'] > budget
+    ]
+
+
+def run_benchmarks(fleet_sizes=(1000,), response_kb=(1, 64), html_tables=(6,), export_sizes=None, repeat=5, startup_only=False):
+    """
+    Run every benchmark and return the results.
+
+    Args:
+        fleet_sizes (iterable, optional): Fleet sizes for the device construction and enrichment benchmarks.
+        response_kb (iterable, optional): Sizes (KB) of the synthetic XML responses.
+        html_tables (iterable, optional): Tables per section of the synthetic release notes.
+        export_sizes (iterable, optional): Fleet sizes for the Excel export. Defaults to `fleet_sizes`.
+        repeat (int, optional): Measured runs per benchmark. Defaults to 5.
+        startup_only (bool, optional): Only run the start-up benchmarks. Defaults to False.
+
+    Returns:
+        dict: The benchmark name mapped to its timing statistics.
+    """
+    # The collector logs through the project loggers; keep them quiet during the benchmarks
+    import logging
+    logging.getLogger('info_logger').disabled = True
+    logging.getLogger('error_logger').disabled = True
+
+    results = {}
+    bench_startup(results, repeat)
+    if startup_only:
+        return results
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in response_kb:
+            bench_parse(results, repeat, size)
+        for size in fleet_sizes:
+            bench_create_device(results, repeat, size)
+            bench_enrich(results, repeat, size, work_dir)
+            bench_analytics(results, repeat, size)
+        for size in export_sizes or fleet_sizes:
+            bench_export(results, max(1, repeat // 2), size, work_dir)
+        for n_tables in html_tables:
+            bench_html(results, repeat, n_tables)
+    return results
+
+
+def compare_results(results, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Compare the medians of two benchmark runs.
+
+    Args:
+        results (dict): The current benchmark results.
+        baseline (dict): The stored baseline results.
+        threshold (float, optional): Relative slowdown considered a regression. Defaults to 0.15.
+
+    Returns:
+        list: A list of (name, baseline_median, current_median, ratio, is_regression) tuples.
+    """
+    comparison = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['median']
+        after = stats['median']
+        ratio = after / before if before else float('inf')
+        comparison.append((name, before, after, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def _parse_sizes(value):
+    return tuple(int(size) for size in value.split(',') if size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the parse, enrich and export hot paths.')
+    parser.add_argument('--fleet-sizes', type=_parse_sizes, default=(1000,), help='Comma separated fleet sizes (default: 1000).')
+    parser.add_argument('--export-sizes', type=_parse_sizes, default=None, help='Fleet sizes for the Excel export (default: fleet sizes).')
+    parser.add_argument('--response-kb', type=_parse_sizes, default=(1, 64), help='Comma separated XML response sizes in KB (default: 1,64).')
+    parser.add_argument('--html-tables', type=_parse_sizes, default=(6,), help='Comma separated tables per release-notes section (default: 6).')
+    parser.add_argument('--repeat', type=int, default=5, help='Measured runs per benchmark (default: 5).')
+    parser.add_argument('--output', default='benchmark_results.json', help='File where the results are written.')
+    parser.add_argument('--compare', metavar='BASELINE', help='Baseline results file to compare against.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='Relative slowdown of the median flagged as a regression (default: 0.15).')
+    parser.add_argument('--startup-budget', type=float, default=DEFAULT_STARTUP_BUDGET,
+                        help='Maximum median start-up time in seconds (default: 0.5).')
+    parser.add_argument('--startup-only', action='store_true', help='Only run the start-up benchmarks.')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.fleet_sizes, args.response_kb, args.html_tables, args.export_sizes, args.repeat, args.startup_only
+    )
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+
+    for name, stats in results.items():
+        print(f"{name:<45} median {stats['median'] * 1000:10.2f} ms   min {stats['min'] * 1000:10.2f} ms")
+    print(f"Results written to {args.output}")
+
+    over_budget = check_startup_budget(results, args.startup_budget)
+    for name, median in over_budget:
+        print(f"{name} takes {median:.3f} s, over the start-up budget of {args.startup_budget:.3f} s")
+    if over_budget:
+        return 1
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        regressions = 0
+        print(f"\nComparison against {args.compare} (threshold {args.threshold:.0%}):")
+        for name, before, after, ratio, is_regression in compare_results(results, baseline, args.threshold):
+            regressions += is_regression
+            flag = 'REGRESSION' if is_regression else ''
+            print(f"{name:<45} {before * 1000:10.2f} ms -> {after * 1000:10.2f} ms  x{ratio:5.2f} {flag}")
+        if regressions:
+            print(f"{regressions} regressions found.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+# Importaciones de bibliotecas estándar de Python
+import argparse
+import os
+import sys
+
+# Los módulos del proyecto (y requests, openpyxl, ...) se importan dentro de cada subcomando,
+# así `--help` y cada paso sólo cargan lo que necesitan.
+
+
+def load_environment():
+    """
+    Load the `.env` file and start the logging listener, as `main.py` does on start-up.
+    """
+    from dotenv import load_dotenv
+    from logger import configure_logging
+
+    load_dotenv()
+    configure_logging()
+
+
+def get_release_json(path=None):
+    """
+    Return the release notes JSON to enrich with: `path`, or the most recent JSON in `source/json`.
+    """
+    if path:
+        return path
+    from utils import get_most_recent_file, get_source_dir
+
+    json_source_dir = get_source_dir('json')
+    if os.path.isdir(json_source_dir):
+        return get_most_recent_file(json_source_dir, '.json')
+    return None
+
+
+def open_device_reader(path):
+    """
+    Re-iterable reader of the device dictionaries written by a JSONL or Parquet sink.
+    """
+    from sinks import JsonlReader, ParquetReader
+
+    return ParquetReader(path) if path.endswith('.parquet') else JsonlReader(path)
+
+
+def command_extract_html(args):
+    from html_data_extractor import extract_release_json
+
+    json_file = extract_release_json(force=args.force)
+    if not json_file:
+        print('Could not extract data from HTML tables. Check the logs for more information.')
+        return 1
+    print(json_file)
+    return 0
+
+
+def command_collect(args):
+    from device_data_collector import MissingCredentialsError, collect_data_from_devices, get_default_credentials, process_device_list
+    from metrics import export_metrics
+    from sinks import abort_sinks, close_sinks, open_sinks
+
+    # Nothing is written when the credentials are missing
+    try:
+        get_default_credentials()
+    except MissingCredentialsError as e:
+        print(e)
+        return 1
+
+    enrich = None
+    if args.release:
+        from preferred_versions import enrich_devices, load_preferred_version_index
+
+        index = load_preferred_version_index(args.release)
+
+        def enrich(device):
+            return enrich_devices([device], index)
+
+    inventory = args.inventory
+    if not args.ips and not inventory:
+        from utils import get_most_recent_file, get_source_dir
+
+        inventory = get_most_recent_file(get_source_dir(), '.csv')
+    sinks = open_sinks(args.sinks, args.output_dir)
+    completed = False
+    try:
+        if args.ips:
+            from inventory import iter_targets
+
+            devices = process_device_list(
+                iter_targets(args.ips), args.max_workers, args.max_per_host, sinks=sinks, enrich=enrich
+            )
+        else:
+            devices = collect_data_from_devices(inventory, sinks, enrich, args.max_workers, args.max_per_host)
+        completed = True
+    finally:
+        # The outputs of a failed run are discarded instead of replacing the previous ones
+        if completed:
+            close_sinks(sinks)
+        else:
+            abort_sinks(sinks)
+    export_metrics()
+    for sink in sinks:
+        print(sink.path)
+    return 0 if devices else 1
+
+
+def command_enrich(args):
+    from preferred_versions import enrich_device_dicts, load_preferred_version_index
+    from sinks import JsonlSink
+
+    release = get_release_json(args.release)
+    if not release:
+        print('No release notes JSON found. Run extract-html first or pass --release.')
+        return 1
+    output = args.output or f"{os.path.splitext(args.devices)[0]}_enriched.jsonl"
+    index = load_preferred_version_index(release)
+    # The devices are read, enriched and written one batch at a time
+    with JsonlSink(output) as sink:
+        for device_dict in enrich_device_dicts(open_device_reader(args.devices), index):
+            sink.write(device_dict)
+    print(output)
+    return 0
+
+
+def command_export(args):
+    from dataframes import save_to_excel
+
+    index = sites = None
+    if args.compliance_sheets:
+        from analytics import load_sites
+        from preferred_versions import load_preferred_version_index
+
+        release = get_release_json(args.release)
+        index = load_preferred_version_index(release) if release else None
+        sites = load_sites(args.inventory) if args.inventory else None
+    save_to_excel(open_device_reader(args.devices), args.output, args.licenses_sheet, args.compliance_sheets, index, sites)
+    print(args.output)
+    return 0
+
+
+def command_delta(args):
+    from delta_report import write_delta_report
+
+    output = args.output or f"{os.path.splitext(args.current)[0]}_delta.jsonl"
+    summary = write_delta_report(args.previous, args.current, output)
+    if summary is None:
+        return 1
+    print(output)
+    for kind, count in sorted(summary.items()):
+        print(f'{kind}: {count}')
+    return 0
+
+
+def command_history(args):
+    import json
+
+    from history_store import HistoryStore, get_history_path
+
+    path = args.database or get_history_path()
+    if not os.path.exists(path):
+        print(f'No history found in {path}.')
+        return 1
+    with HistoryStore(path) as store:
+        try:
+            rows = query_history(store, args)
+        except ValueError as e:
+            print(e)
+            return 1
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    return 0
+
+
+def query_history(store, args):
+    if args.device:
+        return store.device_history(args.device, args.fields or ('sw_version',), args.since, args.until)
+    if args.last_change:
+        change = store.last_change(*args.last_change)
+        return [change] if change else []
+    if args.lagging is not None:
+        return store.lagging_devices(args.lagging)
+    if args.version:
+        return store.devices_on_version(args.version, args.until)
+    return store.list_runs(args.limit)
+
+
+def command_daemon(args):
+    from daemon import run_daemon
+    from device_data_collector import MissingCredentialsError, get_default_credentials
+
+    try:
+        get_default_credentials()
+    except MissingCredentialsError as e:
+        print(e)
+        return 1
+
+    inventory = args.inventory
+    if not inventory:
+        from utils import get_most_recent_file, get_source_dir
+
+        inventory = get_most_recent_file(get_source_dir(), '.csv')
+    if not inventory:
+        print('No inventory found. Pass --inventory or add a CSV to source/.')
+        return 1
+    run_daemon(inventory, args.interval, args.slots, args.host, args.port, args.release, args.max_workers, args.max_per_host)
+    return 0
+
+
+def command_run(args):
+    from main import main as run_main
+
+    run_main()
+    return 0
+
+
+def _parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Collect, enrich and report the software versions and licenses of PAN-OS devices.')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+
+    extract_parser = subparsers.add_parser('extract-html', help='Extract the preferred versions from the release notes HTML.')
+    extract_parser.add_argument('--force', action='store_true', help='Extract the tables even if the HTML did not change.')
+    extract_parser.set_defaults(handler=command_extract_html)
+
+    collect_parser = subparsers.add_parser('collect', help='Collect the devices and write them to the output sinks.')
+    collect_parser.add_argument('ips', nargs='*', help='IP addresses, CIDR or address ranges to collect instead of the inventory.')
+    collect_parser.add_argument('--inventory', help='Inventory CSV or text file (default: the most recent CSV in source/).')
+    collect_parser.add_argument('--sinks', type=_parse_list, help='Comma separated output sinks (default: OUTPUT_SINKS).')
+    collect_parser.add_argument('--output-dir', help='Output directory (default: OUTPUT_DIR).')
+    collect_parser.add_argument('--release', help='Release notes JSON to enrich the devices while they are collected.')
+    collect_parser.add_argument('--max-workers', type=int, help='Devices processed at the same time (default: MAX_WORKERS).')
+    collect_parser.add_argument('--max-per-host', type=int, help='Simultaneous requests per device (default: MAX_PER_HOST).')
+    collect_parser.set_defaults(handler=command_collect)
+
+    enrich_parser = subparsers.add_parser('enrich', help='Set the preferred version of collected devices.')
+    enrich_parser.add_argument('devices', help='JSONL or Parquet file written by collect.')
+    enrich_parser.add_argument('--release', help='Release notes JSON (default: the most recent JSON in source/json).')
+    enrich_parser.add_argument('--output', help='Enriched JSONL file (default: <devices>_enriched.jsonl).')
+    enrich_parser.set_defaults(handler=command_enrich)
+
+    export_parser = subparsers.add_parser('export', help='Write the Excel report of collected devices.')
+    export_parser.add_argument('devices', help='JSONL or Parquet file written by collect or enrich.')
+    export_parser.add_argument('--output', default='output.xlsx', help='Excel file (default: output.xlsx).')
+    export_parser.add_argument('--licenses-sheet', action='store_true', help="Also write a 'licenses' sheet in long format.")
+    export_parser.add_argument('--compliance-sheets', action='store_true', help='Also write the compliance summaries per model, train, content age and site.')
+    export_parser.add_argument('--release', help='Release notes JSON for --compliance-sheets (default: the most recent JSON in source/json).')
+    export_parser.add_argument('--inventory', help='Inventory with the site of every device for --compliance-sheets.')
+    export_parser.set_defaults(handler=command_export)
+
+    delta_parser = subparsers.add_parser('delta', help='Write the changes between two collected snapshots of the fleet.')
+    delta_parser.add_argument('previous', help='JSONL or Parquet file of the previous snapshot.')
+    delta_parser.add_argument('current', help='JSONL or Parquet file of the current snapshot.')
+    delta_parser.add_argument('--output', help='Change set file (default: <current>_delta.jsonl).')
+    delta_parser.set_defaults(handler=command_delta)
+
+    history_parser = subparsers.add_parser('history', help='Query the history of the collected devices (the runs by default).')
+    history_parser.add_argument('--database', help='History database (default: HISTORY_DB or OUTPUT_DIR/history.sqlite).')
+    query_group = history_parser.add_mutually_exclusive_group()
+    query_group.add_argument('--device', metavar='SERIAL', help='Values of a device in every run.')
+    query_group.add_argument('--last-change', nargs=2, metavar=('SERIAL', 'FIELD'), help='When a value of a device last changed.')
+    query_group.add_argument('--lagging', type=float, metavar='DAYS', help='Devices behind their preferred version for more than DAYS days.')
+    query_group.add_argument('--version', help="Devices running a version in the last run (a trailing '%%' matches a prefix).")
+    history_parser.add_argument('--fields', type=_parse_list, help='Comma separated fields for --device (default: sw_version).')
+    history_parser.add_argument('--since', help="Start time for --device ('YYYY-MM-DD HH:MM:SS').")
+    history_parser.add_argument('--until', help="End time for --device, or reference time for --version.")
+    history_parser.add_argument('--limit', type=int, default=20, help='Runs listed (default: 20).')
+    history_parser.set_defaults(handler=command_history)
+
+    daemon_parser = subparsers.add_parser('daemon', help='Poll the fleet continuously and serve its state through a local JSON API.')
+    daemon_parser.add_argument('--inventory', help='Inventory CSV or text file (default: the most recent CSV in source/).')
+    daemon_parser.add_argument('--interval', type=float, help='Seconds between two polls of a device (default: DAEMON_INTERVAL).')
+    daemon_parser.add_argument('--slots', type=int, help='Stagger slots per interval (default: DAEMON_SLOTS).')
+    daemon_parser.add_argument('--host', help='Address of the API (default: DAEMON_HOST).')
+    daemon_parser.add_argument('--port', type=int, help='Port of the API (default: DAEMON_PORT).')
+    daemon_parser.add_argument('--release', help='Release notes JSON (default: the most recent JSON in source/json).')
+    daemon_parser.add_argument('--max-workers', type=int, help='Devices processed at the same time (default: MAX_WORKERS).')
+    daemon_parser.add_argument('--max-per-host', type=int, help='Simultaneous requests per device (default: MAX_PER_HOST).')
+    daemon_parser.set_defaults(handler=command_daemon)
+
+    run_parser = subparsers.add_parser('run', help='Run every step, like main.py.')
+    run_parser.set_defaults(handler=command_run)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    load_environment()
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,445 @@
+# Importaciones de bibliotecas estándar de Python
+import fnmatch
+import heapq
+import json
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Importaciones locales
+from logger import info_logger, error_logger
+from metrics import metrics
+from models import STATUS_OK
+
+# Los módulos del recolector (requests, openpyxl, ...) se importan al empezar a sondear o al exportar
+
+DEFAULT_INTERVAL = 900
+DEFAULT_SLOTS = 60
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8787
+# Cada cuánto se comprueba si el inventario cambió mientras no hay equipos pendientes
+INVENTORY_CHECK_SECONDS = 5.0
+
+# Parámetros de /devices y /report que no son filtros de campos
+RESERVED_PARAMS = ('fields', 'limit', 'offset', 'format', 'licenses_sheet')
+REPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def get_daemon_settings():
+    """
+    Read the daemon settings from the environment variables.
+
+    Returns:
+        dict: 'interval' (seconds between two polls of a device), 'slots' (stagger slots per interval),
+        'host' and 'port' of the API.
+    """
+    return {
+        'interval': float(os.getenv('DAEMON_INTERVAL', DEFAULT_INTERVAL)),
+        'slots': int(os.getenv('DAEMON_SLOTS', DEFAULT_SLOTS)),
+        'host': os.getenv('DAEMON_HOST', DEFAULT_HOST),
+        'port': int(os.getenv('DAEMON_PORT', DEFAULT_PORT)),
+    }
+
+
+class FleetState:
+    """
+    In-memory state of the fleet: the last snapshot of every device, keyed by serial.
+
+    It is fed like an output sink (see `sinks.DeviceSink`), so the collector writes every device
+    into it as soon as it is completed. A device that could not be collected (unreachable, circuit
+    open) keeps its last known data with the new status; `last_ok_at` tells when it last answered.
+    Every snapshot is replaced as a whole and never modified, so readers get consistent copies.
+    """
+    path = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = {}
+        # Dirección del equipo -> clave, para asociar los equipos omitidos (sin serial) con su última foto
+        self._addresses = {}
+
+    def write(self, device):
+        """
+        Store the snapshot of a device (a Device object or its dictionary).
+        """
+        snapshot = dict(device if isinstance(device, dict) else device.to_dict())
+        now = time.time()
+        address = snapshot.get('ip_address')
+        with self._lock:
+            if snapshot.get('serial'):
+                key = snapshot['serial']
+                # The device answered: the placeholder written while it was unreachable is no longer needed
+                placeholder = self._addresses.get(address)
+                if placeholder is not None and placeholder != key and not self._devices.get(placeholder, {}).get('serial'):
+                    self._devices.pop(placeholder, None)
+            else:
+                key = self._addresses.get(address, f'ip:{address}')
+                previous = self._devices.get(key)
+                if previous is not None and previous.get('serial'):
+                    snapshot = {**previous, 'status': snapshot.get('status')}
+            previous = self._devices.get(key)
+            snapshot['polled_at'] = now
+            if snapshot.get('status') == STATUS_OK:
+                snapshot['last_ok_at'] = now
+            else:
+                snapshot['last_ok_at'] = previous.get('last_ok_at') if previous else None
+            self._devices[key] = snapshot
+            if address:
+                self._addresses[address] = key
+
+    def get(self, serial):
+        """
+        Return the snapshot of a device by serial (or 'ip:<address>' for a device never collected), or None.
+        """
+        with self._lock:
+            return self._devices.get(serial)
+
+    def devices(self, filters=None):
+        """
+        Return the snapshots that match every filter, sorted by hostname and address.
+
+        Args:
+            filters (dict, optional): Field -> value. A value with '*' or '?' is a shell-style pattern.
+
+        Returns:
+            list: The matching device dictionaries.
+        """
+        with self._lock:
+            snapshots = list(self._devices.values())
+        for field, value in (filters or {}).items():
+            if any(char in value for char in '*?['):
+                match = re.compile(fnmatch.translate(value)).match
+                snapshots = [device for device in snapshots if match(_to_text(device.get(field)))]
+            else:
+                snapshots = [device for device in snapshots if _to_text(device.get(field)) == value]
+        return sorted(snapshots, key=lambda device: (device.get('hostname') or '', device.get('ip_address') or ''))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._devices)
+
+
+def _to_text(value):
+    return '' if value is None else str(value)
+
+
+class Poller:
+    """
+    Re-poll every device of the inventory once per `interval` seconds, staggered to spread the load.
+
+    Every device is assigned to one of `slots` slots of the interval by a hash of its address, so
+    the fleet is polled in `slots` small collections instead of one burst, and every device keeps
+    its slot from one cycle to the next. The first cycle polls the whole fleet at once, so the API
+    has every device as soon as possible, and every device is polled again in its slot of the next
+    interval, so no device is polled twice within one interval. The inventory is read again when the file changes: new
+    devices are polled right away and removed ones are no longer polled.
+
+    The collections run in this process, so the pooled connections, the API keys and the scheduler
+    (see `scheduler.py`) stay warm between them.
+
+    Args:
+        inventory_path (str): The inventory file (see `inventory.iter_inventory`).
+        state (FleetState): The in-memory state fed with every collected device.
+        interval (float, optional): Seconds between two polls of a device. Defaults to `DAEMON_INTERVAL` (900).
+        slots (int, optional): Stagger slots per interval. Defaults to `DAEMON_SLOTS` (60).
+        release (str, optional): Release notes JSON to enrich the devices with.
+        max_workers (int, optional): Devices processed at the same time. Defaults to `MAX_WORKERS`.
+        max_per_host (int, optional): Simultaneous requests per device. Defaults to `MAX_PER_HOST`.
+    """
+    def __init__(self, inventory_path, state, interval=None, slots=None, release=None, max_workers=None, max_per_host=None):
+        settings = get_daemon_settings()
+        self.inventory_path = inventory_path
+        self.state = state
+        self.interval = interval or settings['interval']
+        self.slots = max(1, slots or settings['slots'])
+        self.release = release
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.scheduler = None
+        self.targets = {}
+        self._inventory_mtime = None
+        # Próximo sondeo de cada equipo y cola ordenada por fecha; las entradas viejas se descartan al salir
+        self._due = {}
+        self._queue = []
+        self.stats = {'polls': 0, 'last_poll_at': None, 'last_poll_devices': 0, 'last_poll_seconds': None}
+
+    def phase(self, address):
+        """
+        Offset of the slot of a device inside the interval, in seconds.
+        """
+        return (zlib.crc32(address.encode('utf-8')) % self.slots) * self.interval / self.slots
+
+    def reload_inventory(self):
+        """
+        Read the inventory again if it changed since the last read.
+
+        Returns:
+            list: The addresses added to the inventory (every address on the first read).
+        """
+        from inventory import iter_inventory
+
+        try:
+            mtime = os.stat(self.inventory_path).st_mtime_ns
+        except OSError as e:
+            error_logger.error("Could not read the inventory %s: %s", self.inventory_path, e)
+            return []
+        if mtime == self._inventory_mtime:
+            return []
+        self._inventory_mtime = mtime
+        targets = {target.ip: target for target in iter_inventory(self.inventory_path)}
+        added = [address for address in targets if address not in self.targets]
+        removed = [address for address in self.targets if address not in targets]
+        for address in removed:
+            self._due.pop(address, None)
+        self.targets = targets
+        info_logger.info(
+            "Inventory %s loaded: %s devices (%s added, %s removed)", self.inventory_path, len(targets), len(added), len(removed)
+        )
+        return added
+
+    def _schedule(self, address, due):
+        self._due[address] = due
+        heapq.heappush(self._queue, (due, address))
+
+    def poll(self, addresses):
+        """
+        Collect the devices now and write them to the fleet state.
+        """
+        from device_data_collector import get_concurrency_settings, process_device_list
+        from scheduler import AdaptiveScheduler, get_scheduler_settings
+
+        targets = [self.targets[address] for address in addresses if address in self.targets]
+        if not targets:
+            return
+        max_workers, max_per_host = get_concurrency_settings(self.max_workers, self.max_per_host)
+        if self.scheduler is None and get_scheduler_settings()['enabled']:
+            self.scheduler = AdaptiveScheduler(max_workers)
+        if self.scheduler is not None:
+            targets = self.scheduler.order(targets)
+        start = time.perf_counter()
+        process_device_list(
+            targets, max_workers, max_per_host, sinks=[self.state], enrich=self._get_enrich(), scheduler=self.scheduler
+        )
+        elapsed = time.perf_counter() - start
+        self.stats.update(polls=self.stats['polls'] + 1, last_poll_at=time.time(), last_poll_devices=len(targets), last_poll_seconds=elapsed)
+        metrics.inc('panos_daemon_polls_total')
+        info_logger.info("Polled %s devices in %.2f s, %s devices in the fleet state", len(targets), elapsed, len(self.state))
+
+    def _get_enrich(self):
+        from cli import get_release_json
+        from preferred_versions import enrich_devices, load_preferred_version_index
+
+        release = get_release_json(self.release)
+        if not release:
+            return None
+        try:
+            # Memoized by path, modification time and size: a new JSON is picked up by the next poll
+            index = load_preferred_version_index(release)
+        except (OSError, ValueError) as e:
+            error_logger.error("Could not load the release notes %s: %s", release, e)
+            return None
+        return lambda device: enrich_devices([device], index)
+
+    def run(self, stop):
+        """
+        Poll until `stop` (a threading.Event) is set.
+        """
+        self.reload_inventory()
+        self.poll(list(self.targets))
+        # The slots start one interval after the first cycle, so no device is polled again too early
+        start = time.monotonic() + self.interval
+        for address in self.targets:
+            self._schedule(address, start + self.phase(address))
+        next_check = time.monotonic() + INVENTORY_CHECK_SECONDS
+        while not stop.is_set():
+            now = time.monotonic()
+            if now >= next_check:
+                for address in self.reload_inventory():
+                    self._schedule(address, now)
+                next_check = now + INVENTORY_CHECK_SECONDS
+            due = []
+            while self._queue and self._queue[0][0] <= now:
+                due_at, address = heapq.heappop(self._queue)
+                # Entries of removed or rescheduled devices are skipped
+                if self._due.get(address) != due_at:
+                    continue
+                due.append(address)
+                # Keep the slot of the device even if a poll took longer than the interval
+                next_due = due_at + self.interval
+                while next_due <= now:
+                    next_due += self.interval
+                self._schedule(address, next_due)
+            if due:
+                self.poll(due)
+                continue
+            wait = next_check - now
+            if self._queue:
+                wait = min(wait, self._queue[0][0] - now)
+            stop.wait(max(0.0, wait))
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """
+    Local JSON API of the daemon:
+
+    - `GET /health`: polling statistics.
+    - `GET /devices`: the devices, filtered by any field (`?status=ok&sw_version=10.2.*`), with
+      `fields`, `limit` and `offset`.
+    - `GET /devices/<serial>`: one device.
+    - `GET /report?format=xlsx|jsonl`: the report of the (filtered) devices, built on demand.
+    - `GET /metrics`: the metrics in the Prometheus text format.
+    """
+    server_version = 'PanOSDaemon/1.0'
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/') or '/'
+        try:
+            if path == '/health':
+                self.send_json(200, self.health())
+            elif path == '/devices':
+                self.send_json(200, self.list_devices(params))
+            elif path.startswith('/devices/'):
+                device = self.server.state.get(path[len('/devices/'):])
+                if device is None:
+                    self.send_json(404, {'error': 'device not found'})
+                else:
+                    self.send_json(200, device)
+            elif path == '/report':
+                self.send_report(params)
+            elif path == '/metrics':
+                self.send_body(200, metrics.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4')
+            else:
+                self.send_json(404, {'error': 'not found'})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            error_logger.error("Error answering %s: %s", self.path, e)
+            self.send_json(500, {'error': 'internal error'})
+
+    def health(self):
+        poller = self.server.poller
+        return {
+            'status': 'ok', 'devices': len(self.server.state), 'inventory': poller.inventory_path,
+            'targets': len(poller.targets), 'interval': poller.interval, 'slots': poller.slots, **poller.stats
+        }
+
+    def list_devices(self, params):
+        devices = self.server.state.devices(_get_filters(params))
+        offset = int(params.get('offset') or 0)
+        limit = int(params['limit']) if params.get('limit') else None
+        page = devices[offset:offset + limit if limit is not None else None]
+        if params.get('fields'):
+            fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+            page = [{field: device.get(field) for field in fields} for device in page]
+        return {'total': len(devices), 'offset': offset, 'devices': page}
+
+    def send_report(self, params):
+        report_format = params.get('format', 'xlsx')
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format: {report_format}")
+        devices = self.server.state.devices(_get_filters(params))
+        if report_format == 'jsonl':
+            body = ''.join(json.dumps(device, ensure_ascii=False, default=str) + '\n' for device in devices).encode('utf-8')
+        else:
+            from dataframes import save_to_excel
+
+            licenses_sheet = params.get('licenses_sheet', '').lower() in ('1', 'true', 'yes')
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'report.xlsx')
+                save_to_excel(devices, path, licenses_sheet)
+                with open(path, 'rb') as file:
+                    body = file.read()
+        filename = time.strftime(f'devices_%Y%m%d_%H%M%S.{report_format}')
+        self.send_body(200, body, REPORT_FORMATS[report_format], {'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    def send_json(self, status, payload):
+        self.send_body(status, json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8'), 'application/json')
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        info_logger.info("API %s - %s", self.address_string(), format % args)
+
+
+def _get_filters(params):
+    return {name: value for name, value in params.items() if name not in RESERVED_PARAMS}
+
+
+class DaemonServer(ThreadingHTTPServer):
+    """
+    The API server, with the fleet state and the poller it reports on.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, state, poller):
+        self.state = state
+        self.poller = poller
+        super().__init__(address, DaemonRequestHandler)
+
+
+def run_daemon(inventory_path, interval=None, slots=None, host=None, port=None, release=None, max_workers=None, max_per_host=None):
+    """
+    Serve the API and poll the fleet until SIGINT or SIGTERM.
+
+    Args:
+        inventory_path (str): The inventory file.
+        interval (float, optional): Seconds between two polls of a device. Defaults to `DAEMON_INTERVAL`.
+        slots (int, optional): Stagger slots per interval. Defaults to `DAEMON_SLOTS`.
+        host (str, optional): Address of the API. Defaults to `DAEMON_HOST` (127.0.0.1).
+        port (int, optional): Port of the API. Defaults to `DAEMON_PORT` (8787).
+        release (str, optional): Release notes JSON. Defaults to the most recent JSON in `source/json`.
+        max_workers (int, optional): Devices processed at the same time. Defaults to `MAX_WORKERS`.
+        max_per_host (int, optional): Simultaneous requests per device. Defaults to `MAX_PER_HOST`.
+    """
+    from http_client import close_session
+    from metrics import export_metrics
+
+    settings = get_daemon_settings()
+    state = FleetState()
+    poller = Poller(inventory_path, state, interval, slots, release, max_workers, max_per_host)
+    server = DaemonServer((host or settings['host'], port or settings['port']), state, poller)
+    server_thread = threading.Thread(target=server.serve_forever, name='daemon-api', daemon=True)
+    server_thread.start()
+    info_logger.info("Daemon API listening on http://%s:%s", *server.server_address[:2])
+    print(f"API listening on http://{server.server_address[0]}:{server.server_address[1]}", flush=True)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    try:
+        poller.run(stop)
+    finally:
+        server.shutdown()
+        server.server_close()
+        close_session()
+        export_metrics()
+        info_logger.info("Daemon stopped after %s polls", poller.stats['polls'])
+
+
+if __name__ == '__main__':
+    # Same arguments as `python cli.py daemon`
+    from cli import main
+
+    sys.exit(main(['daemon', *sys.argv[1:]]))
@@ -1,49 +1,209 @@
-import pandas as pd
+# Importaciones de bibliotecas estándar de Python
+from bisect import bisect_right
+from collections import Counter
+
+# Importaciones locales
+from inventory import iter_inventory
 from logger import info_logger, error_logger
 
+# Columnas que identifican al dispositivo en la hoja de licencias
+LICENSE_SHEET_DEVICE_COLUMNS = ('serial', 'hostname', 'ip_address')
+LICENSE_FIELDS = ('feature', 'issued', 'expired')
+
 def read_from_csv(csv_file_path):
-    # Leer el archivo CSV
-    df = pd.read_csv(csv_file_path)
+    """
+    Read the IP addresses of the inventory, without duplicates and in file order.
+
+    The inventory is read by `inventory.iter_inventory`, so the CIDR and address ranges
+    are expanded. Use `iter_inventory` directly to stream a large inventory.
+
+    Args:
+        csv_file_path (str): The path of the CSV file, with the IPs in a column named 'ip'.
+
+    Returns:
+        list: The unique IP addresses.
+    """
+    return [target.ip for target in iter_inventory(csv_file_path)]
+
+def flatten_dict(data, parent_key='', sep='_'):
+    """
+    Flatten a nested dictionary the same way `pd.json_normalize` does: the nested
+    keys are placed after the plain ones.
+
+    Args:
+        data (dict): The dictionary to flatten.
+        parent_key (str, optional): The prefix of the keys. Defaults to ''.
+        sep (str, optional): The separator between nested keys. Defaults to '_'.
+
+    Returns:
+        dict: The flattened dictionary.
+    """
+    flat = {}
+    nested = {}
+    for key, value in data.items():
+        full_key = f'{parent_key}{sep}{key}' if parent_key else key
+        if isinstance(value, dict):
+            nested.update(flatten_dict(value, full_key, sep))
+        else:
+            flat[full_key] = value
+    flat.update(nested)
+    return flat
+
+def iter_device_dicts(devices):
+    """
+    Yield every device as a dictionary with the shape of `Device.to_dict`.
+
+    Args:
+        devices (list or FleetTable): Device objects, device dictionaries or a FleetTable.
+    """
+    if hasattr(devices, 'iter_dicts'):
+        yield from devices.iter_dicts()
+        return
+    for device in devices:
+        yield device if isinstance(device, dict) else device.to_dict()
+
+def _table_report_columns(table):
+    # Same order as flatten_dict: the data_fetched_at_* columns go after the plain ones
+    columns = table.columns()
+    nested = [name for name in columns if name.startswith('data_fetched_at_')]
+    plain = {name: values for name, values in columns.items() if name not in nested}
+    plain.update((name, columns[name]) for name in nested)
+    return plain
 
-    # Asumimos que las IPs están en una columna llamada 'ip'
-    ips = df['ip'].tolist()
+def _iter_license_ranges(table):
+    # The licenses of a device are contiguous in the child table, in device order
+    device_index = table.license_device_index
+    start = 0
+    for index in range(len(table)):
+        end = bisect_right(device_index, index, start)
+        yield start, end
+        start = end
 
-    # Utilizamos pandas para eliminar duplicados mientras mantenemos el orden
-    unique_ips_list = pd.Series(ips).drop_duplicates().tolist()
+def get_report_columns(devices):
+    """
+    Get the columns of the wide report: the device columns followed by `license_{i}_*` columns.
+
+    Args:
+        devices (list or FleetTable): The devices of the report.
 
-    return unique_ips_list
+    Returns:
+        tuple: A tuple (device_columns, max_licenses).
+    """
+    if hasattr(devices, 'text_columns'):
+        counts = Counter(devices.license_device_index)
+        return list(_table_report_columns(devices)), max(counts.values(), default=0)
+    device_columns = {}
+    max_licenses = 0
+    for device_dict in iter_device_dicts(devices):
+        for column in flatten_dict({k: v for k, v in device_dict.items() if k != 'licenses'}):
+            device_columns.setdefault(column, None)
+        max_licenses = max(max_licenses, len(device_dict.get('licenses') or ()))
+    return list(device_columns), max_licenses
 
-def save_to_excel(devices, filename='output.xlsx'):
+def iter_report_rows(devices, device_columns, max_licenses):
+    """
+    Yield the rows of the wide report, one list of values per device.
+
+    A FleetTable is read column by column, without building a dictionary per device.
+
+    Args:
+        devices (list or FleetTable): The devices of the report.
+        device_columns (list): The device columns, see `get_report_columns`.
+        max_licenses (int): The number of license column groups.
+    """
+    if hasattr(devices, 'text_columns'):
+        columns = _table_report_columns(devices)
+        licenses = devices.license_columns()
+        license_values = [licenses[field] for field in LICENSE_FIELDS]
+        empty = [None] * len(devices)
+        rows = zip(*(columns.get(column, empty) for column in device_columns))
+        for row, (start, end) in zip(rows, _iter_license_ranges(devices)):
+            row = list(row)
+            for position in range(start, end):
+                row.extend(values[position] for values in license_values)
+            row.extend([None] * (len(LICENSE_FIELDS) * (max_licenses - (end - start))))
+            yield row
+        return
+    for device_dict in iter_device_dicts(devices):
+        licenses = device_dict.get('licenses') or []
+        flat = flatten_dict({k: v for k, v in device_dict.items() if k != 'licenses'})
+        row = [flat.get(column) for column in device_columns]
+        for license in licenses:
+            row.extend(license.get(field) for field in LICENSE_FIELDS)
+        row.extend([None] * (len(LICENSE_FIELDS) * (max_licenses - len(licenses))))
+        yield row
+
+def iter_license_rows(devices):
+    """
+    Yield the rows of the long-format licenses sheet, one row per license.
+
+    Args:
+        devices (list or FleetTable): The devices of the report.
+    """
+    if hasattr(devices, 'text_columns'):
+        device_values = [devices.text_columns[column] for column in LICENSE_SHEET_DEVICE_COLUMNS]
+        licenses = devices.license_columns()
+        license_values = [licenses[field] for field in LICENSE_FIELDS]
+        for position, index in enumerate(licenses['device_index']):
+            yield [values[index] for values in device_values] + [values[position] for values in license_values]
+        return
+    for device_dict in iter_device_dicts(devices):
+        device_values = [device_dict.get(column) for column in LICENSE_SHEET_DEVICE_COLUMNS]
+        for license in device_dict.get('licenses') or []:
+            yield device_values + [license.get(field) for field in LICENSE_FIELDS]
+
+def save_to_excel(devices, filename='output.xlsx', licenses_sheet=False, compliance_sheets=False, index=None, sites=None):
     """
     Save device information to an Excel file.
 
+    The rows are produced once per device and written through openpyxl's write-only
+    (streaming) workbook, so time is linear in the number of devices and licenses and
+    the workbook is never held in memory.
+
     Args:
-        devices (list): A list of device objects.
+        devices (list or FleetTable): A list of device objects (or device dictionaries) or a FleetTable.
         filename (str, optional): The name of the output Excel file. Defaults to 'output.xlsx'.
+        licenses_sheet (bool, optional): Also write a 'licenses' sheet in long format. Defaults to False.
+        compliance_sheets (bool, optional): Also write the compliance summaries of `analytics.py`. Defaults to False.
+        index (dict, optional): The preferred version index used by the compliance summaries.
+        sites (dict, optional): The site of every address, see `analytics.load_sites`.
     """
-    
-    all_data = []
+    # openpyxl is only needed when a report is written
+    from openpyxl import Workbook
 
-    for device in devices:
-        device_dict = device.to_dict()
-        licenses = device_dict.pop('licenses')
-        
-        device_df = pd.json_normalize(device_dict, sep='_')
-        
-        for i, license in enumerate(licenses):
-            license_df = pd.json_normalize(license, sep='_')
-            license_df.columns = [f'license_{i}_{col}' for col in license_df.columns]
-            device_df = pd.concat([device_df, license_df], axis=1)
-        
-        all_data.append(device_df)
+    # The columns are computed in a first pass, so a one-shot iterator must be materialized
+    if not hasattr(devices, 'text_columns') and iter(devices) is devices:
+        devices = list(devices)
 
     try:
-        # Combine all individual DataFrames into one
-        final_df = pd.concat(all_data, ignore_index=True)
+        device_columns, max_licenses = get_report_columns(devices)
+        license_columns = [f'license_{i}_{field}' for i in range(max_licenses) for field in LICENSE_FIELDS]
+
+        workbook = Workbook(write_only=True)
+        # Same sheet name as pandas.DataFrame.to_excel
+        sheet = workbook.create_sheet('Sheet1')
+        sheet.append(device_columns + license_columns)
+        for row in iter_report_rows(devices, device_columns, max_licenses):
+            sheet.append(row)
+
+        if licenses_sheet:
+            sheet = workbook.create_sheet('licenses')
+            sheet.append(list(LICENSE_SHEET_DEVICE_COLUMNS) + list(LICENSE_FIELDS))
+            for row in iter_license_rows(devices):
+                sheet.append(row)
+
+        if compliance_sheets:
+            # pandas is only imported when the summaries are written
+            from analytics import build_compliance_sheets, build_fleet_frame, iter_frame_rows
+
+            summaries = build_compliance_sheets(build_fleet_frame(devices, index, sites))
+            for name, summary in summaries.items():
+                sheet = workbook.create_sheet(name)
+                for row in iter_frame_rows(summary):
+                    sheet.append(row)
 
-        # Save the combined DataFrame to Excel
-        final_df.to_excel(filename, index=False)
+        workbook.save(filename)
         # Log the information
-        info_logger.info(f"All devices information saved to {filename}")
+        info_logger.info("All devices information saved to %s", filename)
     except Exception as e:
-        error_logger.error(f"Error saving device information to Excel: {e}")
+        error_logger.error("Error saving device information to Excel: %s", e)
@@ -0,0 +1,369 @@
+# Importaciones de bibliotecas estándar de Python
+import glob
+import itertools
+import json
+import os
+import tempfile
+
+# Importaciones locales
+from history_store import HistoryStore, get_history_path, to_iso_date
+from logger import info_logger, error_logger
+from metrics import metrics
+from models import STATUS_OK
+from preferred_versions import UP_TO_DATE_MESSAGE
+from sinks import JsonlReader, ParquetReader
+
+# Tipos de cambio del reporte delta
+DEVICE_ADDED = 'device_added'
+DEVICE_MISSING = 'device_missing'
+SOFTWARE_VERSION = 'software_version'
+CONTENT_VERSION = 'content_version'
+ATTRIBUTE = 'attribute'
+STATUS = 'status'
+LICENSE_ADDED = 'license_added'
+LICENSE_REMOVED = 'license_removed'
+LICENSE_EXPIRED = 'license_expired'
+LICENSE_RENEWED = 'license_renewed'
+PREFERRED_VERSION = 'preferred_version'
+
+SOFTWARE_FIELDS = ('sw_version',)
+CONTENT_FIELDS = ('app_version', 'av_version', 'threat_version', 'wildfire_version', 'url_filtering_version', 'gpc_version')
+ATTRIBUTE_FIELDS = ('hostname', 'model', 'ip_address', 'device_certificate_status')
+IDENTITY_FIELDS = ('serial', 'hostname', 'ip_address')
+
+
+def preferred_version_status(device):
+    """
+    Classify the preferred version of a device: 'up_to_date', 'behind' or 'unknown' (no release data).
+    """
+    preferred = device.get('sw_version_prefered')
+    if preferred is None:
+        return 'unknown'
+    return 'up_to_date' if preferred == UP_TO_DATE_MESSAGE else 'behind'
+
+
+def _change(kind, device, field=None, old=None, new=None):
+    change = {'change': kind, **{key: device.get(key) for key in IDENTITY_FIELDS}}
+    if field is not None:
+        change['field'] = field
+    if old is not None or new is not None:
+        change['old'] = old
+        change['new'] = new
+    return change
+
+
+def _license_key(license):
+    return license.get('feature')
+
+
+def _expired(license):
+    # Device.to_dict gives a bool, the history stores '1'/'0' and the device API answers 'yes'/'no'
+    return str(license.get('expired')).lower() in ('yes', 'true', '1')
+
+
+def _issued(license):
+    # The history stores the dates in ISO 8601 and Device.to_dict as dd/mm/YYYY
+    return to_iso_date(license.get('issued'))
+
+
+def compare_licenses(previous, current):
+    """
+    Compare the licenses of two snapshots of a device, matched by feature.
+
+    Returns:
+        list: Tuples (kind, feature, old, new).
+    """
+    before = {_license_key(license): license for license in previous.get('licenses') or []}
+    after = {_license_key(license): license for license in current.get('licenses') or []}
+    changes = []
+    for feature, license in after.items():
+        old = before.get(feature)
+        if old is None:
+            changes.append((LICENSE_ADDED, feature, None, license))
+            continue
+        old_expired, new_expired = _expired(old), _expired(license)
+        if old_expired != new_expired and new_expired:
+            changes.append((LICENSE_EXPIRED, feature, old, license))
+        elif old_expired != new_expired or _issued(old) != _issued(license):
+            changes.append((LICENSE_RENEWED, feature, old, license))
+    for feature, license in before.items():
+        if feature not in after:
+            changes.append((LICENSE_REMOVED, feature, license, None))
+    return changes
+
+
+def compare_devices(previous, current):
+    """
+    Return the changes between two snapshots of the same device.
+
+    If the device was not collected in one of them (its status is not 'ok'), only the status
+    change is reported, not the empty versions and licenses of the skipped snapshot.
+
+    Args:
+        previous (dict): The previous snapshot (shape of `Device.to_dict`).
+        current (dict): The current snapshot.
+
+    Returns:
+        list: The change records, empty if nothing changed.
+    """
+    changes = []
+    old_status, new_status = previous.get('status') or STATUS_OK, current.get('status') or STATUS_OK
+    if old_status != new_status:
+        changes.append(_change(STATUS, current, 'status', old_status, new_status))
+    if old_status != STATUS_OK or new_status != STATUS_OK:
+        return changes
+
+    for kind, fields in ((SOFTWARE_VERSION, SOFTWARE_FIELDS), (CONTENT_VERSION, CONTENT_FIELDS), (ATTRIBUTE, ATTRIBUTE_FIELDS)):
+        for field in fields:
+            if previous.get(field) != current.get(field):
+                changes.append(_change(kind, current, field, previous.get(field), current.get(field)))
+
+    for kind, feature, old, new in compare_licenses(previous, current):
+        changes.append(_change(kind, current, feature, old, new))
+
+    old_preferred, new_preferred = previous.get('sw_version_prefered'), current.get('sw_version_prefered')
+    if old_preferred != new_preferred:
+        change = _change(PREFERRED_VERSION, current, 'sw_version_prefered', old_preferred, new_preferred)
+        change['old_status'] = preferred_version_status(previous)
+        change['new_status'] = preferred_version_status(current)
+        changes.append(change)
+    return changes
+
+
+class DeltaTracker:
+    """
+    Match the devices of the current run against the previous snapshot of the fleet.
+
+    Devices are matched by serial and, when one of the snapshots has no serial (e.g. an
+    unreachable device), by IP address. Every current device is compared as soon as it is added, so only the previous
+    snapshot is kept in memory (see `HistoryDeltaTracker` to keep it on disk); the devices of the
+    previous snapshot that were never matched are reported as missing at the end.
+
+    Args:
+        previous (iterable): The device dictionaries of the previous snapshot.
+    """
+    def __init__(self, previous):
+        self.previous = list(previous)
+        self.by_serial = {}
+        self.by_ip = {}
+        for position, device in enumerate(self.previous):
+            if device.get('serial'):
+                self.by_serial.setdefault(device['serial'], position)
+            if device.get('ip_address'):
+                self.by_ip.setdefault(device['ip_address'], position)
+        self.matched = set()
+
+    def _match(self, device):
+        serial = device.get('serial')
+        position = self.by_serial.get(serial) if serial else None
+        if position is None:
+            position = self.by_ip.get(device.get('ip_address'))
+            # A device with a serial only takes the place of a previous snapshot without one,
+            # so a replaced unit at the same IP is reported as a new device
+            if position is not None and serial and self.previous[position].get('serial'):
+                position = None
+        if position is None or position in self.matched:
+            return None
+        self.matched.add(position)
+        return self.previous[position]
+
+    def compare(self, device):
+        """
+        Return the changes of a current device against its previous snapshot.
+        """
+        previous = self._match(device)
+        if previous is None:
+            return [_change(DEVICE_ADDED, device)]
+        return compare_devices(previous, device)
+
+    def compare_batch(self, devices):
+        """
+        Return the changes of a batch of current devices.
+        """
+        return [change for device in devices for change in self.compare(device)]
+
+    def missing(self):
+        """
+        Return a `device_missing` change for every previous device that was not matched.
+        """
+        return [
+            _change(DEVICE_MISSING, device) for position, device in enumerate(self.previous)
+            if position not in self.matched
+        ]
+
+    def close(self):
+        """
+        Release the previous snapshot.
+        """
+        self.previous = []
+
+
+class HistoryDeltaTracker(DeltaTracker):
+    """
+    A `DeltaTracker` that looks up the previous snapshot of every device in a run of the history
+    (see `HistoryStore.find_run_snapshot`) instead of loading the run, with the same matching rules.
+
+    The matched snapshots are marked in the database too and the missing ones are streamed from
+    it, so memory does not grow with the size of the fleet.
+
+    Args:
+        store (HistoryStore): The history with the previous run.
+        run_id (int): The previous run.
+        temporary (bool, optional): Delete the database when the tracker is closed. Defaults to False.
+    """
+    def __init__(self, store, run_id, temporary=False):
+        self.store = store
+        self.run_id = run_id
+        self.temporary = temporary
+
+    def _match(self, device):
+        serial = device.get('serial')
+        found = self.store.find_run_snapshot(self.run_id, 'serial', serial) if serial else None
+        if found is None and device.get('ip_address'):
+            found = self.store.find_run_snapshot(self.run_id, 'ip_address', device['ip_address'])
+            # A device with a serial only takes the place of a previous snapshot without one
+            if found is not None and serial and found[1].get('serial'):
+                found = None
+        if found is None or not self.store.mark_matched(found[0]):
+            return None
+        return found[1]
+
+    def compare_batch(self, devices):
+        """
+        Return the changes of a batch of current devices, marking their previous snapshots in a single transaction.
+        """
+        with self.store.connection:
+            return super().compare_batch(devices)
+
+    def missing(self):
+        """
+        Yield a `device_missing` change for every previous device that was not matched.
+        """
+        for device in self.store.iter_unmatched_snapshots(self.run_id, IDENTITY_FIELDS):
+            yield _change(DEVICE_MISSING, device)
+
+    def close(self):
+        """
+        Close the history (and delete it if it was built only for this comparison).
+        """
+        self.store.close()
+        if self.temporary:
+            os.remove(self.store.path)
+
+
+def compute_delta(previous, current):
+    """
+    Return the change set between two snapshots of the fleet.
+
+    Args:
+        previous (iterable): The device dictionaries of the previous snapshot.
+        current (iterable): The device dictionaries (or Device objects) of the current snapshot.
+
+    Returns:
+        list: The change records.
+    """
+    tracker = DeltaTracker(previous)
+    changes = []
+    for device in current:
+        changes.extend(tracker.compare(device if isinstance(device, dict) else device.to_dict()))
+    changes.extend(tracker.missing())
+    return changes
+
+
+def summarize_changes(changes):
+    """
+    Count the changes of every kind.
+    """
+    summary = {}
+    for change in changes:
+        summary[change['change']] = summary.get(change['change'], 0) + 1
+    return summary
+
+
+def find_previous_jsonl(output_dir, before_name):
+    """
+    Return the most recent `devices_*.jsonl` of `output_dir` whose name sorts before `before_name`, or None.
+    """
+    candidates = [
+        path for path in glob.glob(os.path.join(output_dir, 'devices_*.jsonl'))
+        if os.path.basename(path) < before_name and not path.endswith('_report.jsonl') and not path.endswith('_enriched.jsonl')
+    ]
+    return max(candidates, default=None)
+
+
+def open_previous_snapshot(output_dir, before_name, history_path=None, batch_size=1000):
+    """
+    Open the previous snapshot of the fleet for a comparison: the last finished run of the
+    history, or else the most recent JSONL output written before the current run.
+
+    The snapshot is never loaded whole: the history is queried device by device, and a JSONL
+    output is first copied, `batch_size` devices at a time, to a temporary history database.
+
+    Args:
+        output_dir (str): The output directory of the sinks.
+        before_name (str): Name of the current JSONL output ('devices_<timestamp>.jsonl').
+        history_path (str, optional): The history database. Defaults to `get_history_path(output_dir)`.
+        batch_size (int, optional): Devices copied per transaction from a JSONL output. Defaults to 1000.
+
+    Returns:
+        tuple: A tuple (source, tracker) with a description of the snapshot and a `DeltaTracker`
+        for it (an empty one if there is no previous snapshot). The tracker must be closed.
+    """
+    history_path = history_path or get_history_path(output_dir)
+    if os.path.exists(history_path):
+        store = HistoryStore(history_path)
+        run = store.latest_run()
+        if run is not None:
+            return f"history run {run['id']} ({run['started_at']})", HistoryDeltaTracker(store, run['id'])
+        store.close()
+
+    previous_jsonl = find_previous_jsonl(output_dir, before_name)
+    if previous_jsonl:
+        file, path = tempfile.mkstemp(prefix='delta_previous_', suffix='.sqlite')
+        os.close(file)
+        store = HistoryStore(path)
+        run_id, collected_at = store.start_run()
+        devices = iter(JsonlReader(previous_jsonl))
+        while True:
+            batch = list(itertools.islice(devices, batch_size))
+            if not batch:
+                break
+            store.add_snapshots(run_id, collected_at, batch)
+        return previous_jsonl, HistoryDeltaTracker(store, run_id, temporary=True)
+    return None, DeltaTracker([])
+
+
+def write_changes(changes, file):
+    file.write(''.join(json.dumps(change, ensure_ascii=False, default=str) + '\n' for change in changes))
+
+
+def log_summary(summary, source, path):
+    for kind, count in summary.items():
+        metrics.inc('panos_delta_changes_total', count, change=kind)
+    if summary:
+        details = ', '.join(f'{count} {kind}' for kind, count in sorted(summary.items()))
+        info_logger.info("Changes since %s written to %s: %s", source or 'the first run', path, details)
+    else:
+        info_logger.info("No changes since %s", source or 'the first run')
+
+
+def write_delta_report(previous_path, current_path, output_path):
+    """
+    Compare two JSONL (or Parquet) outputs and write the change set to `output_path`.
+
+    Returns:
+        dict: The number of changes of every kind, or None if the files could not be read or written.
+    """
+    def reader(path):
+        return ParquetReader(path) if path.endswith('.parquet') else JsonlReader(path)
+
+    try:
+        changes = compute_delta(reader(previous_path), reader(current_path))
+        with open(output_path, 'w', encoding='utf-8') as file:
+            write_changes(changes, file)
+    except OSError as e:
+        error_logger.error("Could not write the delta report %s: %s", output_path, e)
+        return None
+    summary = summarize_changes(changes)
+    log_summary(summary, previous_path, output_path)
+    return summary
@@ -1,22 +1,107 @@
 # Importaciones de bibliotecas estándar de Python
+import collections
+import itertools
 import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from xml.etree.ElementTree import ParseError
 
 # Importaciones de bibliotecas externas
 import requests
-import urllib3
-import xmltodict
 from dotenv import load_dotenv
 
 # Importaciones locales
-from dataframes import read_from_csv
-from models import Device
-from logger import info_logger, error_logger
+from http_client import circuit_breaker, log_connection_stats, post
+from inventory import get_credentials, iter_inventory, target_address
+from key_cache import get_key_cache
+from metrics import MeteredChunks, metrics, uri_label
+from reachability import filter_reachable, get_probe_settings
+from result_cache import get_result_cache, get_uri_ttls
+from scheduler import AdaptiveScheduler, get_scheduler_settings
+from xml_parser import CHUNK_SIZE, KEYGEN_URI, get_field_spec, parse_selected_fields
+from models import STATUS_CIRCUIT_OPEN, STATUS_OK, STATUS_UNREACHABLE, Device
+from logger import configure_logging, info_logger, error_logger
 
 # Load the environment variables
 load_dotenv()
 
-# Deshabilitar la advertencia de solicitud HTTPS no verificada
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# Valores por defecto de concurrencia (se pueden sobreescribir en el .env)
+DEFAULT_MAX_WORKERS = 10
+DEFAULT_MAX_PER_HOST = 3
+
+def get_concurrency_settings(max_workers=None, max_per_host=None):
+    """
+    Resolve the concurrency settings for the collection engine.
+
+    Explicit arguments take precedence over the `MAX_WORKERS` and `MAX_PER_HOST`
+    environment variables, which in turn take precedence over the defaults.
+
+    Args:
+        max_workers (int, optional): Number of devices processed at the same time.
+        max_per_host (int, optional): Number of simultaneous requests sent to a single device.
+
+    Returns:
+        tuple: A tuple (max_workers, max_per_host) with both values being at least 1.
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv('MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    if max_per_host is None:
+        max_per_host = int(os.getenv('MAX_PER_HOST', DEFAULT_MAX_PER_HOST))
+    return max(1, max_workers), max(1, max_per_host)
+
+# Esquema de las URLs de la API (http sólo tiene sentido contra el simulador local)
+DEFAULT_API_SCHEME = 'https'
+
+# Códigos con los que PAN-OS rechaza credenciales o API keys inválidas
+AUTH_ERROR_HTTP_STATUS = (401, 403)
+AUTH_ERROR_RESPONSE_CODES = ('403',)
+
+
+class AuthenticationError(Exception):
+    """
+    Raised when a device rejects the credentials or the API key of a request.
+    """
+
+
+class MissingCredentialsError(Exception):
+    """
+    Raised when the default credentials (`USER_IP` and `PASSWORD_IP`) are not set.
+    """
+
+
+def get_default_credentials():
+    """
+    Return the default device credentials from the `USER_IP` and `PASSWORD_IP` environment variables.
+
+    Check them before opening the outputs, so a misconfigured run does not touch them.
+
+    Returns:
+        tuple: A tuple (user, password).
+
+    Raises:
+        MissingCredentialsError: If one of the variables is not set.
+    """
+    user_ip = os.getenv('USER_IP')
+    password_ip = os.getenv('PASSWORD_IP')
+    if not user_ip or not password_ip:
+        raise MissingCredentialsError("USER_IP or PASSWORD_IP not set in environment variables.")
+    return user_ip, password_ip
+
+
+def is_auth_error(result_dict):
+    """
+    Check if the response in the result dictionary is an authentication error.
+
+    Args:
+        result_dict (dict): The dictionary containing the response.
+
+    Returns:
+        bool: True if the device rejected the credentials or the API key, False otherwise.
+    """
+    response = result_dict.get('response') or {}
+    return response.get('@status') == 'error' and response.get('@code') in AUTH_ERROR_RESPONSE_CODES
 
 def check_response(result_dict):
     """
@@ -63,9 +148,14 @@ def generate_api_key(ip, user_ip, password_ip):
     """
     uri = f"/api/?type=keygen&user={user_ip}&password={password_ip}"
     full_url = get_full_url(ip, uri)
-    result_dict = send_get_request_and_parse_response(full_url)
+    try:
+        with metrics.timer('panos_keygen_seconds', ip):
+            result_dict = send_get_request_and_parse_response(full_url, KEYGEN_URI)
+    except AuthenticationError:
+        error_logger.error("Invalid credentials for %s", ip, extra={'device': ip, 'status': 'auth_failed'})
+        return None
     if result_dict:
-        info_logger.info(f"API key successfully generated for {ip}")
+        info_logger.info("API key successfully generated for %s", ip)
         return get_api_key(result_dict)
     return None
 
@@ -74,40 +164,81 @@ def get_full_url(ip, uri, api_key=None):
     Construct the full URL based on the IP, URI, and API key.
 
     Parameters:
-    ip (str): The IP address of the device.
+    ip (str): The IP address of the device, optionally followed by ':port'.
     uri (str): The URI path for the API request.
     api_key (str, optional): The API key for authentication. Defaults to None.
 
     Returns:
-    str: The full URL constructed based on the provided parameters.
+    str: The full URL constructed based on the provided parameters. The scheme is taken from
+    the `API_SCHEME` environment variable (https by default).
     """
+    scheme = os.getenv('API_SCHEME', DEFAULT_API_SCHEME)
     if api_key is None:
-        return f'https://{ip}{uri}'
-    return f"https://{ip}/api/?type=op&cmd={uri}&key={api_key}"
+        return f'{scheme}://{ip}{uri}'
+    return f"{scheme}://{ip}/api/?type=op&cmd={uri}&key={api_key}"
     
-def send_get_request_and_parse_response(url):
+def send_get_request_and_parse_response(url, uri=None):
     """
-    Sends a GET request to the specified URL and returns the parsed XML response as a dictionary.
+    Sends a request to the specified URL through the shared pooled session and returns
+    the parsed XML response as a dictionary.
+
+    If the URI has a declarative field specification (see `xml_parser.XML_FIELD_MAP`) the
+    response bytes are parsed incrementally and only the declared fields are kept. Unknown
+    URIs fall back to the full xmltodict tree.
 
     Args:
         url (str): The URL to send the GET request to.
+        uri (str, optional): The URI (command) of the request, used to select the fields to parse.
 
     Returns:
         dict: The parsed XML response as a dictionary, or None if the request failed.
 
     Raises:
-        requests.exceptions.RequestException: If the GET request fails.
+        AuthenticationError: If the device rejected the credentials or the API key.
 
     """
-    
+    spec = get_field_spec(uri)
+    # Labels of the request metrics: the short name of the URI and the device as exemplar
+    label = uri_label(uri)
+    host = urlsplit(url).netloc
+    start = time.perf_counter()
     try:
-        response = requests.post(url, verify=False, timeout=10)
-        response.raise_for_status()
-        result_dict = xmltodict.parse(response.text)
+        with post(url, stream=True) as response:
+            if response.status_code in AUTH_ERROR_HTTP_STATUS:
+                raise AuthenticationError(f"HTTP {response.status_code}")
+            response.raise_for_status()
+            chunks = MeteredChunks(response.iter_content(CHUNK_SIZE))
+            if spec:
+                # The XML is parsed while it is received: the parse time excludes the wait for the chunks
+                parse_start = time.perf_counter()
+                result_dict = parse_selected_fields(chunks, spec)
+                parse_seconds = time.perf_counter() - parse_start - chunks.wait_seconds
+            else:
+                # xmltodict is only imported for the URIs without a field specification
+                import xmltodict
+
+                body = b''.join(chunks)
+                parse_start = time.perf_counter()
+                # The raw bytes let expat take the encoding from the XML declaration
+                result_dict = xmltodict.parse(body)
+                parse_seconds = time.perf_counter() - parse_start
+        metrics.observe('panos_request_seconds', time.perf_counter() - start - parse_seconds, host, uri=label)
+        metrics.observe('panos_response_bytes', chunks.bytes, host, uri=label)
+        metrics.observe('panos_xml_parse_seconds', parse_seconds, host, uri=label)
         if check_response(result_dict):
             return result_dict
+        metrics.inc('panos_request_errors_total', uri=label)
+        if is_auth_error(result_dict):
+            raise AuthenticationError(f"code {result_dict['response'].get('@code')}")
+    except AuthenticationError:
+        metrics.inc('panos_request_errors_total', uri=label)
+        raise
     except requests.exceptions.RequestException as e:
-        error_logger.error(f"Request failed -> {url}: {e}")
+        metrics.inc('panos_request_errors_total', uri=label)
+        error_logger.error("Request failed -> %s: %s", url, e)
+    except ParseError as e:
+        metrics.inc('panos_request_errors_total', uri=label)
+        error_logger.error("Invalid XML response -> %s: %s", url, e)
     return None
 
 def create_device_from_info(info):
@@ -147,6 +278,29 @@ def create_device_from_info(info):
                         new_device.add_license(license.get('feature'), license.get('issued'), license.get('expired'))
     return new_device
 
+def get_uris():
+    """
+    Get the list of URIs (commands) from the `URIS` environment variable.
+
+    Returns:
+        list: The list of URIs.
+    """
+    return os.getenv('URIS').split('|')
+
+def get_fresh_cached_results(ip):
+    """
+    Get the cached results of a device that are still inside the freshness window of their URI.
+
+    Args:
+        ip (str): The IP address of the device.
+
+    Returns:
+        dict: A dictionary mapping every URI to its fresh cache entry, or None if it must be requested.
+    """
+    result_cache = get_result_cache()
+    uri_ttls = get_uri_ttls(get_uris())
+    return {uri: result_cache.get(ip, uri, ttl) for uri, ttl in uri_ttls.items()}
+
 def generate_full_paths(ip, api_key):
     """
     Generate full paths for the given IP address and API key.
@@ -159,7 +313,7 @@ def generate_full_paths(ip, api_key):
         list: A list of tuples containing the full URL and corresponding URI.
     """
     # Get the URIs from the environment variables
-    list_uris = os.getenv('URIS').split('|')
+    list_uris = get_uris()
     # Create a list to store the full paths
     list_uri_full_path = []
     # Iterate over the list of URIs and generate the full paths
@@ -170,93 +324,434 @@ def generate_full_paths(ip, api_key):
         list_uri_full_path.append((uri, full_url))
     return list_uri_full_path
 
-def retrieve_data_from_multiple_uris(ip, api_key):
-    # Generate the full paths
-    list_full_uri_paths = generate_full_paths(ip, api_key)
-    # List to store all the data retrieved from the device
+def retrieve_data_from_uri(ip, uri, uri_path):
+    """
+    Retrieve the result section of a single URI from a device.
+
+    Args:
+        ip (str): The IP address of the device.
+        uri (str): The URI (command) requested.
+        uri_path (str): The full URL of the request.
+
+    Returns:
+        dict or None: The 'result' section of the response, or None if there is no data.
+    """
+    # Get the response from the URI path
+    start = time.perf_counter()
+    result_dict = send_get_request_and_parse_response(uri_path, uri)
+    latency = time.perf_counter() - start
+    # If the response is successful, extract the information
+    if result_dict:
+        fields = {'device': ip, 'uri': uri_label(uri), 'latency': round(latency, 4)}
+        info = result_dict['response'].get('result')
+        if info:
+            info_logger.info("Data retrieved (%s) from %s in %.3f s", ip, uri, latency, extra=fields)
+            return info
+        error_logger.error("No data retrieved (%s) from %s", ip, uri, extra=fields)
+    return None
+
+def retrieve_data_from_multiple_uris(ip, api_key, max_per_host=1, fetched_at=None, cached_results=None):
+    """
+    Retrieve the information of every URI for a device.
+
+    URIs with a fresh entry in the result cache are served from it and only the stale
+    ones are requested to the device, concurrently (up to `max_per_host` at the same time).
+    The returned list keeps the order of the URIs in the environment variable.
+
+    Args:
+        ip (str): The IP address of the device.
+        api_key (str): The API key of the device. Only used for the stale URIs.
+        max_per_host (int, optional): Maximum number of simultaneous requests to the device. Defaults to 1.
+        fetched_at (dict, optional): If given, it is filled with the section name of every result
+            mapped to a tuple (timestamp, from_cache).
+        cached_results (dict, optional): The fresh cache entries returned by `get_fresh_cached_results`.
+            Pass the snapshot used to decide whether an API key was needed, so an entry that expires
+            in between is not left without a key to request it. Defaults to a new snapshot.
+
+    Returns:
+        list: A list with the 'result' section of every successful response.
+    """
+    # Get the results that can be served from the cache
+    if cached_results is None:
+        cached_results = get_fresh_cached_results(ip)
+    # Generate the full paths of the URIs that must be requested
+    list_full_uri_paths = []
+    if api_key:
+        list_full_uri_paths = [path for path in generate_full_paths(ip, api_key) if not cached_results.get(path[0])]
+    # Sin concurrencia no tiene sentido crear un pool de hilos
+    if max_per_host <= 1 or len(list_full_uri_paths) <= 1:
+        results = [retrieve_data_from_uri(ip, uri, uri_path) for uri, uri_path in list_full_uri_paths]
+    else:
+        workers = min(max_per_host, len(list_full_uri_paths))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map keeps the results in the same order as the URIs
+            results = list(executor.map(lambda path: retrieve_data_from_uri(ip, *path), list_full_uri_paths))
+    requested_results = {uri: info for (uri, _), info in zip(list_full_uri_paths, results)}
+
+    # Store the new results of the URIs that have a freshness window
+    now = time.time()
+    result_cache = get_result_cache()
+    uri_ttls = get_uri_ttls(get_uris())
+    for uri, info in requested_results.items():
+        if info and uri_ttls.get(uri, 0) > 0:
+            result_cache.set(ip, uri, info, now)
+
+    # List to store all the data retrieved from the device, in the order of the URIs
     data_total = []
-    # Iterate over the list of URIs and retrieve the information
-    for uri, uri_path in list_full_uri_paths:
-        # Get the response from the URI path
-        result_dict = send_get_request_and_parse_response(uri_path)
-        # If the response is successful, extract the information
-        if result_dict:
-            info = result_dict['response'].get('result')
-            # Append the information to the data_total list
-            if info:
-                info_logger.info(f"Data retrieved from {uri}")
-                data_total.append(info)
-            else:
-                error_logger.error(f"No data retrieved ({ip}) from {uri}")
+    for uri in uri_ttls:
+        entry = cached_results.get(uri)
+        if entry:
+            info, timestamp, from_cache = entry['result'], entry['fetched_at'], True
+            info_logger.info("Data served from cache (%s) for %s", ip, uri, extra={'device': ip, 'uri': uri_label(uri)})
+        else:
+            info, timestamp, from_cache = requested_results.get(uri), now, False
+        if info:
+            data_total.append(info)
+            if fetched_at is not None and isinstance(info, dict):
+                for section in info:
+                    fetched_at[section] = (timestamp, from_cache)
 
     return data_total
 
-def process_device_list(list_ips):
+def get_or_generate_api_key(ip, user_ip, password_ip):
     """
-    Process the device information for a list of IP addresses.
+    Return the cached API key of a device, generating (and caching) a new one if there is none.
 
     Args:
-        list_ips (list): A list of IP addresses.
+        ip (str): The IP address of the device.
+        user_ip (str): The username for authentication.
+        password_ip (str): The password for authentication.
 
     Returns:
-        None
+        tuple: A tuple (api_key, from_cache). api_key is None if it could not be generated.
     """
-    # Retrieve the credentials from the environment variables
-    user_ip = os.getenv('USER_IP')
-    password_ip = os.getenv('PASSWORD_IP')
+    key_cache = get_key_cache()
+    api_key = key_cache.get(ip, user_ip)
+    if api_key:
+        info_logger.info("Using cached API key for %s", ip)
+        return api_key, True
+    api_key = generate_api_key(ip, user_ip, password_ip)
+    key_cache.set(ip, user_ip, api_key)
+    return api_key, False
+
+def process_device(ip, user_ip, password_ip, max_per_host=1):
+    """
+    Generate the API key, retrieve the information and create the Device object of a single device.
 
-    # Check if the credentials are set
-    if not user_ip or not password_ip:
-        error_logger.error("USER_IP or PASSWORD_IP not set in environment variables.")
-        exit()
-    # List to store all the devices objects
-    list_of_devices_obj = []
-    # counter
-    counter = 1
-    # Iterate over the list of IP addresses
-    for ip in list_ips:
-        print(f"Processing device {counter} of {len(list_ips)}")
-        info_logger.info(f"Starting process for: {ip}")       
-        # Generate the API key
-        api_key = generate_api_key(ip, user_ip, password_ip)
-        # If the API key was successfully generated, retrieve the device information
-        if api_key:
-            print(f"API key generated for {ip}")
+    Any unexpected error is logged and isolated, so a failing device never stops the rest of the list.
+    If the circuit of the host opened (see `http_client.CircuitBreaker`) the remaining URIs are
+    skipped and the device is reported with the `circuit_open` status.
+
+    Args:
+        ip (str): The IP address of the device.
+        user_ip (str): The username for authentication.
+        password_ip (str): The password for authentication.
+        max_per_host (int, optional): Maximum number of simultaneous requests to the device. Defaults to 1.
+
+    Returns:
+        Device or None: The new Device object, or None if the device could not be processed.
+    """
+    start = time.perf_counter()
+    new_device = _process_device(ip, user_ip, password_ip, max_per_host)
+    if new_device is None and circuit_breaker.tripped(ip):
+        error_logger.error("%s stopped responding, remaining requests skipped", ip, extra={'device': ip, 'status': STATUS_CIRCUIT_OPEN})
+        new_device = Device.skipped(ip, STATUS_CIRCUIT_OPEN)
+    metrics.observe('panos_device_seconds', time.perf_counter() - start, ip)
+    metrics.inc('panos_devices_total', status=new_device.status if new_device else 'failed')
+    return new_device
+
+def _process_device(ip, user_ip, password_ip, max_per_host):
+    info_logger.info("Starting process for: %s", ip)
+    # Timestamps of every section of the data, to mark the values served from the cache
+    fetched_at = {}
+    try:
+        # A single snapshot of the cache decides which URIs are requested, with or without an API key
+        cached_results = get_fresh_cached_results(ip)
+        # The API key is only needed if some URI is not fresh in the result cache
+        if all(cached_results.values()):
+            info_logger.info("All the data of %s is fresh in the cache", ip)
+            api_key, from_cache = None, True
+        else:
+            # Get the API key from the cache or generate a new one
+            api_key, from_cache = get_or_generate_api_key(ip, user_ip, password_ip)
+            # If the API key was not generated, there is nothing else to do
+            if not api_key:
+                error_logger.error("Failed to generate API key for %s", ip)
+                print(f"API key not generated for {ip}")
+                return None
+            print(f"API key {'loaded from cache' if from_cache else 'generated'} for {ip}")
+        try:
             # List to store all the data retrieved from the device
-            data_total = retrieve_data_from_multiple_uris(ip, api_key)
-            # Process the device information and create a new Device object
+            data_total = retrieve_data_from_multiple_uris(ip, api_key, max_per_host, fetched_at, cached_results)
+        except AuthenticationError:
+            if not from_cache:
+                raise
+            # The cached key is no longer valid (e.g. the password changed): regenerate it once
+            info_logger.info("Cached API key rejected by %s, generating a new one", ip)
+            get_key_cache().invalidate(ip, user_ip)
+            api_key, _ = get_or_generate_api_key(ip, user_ip, password_ip)
+            if not api_key:
+                error_logger.error("Failed to generate API key for %s", ip)
+                return None
+            data_total = retrieve_data_from_multiple_uris(ip, api_key, max_per_host, fetched_at, cached_results)
+        # Process the device information and create a new Device object
+        with metrics.timer('panos_device_build_seconds', ip):
             new_device = create_device_from_info(data_total)
-            # If a new device was created, append it to the devices list
-            if new_device:
-                # Append the new device to the list
-                list_of_devices_obj.append(new_device)
-                info_logger.info(f"Device information processed for {ip}")                
-            else:
-                error_logger.error(f"Failed to process device information for {ip}")
-        else:
-            error_logger.error(f"Failed to generate API key for {ip}")
-            print(f"API key not generated for {ip}")
-        counter += 1
-            
+    except Exception as e:
+        error_logger.error("Unexpected error processing %s: %s", ip, e, extra={'device': ip})
+        return None
+
+    if new_device:
+        new_device.set_data_fetched_at(fetched_at)
+        info_logger.info("Device information processed for %s", ip)
+    else:
+        error_logger.error("Failed to process device information for %s", ip, extra={'device': ip})
+    return new_device
+
+def enrich_device(device, enrich):
+    """
+    Apply an enrichment function to a device, logging (and not raising) its errors.
+    """
+    try:
+        with metrics.timer('panos_enrich_seconds', device.ip_address, stage='device'):
+            enrich(device)
+    except Exception as e:
+        error_logger.error("Error enriching %s: %s", device.ip_address, e)
+
+def write_device_to_sinks(device, sinks=None, enrich=None):
+    """
+    Enrich a completed device and write it to every output sink.
+
+    Errors are logged per sink, so a failing sink never stops the collection.
+
+    Args:
+        device (Device): The completed device.
+        sinks (list, optional): The output sinks.
+        enrich (callable, optional): Function applied to the device before writing it.
+    """
+    if enrich:
+        enrich_device(device, enrich)
+    for sink in sinks or []:
+        try:
+            with metrics.timer('panos_export_seconds', device.ip_address, output=type(sink).__name__, stage='write'):
+                sink.write(device)
+        except Exception as e:
+            error_logger.error("Error writing %s to %s: %s", device.ip_address, sink.path, e)
+
+def probe_unreachable(ips):
+    """
+    Probe the hosts that are not fully served from the cache and return the unreachable ones.
+
+    Args:
+        ips (list): The IP addresses of a batch of targets.
+
+    Returns:
+        set: The IP addresses that did not accept a TCP connection.
+    """
+    unreachable = set()
+    _, probe_results = filter_reachable([ip for ip in ips if not all(get_fresh_cached_results(ip).values())])
+    for ip, probe in probe_results.items():
+        metrics.observe('panos_probe_seconds', probe.elapsed, ip, reachable=str(probe.reachable).lower())
+        if not probe.reachable:
+            unreachable.add(ip)
+    return unreachable
+
+def iter_processed_devices(list_ips, max_workers=None, max_per_host=None, scheduler=None, throttle=None):
+    """
+    Process the devices of an iterable of targets and yield every device as soon as it is finished.
+
+    The devices are processed concurrently by a pool of `max_workers` threads and every
+    device sends up to `max_per_host` simultaneous requests. The targets are read lazily, one
+    batch at a time, and a new batch is read whenever less than a batch is waiting, so an
+    inventory generator (see `inventory.iter_inventory`) starts polling as soon as its first
+    batch is read. The first batch only fills the pool (`max_workers` targets), so the first
+    devices start early, and every next batch doubles up to `COLLECT_BATCH_SIZE` (by default one
+    probe round of `PROBE_CONCURRENCY` targets, and at least two per worker). While the consumer does not ask for the next device no new device is
+    submitted, so a slow consumer holds back the collection instead of piling up results.
+
+    Unless `PROBE_ENABLED` is false, every batch is probed first with a TCP connection to
+    the API port (see `reachability.py`) and the hosts that do not answer are reported with
+    the `unreachable` status without sending any HTTP request.
+
+    With a `scheduler` (see `scheduler.AdaptiveScheduler`) the devices are only submitted up to
+    its current concurrency limit and the duration of every device is reported back to it. The
+    devices are processed in the order of `list_ips`, so order them with `scheduler.order` first.
+    A `throttle` can hold back new devices too (e.g. above a memory ceiling, see `pipeline.py`);
+    it is ignored while no device is in flight, so the collection always makes progress.
+
+    Args:
+        list_ips (iterable): IP addresses or InventoryTarget objects. The targets with a credentials
+            profile use its credentials (see `inventory.get_credentials`).
+        max_workers (int, optional): Number of devices processed at the same time. Defaults to `MAX_WORKERS`.
+        max_per_host (int, optional): Simultaneous requests per device. Defaults to `MAX_PER_HOST`.
+        scheduler (AdaptiveScheduler, optional): Adapts the number of devices processed at the same time.
+        throttle (callable, optional): Returns False to stop submitting devices until one is finished.
+
+    Raises:
+        MissingCredentialsError: If `USER_IP` or `PASSWORD_IP` is not set.
+
+    Yields:
+        tuple: A tuple (position, device) with the position of the target in the input and its
+        Device object, or None if the device could not be processed.
+    """
+    # Retrieve the credentials from the environment variables
+    try:
+        default_credentials = get_default_credentials()
+    except MissingCredentialsError as e:
+        error_logger.error("%s", e)
+        raise
+    # Credentials of every profile, resolved once
+    credentials = {None: default_credentials}
+    # Resolve the concurrency settings
+    max_workers, max_per_host = get_concurrency_settings(max_workers, max_per_host)
+    probe_settings = get_probe_settings()
+    # Targets read at a time: one probe round, and at least two per worker
+    batch_size = int(os.getenv('COLLECT_BATCH_SIZE', 0)) or max(probe_settings['concurrency'], max_workers * 2)
+    # The first batch only fills the pool, the next ones double up to batch_size
+    next_batch_size = min(batch_size, max_workers)
+    # Create the shared caches before the workers start
+    key_cache = get_key_cache()
+    result_cache = get_result_cache()
+    info_logger.info("Processing devices with %s workers and %s requests per device", max_workers, max_per_host)
+    # Targets read and devices successfully processed
+    total = 0
+    processed = 0
+    # counter
+    counter = 1
+    submitted = 0
+    start = time.perf_counter()
+    targets = iter(list_ips)
+    exhausted = False
+    # Reachable devices waiting to be submitted: (position, ip, credentials)
+    pending = collections.deque()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            # The finished futures are queued by their callback, so waiting costs the same with any number pending
+            completed = queue.SimpleQueue()
+            while True:
+                # Read and probe the next batch while less than a batch is waiting to be submitted
+                if not exhausted and len(pending) < batch_size:
+                    batch = list(itertools.islice(targets, next_batch_size))
+                    exhausted = len(batch) < next_batch_size
+                    next_batch_size = min(batch_size, next_batch_size * 2)
+                    ips = [target_address(target) for target in batch]
+                    # Drop the dead hosts before any HTTP work; the ones fully served from the cache are not probed
+                    unreachable = probe_unreachable(ips) if probe_settings['enabled'] and ips else set()
+                    for target, ip in zip(batch, ips):
+                        position = total
+                        total += 1
+                        if ip in unreachable:
+                            metrics.inc('panos_devices_total', status=STATUS_UNREACHABLE)
+                            yield position, Device.skipped(ip, STATUS_UNREACHABLE)
+                            continue
+                        profile = getattr(target, 'profile', None)
+                        if profile not in credentials:
+                            credentials[profile] = get_credentials(profile)
+                        pending.append((position, ip, credentials[profile]))
+                    continue
+                # Submit the pending devices to the pool, remembering their position, up to the concurrency limit
+                limit = scheduler.limit if scheduler is not None else batch_size
+                while pending and len(futures) < limit and (not futures or throttle is None or throttle()):
+                    position, ip, (user, password) = pending.popleft()
+                    future = executor.submit(process_device, ip, user, password, max_per_host)
+                    futures[future] = (position, ip, time.perf_counter())
+                    future.add_done_callback(completed.put)
+                    submitted += 1
+                if not futures:
+                    break
+                # Collect the devices as soon as they are finished
+                future = completed.get()
+                device = future.result()
+                position, ip, submitted_at = futures.pop(future)
+                if scheduler is not None:
+                    scheduler.record(ip, time.perf_counter() - submitted_at, device)
+                if device and device.status == STATUS_OK:
+                    processed += 1
+                print(f"Processed device {counter} of {submitted}")
+                counter += 1
+                yield position, device
+    finally:
+        # Persist the new API keys, results and latencies for the next run
+        key_cache.save()
+        result_cache.save()
+        if scheduler is not None:
+            scheduler.finish()
+    # Log how many TLS handshakes were saved by the pooled session
+    connection_stats = log_connection_stats()
+
+    # Throughput of the run
+    elapsed = time.perf_counter() - start
+    devices_per_second = processed / elapsed if elapsed else 0.0
+    metrics.set_gauge('panos_run_duration_seconds', elapsed)
+    metrics.set_gauge('panos_run_devices', total)
+    metrics.set_gauge('panos_run_devices_per_second', devices_per_second)
+    metrics.set_gauge('panos_http_requests', connection_stats['requests'])
+    metrics.set_gauge('panos_http_connections_opened', connection_stats['connections_opened'])
+    metrics.set_gauge('panos_http_connections_reused', connection_stats['connections_reused'])
+    info_logger.info("%s of %s devices processed in %.1f s (%.2f devices/s)", processed, total, elapsed, devices_per_second)
+
+def process_device_list(list_ips, max_workers=None, max_per_host=None, table=None, sinks=None, enrich=None, scheduler=None):
+    """
+    Process the device information for a list (or any iterable) of targets.
+
+    The devices are collected by `iter_processed_devices` (see its description of the concurrency,
+    the reachability probe and the scheduler) and written to the sinks as soon as they are finished.
+    The returned list keeps the order of the input.
+
+    Args:
+        list_ips (iterable): IP addresses or InventoryTarget objects.
+        max_workers (int, optional): Number of devices processed at the same time. Defaults to `MAX_WORKERS`.
+        max_per_host (int, optional): Simultaneous requests per device. Defaults to `MAX_PER_HOST`.
+        table (FleetTable, optional): If given, every processed device is also appended to it as soon as it
+            is completed, so its rows follow the completion order.
+        sinks (list, optional): Output sinks (see `sinks.py`) that receive every device as soon as it is completed.
+        enrich (callable, optional): Function applied to every device before it is written to the sinks.
+        scheduler (AdaptiveScheduler, optional): Adapts the number of devices processed at the same time.
+
+    Returns:
+        list: A list of Device objects, in the same order as the input targets.
+    """
+    # List to store the results in the same position as the input targets
+    results = []
+    for position, device in iter_processed_devices(list_ips, max_workers, max_per_host, scheduler):
+        if position >= len(results):
+            results.extend([None] * (position + 1 - len(results)))
+        results[position] = device
+        # Write the device to the sinks as soon as it is completed
+        if device:
+            write_device_to_sinks(device, sinks, enrich if device.status != STATUS_UNREACHABLE else None)
+            # Append the device to the columnar table as soon as it is completed too
+            if table is not None:
+                table.append(device)
+
+    # List to store all the devices objects
+    list_of_devices_obj = [device for device in results if device]
     # Return the list of devices objects
     return list_of_devices_obj
 
-def collect_data_from_devices(csv_file_path=None):
+def collect_data_from_devices(csv_file_path=None, sinks=None, enrich=None, max_workers=None, max_per_host=None):
     devices = None
     if csv_file_path:
-        # List of IP addresses to retrieve the information from
-        list_ips = read_from_csv(csv_file_path)
+        # Targets to retrieve the information from, read lazily from the inventory
+        targets = iter_inventory(csv_file_path)
         # Log the start of the process    
-        info_logger.info(f'Start the process of retrieving device information of {len(list_ips)}')
+        info_logger.info("Start the process of retrieving device information of %s", csv_file_path)
+        # Start the slowest devices first, adapting the concurrency to the observed latency
+        scheduler = None
+        if get_scheduler_settings()['enabled']:
+            max_workers, max_per_host = get_concurrency_settings(max_workers, max_per_host)
+            scheduler = AdaptiveScheduler(max_workers)
+            targets = scheduler.order(targets)
         # List to store all the devices objects
-        devices = process_device_list(list_ips)
+        devices = process_device_list(targets, max_workers, max_per_host, sinks=sinks, enrich=enrich, scheduler=scheduler)
         if len(devices) > 0:
-            info_logger.info(f'Number of devices processed: {len(devices)}')
+            info_logger.info("Number of devices processed: %s", len(devices))
         else:
             error_logger.error('No devices were processed.')
         # Log the end of the process
         info_logger.info('End of the process of retrieving device information.')
-        info_logger.info(f"{'-'*50}")
+        info_logger.info('-' * 50)
     else:
         error_logger.error('No CSV file provided.')
         
@@ -266,6 +761,7 @@ def collect_data_from_devices(csv_file_path=None):
 
 if __name__ == '__main__':
 
+    configure_logging()
     devices = collect_data_from_devices()
     if devices:
         for device in devices:
@@ -0,0 +1,434 @@
+# Importaciones de bibliotecas estándar de Python
+import datetime
+import os
+import sqlite3
+from functools import lru_cache
+
+# Importaciones locales
+from preferred_versions import UP_TO_DATE_MESSAGE
+
+DEFAULT_HISTORY_FILENAME = 'history.sqlite'
+
+# Columnas de cada foto (snapshot) de un dispositivo, en el orden de Device.to_dict
+SNAPSHOT_COLUMNS = (
+    'hostname', 'model', 'serial', 'ip_address', 'sw_version', 'sw_version_prefered', 'gpc_version',
+    'app_version', 'av_version', 'threat_version', 'wildfire_version', 'url_filtering_version',
+    'device_certificate_status', 'cached_sections', 'status'
+)
+LICENSE_COLUMNS = ('feature', 'issued', 'expired')
+
+# Los instantes se guardan en ISO 8601, que se ordena como texto
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEVICE_DATE_FORMAT = '%d/%m/%Y'
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    devices INTEGER NOT NULL DEFAULT 0,
+    aborted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS device_snapshots (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    collected_at TEXT NOT NULL,
+    {', '.join(f'{column} TEXT' for column in SNAPSHOT_COLUMNS)}
+);
+CREATE TABLE IF NOT EXISTS licenses (
+    snapshot_id INTEGER NOT NULL REFERENCES device_snapshots(id),
+    feature TEXT,
+    issued TEXT,
+    expired TEXT
+);
+CREATE TABLE IF NOT EXISTS devices (
+    serial TEXT PRIMARY KEY,
+    hostname TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    last_snapshot_id INTEGER REFERENCES device_snapshots(id),
+    lagging_since TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started_at ON runs (started_at);
+CREATE INDEX IF NOT EXISTS snapshots_serial ON device_snapshots (serial, collected_at);
+CREATE INDEX IF NOT EXISTS snapshots_hostname ON device_snapshots (hostname, collected_at);
+CREATE INDEX IF NOT EXISTS snapshots_sw_version ON device_snapshots (sw_version, collected_at);
+CREATE INDEX IF NOT EXISTS snapshots_collected_at ON device_snapshots (collected_at);
+CREATE INDEX IF NOT EXISTS snapshots_run ON device_snapshots (run_id);
+CREATE INDEX IF NOT EXISTS snapshots_run_serial ON device_snapshots (run_id, serial);
+CREATE INDEX IF NOT EXISTS snapshots_run_ip_address ON device_snapshots (run_id, ip_address);
+CREATE INDEX IF NOT EXISTS licenses_snapshot ON licenses (snapshot_id);
+CREATE INDEX IF NOT EXISTS devices_lagging_since ON devices (lagging_since);
+"""
+
+INSERT_SNAPSHOT = (
+    f"INSERT INTO device_snapshots (id, run_id, collected_at, {', '.join(SNAPSHOT_COLUMNS)}) "
+    f"VALUES (?, ?, ?, {', '.join('?' * len(SNAPSHOT_COLUMNS))})"
+)
+INSERT_LICENSE = f"INSERT INTO licenses (snapshot_id, {', '.join(LICENSE_COLUMNS)}) VALUES (?, ?, ?, ?)"
+# El atraso empieza en la primera ejecución atrasada y se reinicia cuando el equipo se pone al día
+UPSERT_DEVICE = """
+INSERT INTO devices (serial, hostname, first_seen, last_seen, last_snapshot_id, lagging_since) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (serial) DO UPDATE SET
+    hostname = excluded.hostname,
+    last_seen = excluded.last_seen,
+    last_snapshot_id = excluded.last_snapshot_id,
+    lagging_since = CASE WHEN excluded.lagging_since IS NULL THEN NULL
+                         ELSE COALESCE(devices.lagging_since, excluded.lagging_since) END
+"""
+
+
+def get_history_path(output_dir=None):
+    """
+    Return the path of the history database: `HISTORY_DB`, or `history.sqlite` in `OUTPUT_DIR`.
+    """
+    path = os.getenv('HISTORY_DB')
+    if path:
+        return path
+    if output_dir is None:
+        output_dir = os.getenv('OUTPUT_DIR', 'output')
+    return os.path.join(output_dir, DEFAULT_HISTORY_FILENAME)
+
+
+def format_timestamp(value):
+    """
+    Format a datetime (or pass an already formatted string through) as stored in the database.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+@lru_cache(maxsize=None)
+def to_iso_date(value):
+    # Device.to_dict formats the license dates as dd/mm/YYYY, which does not sort as text.
+    # A fleet only has a handful of distinct dates, so every string is parsed once
+    try:
+        return datetime.datetime.strptime(value, DEVICE_DATE_FORMAT).date().isoformat()
+    except (TypeError, ValueError):
+        return value
+
+
+class HistoryStore:
+    """
+    SQLite history of the collected devices: one row per run, one snapshot per device and run,
+    and the licenses of every snapshot.
+
+    The snapshots are indexed by serial, hostname and sw_version together with the collection
+    time, so the history of a device or a version is read from the index without scanning
+    the whole table.
+
+    Args:
+        path (str, optional): The database file. Defaults to `get_history_path()`.
+    """
+    def __init__(self, path=None):
+        self.path = path or get_history_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # A sink is opened by the main thread and written by the writer stage of the pipeline (one thread at a time)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # WAL lets the queries read while a collection is writing
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        # Histories created before runs could be aborted
+        if 'aborted' not in {row['name'] for row in self.connection.execute('PRAGMA table_info(runs)')}:
+            with self.connection:
+                self.connection.execute('ALTER TABLE runs ADD COLUMN aborted INTEGER NOT NULL DEFAULT 0')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def start_run(self, started_at=None):
+        """
+        Register a new run and return its id and its start time.
+        """
+        started_at = format_timestamp(started_at or datetime.datetime.now())
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO runs (started_at) VALUES (?)', (started_at,))
+        return cursor.lastrowid, started_at
+
+    def add_snapshots(self, run_id, collected_at, device_dicts):
+        """
+        Write the snapshots and licenses of a batch of devices in a single transaction.
+
+        The `devices` table keeps the latest snapshot of every serial and since when it has been
+        behind its preferred version, so `lagging_devices` does not scan the whole history.
+
+        Args:
+            run_id (int): The run returned by `start_run`.
+            collected_at (str): The time of the run, shared by all its snapshots.
+            device_dicts (list): Dictionaries with the shape of `Device.to_dict`.
+        """
+        with self.connection:
+            # BEGIN IMMEDIATE takes the write lock, so the ids reserved below cannot be taken by another writer
+            self.connection.execute('BEGIN IMMEDIATE')
+            first_id = self.connection.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM device_snapshots').fetchone()[0]
+            snapshots, licenses, devices = [], [], []
+            for snapshot_id, device in enumerate(device_dicts, first_id):
+                snapshots.append((snapshot_id, run_id, collected_at, *(device.get(column) for column in SNAPSHOT_COLUMNS)))
+                for license in device.get('licenses') or []:
+                    licenses.append((snapshot_id, license.get('feature'), to_iso_date(license.get('issued')), license.get('expired')))
+                if device.get('serial'):
+                    lagging = device.get('sw_version_prefered') not in (None, UP_TO_DATE_MESSAGE)
+                    devices.append((device['serial'], device.get('hostname'), collected_at, collected_at, snapshot_id,
+                                    collected_at if lagging else None))
+            self.connection.executemany(INSERT_SNAPSHOT, snapshots)
+            self.connection.executemany(INSERT_LICENSE, licenses)
+            self.connection.executemany(UPSERT_DEVICE, devices)
+
+    def finish_run(self, run_id, devices, finished_at=None):
+        """
+        Record the end of a run and the number of devices written.
+        """
+        with self.connection:
+            self.connection.execute(
+                'UPDATE runs SET finished_at = ?, devices = ? WHERE id = ?',
+                (format_timestamp(finished_at or datetime.datetime.now()), devices, run_id)
+            )
+
+    def abort_run(self, run_id, devices, finished_at=None):
+        """
+        Record the end of a run that failed or wrote no device. Its snapshots are kept, but it is
+        never returned by `latest_run`, so it is not the previous snapshot of a delta.
+        """
+        with self.connection:
+            self.connection.execute(
+                'UPDATE runs SET finished_at = ?, devices = ?, aborted = 1 WHERE id = ?',
+                (format_timestamp(finished_at or datetime.datetime.now()), devices, run_id)
+            )
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def list_runs(self, limit=None):
+        """
+        Return the runs, the most recent first.
+        """
+        query = 'SELECT id, started_at, finished_at, devices, aborted FROM runs ORDER BY started_at DESC'
+        if limit:
+            query += f' LIMIT {int(limit)}'
+        return [dict(row) for row in self.connection.execute(query)]
+
+    def latest_run(self, before_id=None):
+        """
+        Return the most recent completed run (optionally, the most recent one before `before_id`), or None.
+
+        The runs that are still running or were aborted (see `abort_run`) are skipped.
+        """
+        query = 'SELECT id, started_at, finished_at, devices FROM runs WHERE finished_at IS NOT NULL AND NOT aborted'
+        params = []
+        if before_id is not None:
+            query += ' AND id < ?'
+            params.append(before_id)
+        row = self.connection.execute(query + ' ORDER BY id DESC LIMIT 1', params).fetchone()
+        return dict(row) if row is not None else None
+
+    def run_devices(self, run_id):
+        """
+        Return the snapshots of a run as dictionaries with the shape of `Device.to_dict`.
+
+        The license dates are returned as stored (ISO 8601).
+        """
+        devices = {}
+        rows = self.connection.execute(
+            f"SELECT id, {', '.join(SNAPSHOT_COLUMNS)} FROM device_snapshots WHERE run_id = ? ORDER BY id", (run_id,)
+        )
+        for row in rows:
+            device = dict(row)
+            device['licenses'] = []
+            devices[device.pop('id')] = device
+        license_rows = self.connection.execute(
+            f"SELECT l.snapshot_id, {', '.join('l.' + column for column in LICENSE_COLUMNS)} FROM licenses l "
+            'JOIN device_snapshots s ON s.id = l.snapshot_id WHERE s.run_id = ?', (run_id,)
+        )
+        for snapshot_id, *values in license_rows:
+            devices[snapshot_id]['licenses'].append(dict(zip(LICENSE_COLUMNS, values)))
+        return list(devices.values())
+
+    def find_run_snapshot(self, run_id, field, value):
+        """
+        Return the first snapshot of a run whose `field` is `value`, or None.
+
+        Only the matching snapshot and its licenses are read, through the (run_id, serial) and
+        (run_id, ip_address) indexes, so a run can be compared device by device without loading it.
+
+        Returns:
+            tuple: A tuple (snapshot_id, device) with the device in the shape of `run_devices`.
+        """
+        row = self.connection.execute(
+            f"SELECT id, {', '.join(SNAPSHOT_COLUMNS)} FROM device_snapshots "
+            f"WHERE run_id = ? AND {_check_column(field)} = ? ORDER BY id LIMIT 1", (run_id, value)
+        ).fetchone()
+        if row is None:
+            return None
+        device = dict(row)
+        snapshot_id = device.pop('id')
+        device['licenses'] = [
+            dict(license) for license in self.connection.execute(
+                f"SELECT {', '.join(LICENSE_COLUMNS)} FROM licenses WHERE snapshot_id = ?", (snapshot_id,)
+            )
+        ]
+        return snapshot_id, device
+
+    def mark_matched(self, snapshot_id):
+        """
+        Mark a snapshot as matched by the current comparison and return False if it already was.
+
+        The marks live in a temporary table of this connection, so they are kept by SQLite (on
+        disk once they outgrow its cache) and forgotten when the store is closed. The mark is not
+        committed: the caller marks a whole batch in one transaction (`with store.connection:`).
+        """
+        self._create_matched_table()
+        cursor = self.connection.execute('INSERT OR IGNORE INTO temp.matched_snapshots VALUES (?)', (snapshot_id,))
+        return cursor.rowcount == 1
+
+    def iter_unmatched_snapshots(self, run_id, columns=('serial', 'hostname', 'ip_address')):
+        """
+        Yield the snapshots of a run that were not marked by `mark_matched`, one dictionary of `columns` at a time.
+        """
+        self._create_matched_table()
+        rows = self.connection.execute(
+            f"SELECT {', '.join(_check_column(column) for column in columns)} FROM device_snapshots "
+            'WHERE run_id = ? AND id NOT IN (SELECT snapshot_id FROM temp.matched_snapshots) ORDER BY id', (run_id,)
+        )
+        for row in rows:
+            yield dict(row)
+
+    def _create_matched_table(self):
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS matched_snapshots (snapshot_id INTEGER PRIMARY KEY)')
+
+    def device_history(self, serial, fields=('sw_version',), since=None, until=None):
+        """
+        Return the values of `fields` of a device in every run, in chronological order.
+
+        Args:
+            serial (str): The serial number of the device.
+            fields (tuple, optional): Snapshot columns to return. Defaults to ('sw_version',).
+            since (datetime or str, optional): Only the snapshots collected from this time on.
+            until (datetime or str, optional): Only the snapshots collected up to this time.
+
+        Returns:
+            list: Dictionaries with `collected_at` and the requested fields.
+        """
+        columns = ', '.join(_check_column(field) for field in fields)
+        query = f'SELECT collected_at, {columns} FROM device_snapshots WHERE serial = ?'
+        params = [serial]
+        query, params = _add_time_range(query, params, since, until)
+        return [dict(row) for row in self.connection.execute(query + ' ORDER BY collected_at', params)]
+
+    def last_change(self, serial, field):
+        """
+        Answer "when did this value last change?" for a device.
+
+        Args:
+            serial (str): The serial number of the device.
+            field (str): The snapshot column, e.g. 'threat_version'.
+
+        Returns:
+            dict or None: `value` (current), `previous_value`, `changed_at` (first run with the current
+            value; None if it never changed) and `last_seen`, or None if the device is not in the history.
+        """
+        column = _check_column(field)
+        latest = self.connection.execute(
+            f'SELECT collected_at, {column} AS value FROM device_snapshots WHERE serial = ? '
+            'ORDER BY collected_at DESC LIMIT 1', (serial,)
+        ).fetchone()
+        if latest is None:
+            return None
+        previous = self.connection.execute(
+            f'SELECT collected_at, {column} AS value FROM device_snapshots WHERE serial = ? '
+            f'AND {column} IS NOT ? ORDER BY collected_at DESC LIMIT 1', (serial, latest['value'])
+        ).fetchone()
+        changed_at = None
+        if previous is not None:
+            changed_at = self.connection.execute(
+                'SELECT MIN(collected_at) FROM device_snapshots WHERE serial = ? AND collected_at > ?',
+                (serial, previous['collected_at'])
+            ).fetchone()[0]
+        return {
+            'serial': serial,
+            'value': latest['value'],
+            'previous_value': previous['value'] if previous is not None else None,
+            'changed_at': changed_at,
+            'last_seen': latest['collected_at']
+        }
+
+    def lagging_devices(self, days, as_of=None):
+        """
+        Return the devices that, in their latest snapshot, have been behind their preferred
+        version without interruption for more than `days` days.
+
+        Args:
+            days (float): Minimum number of days behind the preferred version.
+            as_of (datetime, optional): Reference time. Defaults to now.
+
+        Returns:
+            list: Dictionaries with serial, hostname, sw_version, sw_version_prefered,
+            lagging_since (first run of the current lag) and last_seen, the oldest lag first.
+        """
+        as_of = as_of or datetime.datetime.now()
+        cutoff = format_timestamp(as_of - datetime.timedelta(days=days))
+        rows = self.connection.execute(
+            'SELECT d.serial, d.hostname, s.sw_version, s.sw_version_prefered, d.lagging_since, d.last_seen '
+            'FROM devices d JOIN device_snapshots s ON s.id = d.last_snapshot_id '
+            'WHERE d.lagging_since <= ? ORDER BY d.lagging_since, d.serial', (cutoff,)
+        )
+        return [dict(row) for row in rows]
+
+    def devices_on_version(self, sw_version, at=None):
+        """
+        Return the devices running `sw_version` in the last run at or before `at` (by default, the last run),
+        skipping the aborted runs.
+
+        Args:
+            sw_version (str): The software version, e.g. '10.2.9-h1'. A trailing '%' matches a prefix ('10.1.%').
+            at (datetime or str, optional): Reference time. Defaults to the latest run.
+
+        Returns:
+            list: Dictionaries with serial, hostname, ip_address, sw_version and collected_at.
+        """
+        run = self.connection.execute(
+            'SELECT id FROM runs WHERE started_at <= ? AND NOT aborted ORDER BY started_at DESC, id DESC LIMIT 1',
+            (format_timestamp(at or datetime.datetime.max.replace(microsecond=0)),)
+        ).fetchone()
+        if run is None:
+            return []
+        operator = 'LIKE' if sw_version.endswith('%') else '='
+        rows = self.connection.execute(
+            'SELECT serial, hostname, ip_address, sw_version, collected_at FROM device_snapshots '
+            f'WHERE run_id = ? AND sw_version {operator} ? ORDER BY hostname',
+            (run['id'], sw_version)
+        )
+        return [dict(row) for row in rows]
+
+
+def _check_column(field):
+    # The column names are interpolated in the SQL, so only the known ones are accepted
+    if field not in SNAPSHOT_COLUMNS:
+        raise ValueError(f"Unknown snapshot column: {field}")
+    return field
+
+
+def _add_time_range(query, params, since, until):
+    if since is not None:
+        query += ' AND collected_at >= ?'
+        params.append(format_timestamp(since))
+    if until is not None:
+        query += ' AND collected_at <= ?'
+        params.append(format_timestamp(until))
+    return query, params
+
@@ -1,40 +1,33 @@
 # Importaciones de bibliotecas estándar de Python
 import datetime
+import hashlib
 import json
 import os
 import re
-
-# Importaciones de bibliotecas externas
-from bs4 import BeautifulSoup  # Para analizar y manipular documentos HTML y XML
+from html.parser import HTMLParser
 
 # Importaciones locales
-from logger import info_logger, error_logger
-from utils import ensure_dir_exists, get_most_recent_file, get_source_dir
+from logger import configure_logging, info_logger, error_logger
+from models import MODEL_FAMILIES
+from utils import compute_file_hash, ensure_dir_exists, get_most_recent_file, get_source_dir
+
+# Manifiesto que relaciona el hash del HTML con el JSON extraído de él
+MANIFEST_FILENAME = 'release_manifest.json'
 
-def remove_specific_attributes_and_tags(html):
+def get_release_sections():
     """
-    Remueve atributos específicos ('style', 'width', 'height', 'role', 'class', 'id', 'colspan', 'size')
-    y tags HTML específicos ('em', 'strong', 'span') de una cadena HTML usando expresiones regulares.
+    Get the product sections (h2 texts) to extract from the release notes.
 
-    Args:
-    - html (str): Cadena HTML donde se buscarán y eliminarán los atributos y tags.
+    They are read from the `RELEASE_SECTIONS` environment variable (`|` separated) and
+    default to every model family that `Device.identify_model` knows.
 
     Returns:
-    - str: Cadena HTML modificada sin los atributos y tags especificados.
+        list: The section names.
     """
-    attributes_to_remove = ['style', 'width', 'height', 'role', 'class', 'id', 'colspan', 'size', 'color', 'data-unlink']
-    tags_to_remove = ['em', 'strong', 'span', 'font', 'br', 'p', 'h5', 'thead']  # Tags HTML que se desean remover
-
-    # Eliminar atributos específicos
-    for attr in attributes_to_remove:
-        html = re.sub(rf'\b{attr}="[^"]*"', '', html)
-
-    # Eliminar tags HTML específicos
-    for tag in tags_to_remove:
-        html = re.sub(rf'<{tag}[^>]*>', '', html)  # Elimina apertura de tag
-        html = re.sub(rf'</{tag}>', '', html)      # Elimina cierre de tag
-
-    return html
+    sections = os.getenv('RELEASE_SECTIONS')
+    if sections:
+        return [section.strip() for section in sections.split('|') if section.strip()]
+    return list(dict.fromkeys(MODEL_FAMILIES.values()))
 
 def search_last_modified_html_file(parent_dir):
     """
@@ -83,73 +76,179 @@ def extract_version(content):
     else:
         return None, content.strip()
 
+# Tamaño de los bloques de texto que se entregan al tokenizador
+HTML_CHUNK_SIZE = 64 * 1024
+
+class SectionIndexParser(HTMLParser):
+    """
+    Single-pass tokenizer that builds an index of every h2 section of the release notes.
+
+    The cells are read directly while the document is tokenized: every h2 opens a new
+    section and every table that follows it is stored in that section as a list of rows,
+    where each row keeps the text of each <td> and whether the cell contains an <h1>
+    (the rows that start a new version). A table nested in a cell adds its text to that cell,
+    not its rows to the outer table.
+    """
+    def __init__(self, stop_at=None):
+        super().__init__(convert_charrefs=True)
+        self.stop_at = stop_at
+        # Lista ordenada de (texto del h2, tablas); las tablas previas al primer h2 quedan en None
+        self.sections = [(None, [])]
+        self._finished = False
+        self._h2_parts = None
+        self._table_depth = 0
+        self._rows = None
+        self._cells = None
+        self._cell = None
+
+    @property
+    def finished(self):
+        # True once the `stop_at` h2 tag has been found, the rest of the document is not needed
+        return self._finished
+
+    def handle_starttag(self, tag, attrs):
+        if self._finished:
+            return
+        if tag == 'h2':
+            self._h2_parts = []
+        elif tag == 'table':
+            self._table_depth += 1
+            if self._table_depth == 1:
+                self._rows = []
+                self.sections[-1][1].append(self._rows)
+        elif self._table_depth == 0:
+            return
+        elif tag == 'h1' and self._cell is not None:
+            self._cell[1] = True
+        elif self._table_depth > 1:
+            # The rows of a nested table belong to the cell that contains it, only its text is kept
+            return
+        elif tag == 'tr':
+            self._cells = []
+            self._cell = None
+            self._rows.append(self._cells)
+        elif tag == 'td' and self._cells is not None:
+            # Una celda nueva cierra la anterior aunque falte el </td>
+            self._cell = [[], False]
+            self._cells.append(self._cell)
+
+    def handle_endtag(self, tag):
+        if tag == 'h2' and self._h2_parts is not None:
+            text = ''.join(self._h2_parts)
+            self._h2_parts = None
+            if text == self.stop_at:
+                self._finished = True
+            else:
+                self.sections.append((text, []))
+        elif tag == 'td' and self._table_depth == 1:
+            self._cell = None
+        elif tag == 'tr' and self._table_depth == 1:
+            self._cells = None
+            self._cell = None
+        elif tag == 'table' and self._table_depth:
+            self._table_depth -= 1
+            if self._table_depth == 0:
+                self._rows = None
+                self._cells = None
+                self._cell = None
+
+    def handle_data(self, data):
+        if self._h2_parts is not None:
+            self._h2_parts.append(data)
+        if self._cell is not None:
+            self._cell[0].append(data)
+
+def build_section_index(html_content, stop_at=None):
+    """
+    Walk the HTML document once and index every h2 section with its tables.
+
+    Args:
+        html_content (str): The HTML content of the release notes.
+        stop_at (str, optional): Stop the walk when an h2 with this text is found.
+
+    Returns:
+        list: An ordered list of (h2_text, tables) tuples. Every table is a list of rows and
+              every row a list of (cell_text, has_h1) tuples. The first entry (h2_text None)
+              holds the tables that precede the first h2.
+    """
+    parser = SectionIndexParser(stop_at)
+    # Feed the document in blocks so the walk can stop early
+    for position in range(0, len(html_content), HTML_CHUNK_SIZE):
+        parser.feed(html_content[position:position + HTML_CHUNK_SIZE])
+        if parser.finished:
+            break
+    parser.close()
+
+    section_index = []
+    for h2_text, tables in parser.sections:
+        section_tables = [[[(''.join(parts), has_h1) for parts, has_h1 in cells] for cells in rows] for rows in tables]
+        section_index.append((h2_text, section_tables))
+    return section_index
+
+def extract_sections(section_index, section_names):
+    """
+    Get the tables of a set of product sections from the section index.
+
+    Args:
+        section_index (list): The index returned by `build_section_index`.
+        section_names (iterable): The h2 texts of the sections to extract.
+
+    Returns:
+        list: A list of tuples containing the h2 text and the rows of every table, in document order.
+    """
+    section_names = set(section_names)
+    return [
+        (h2_text, table)
+        for h2_text, tables in section_index if h2_text in section_names
+        for table in tables
+    ]
+
 def search_tables(html_content, initial_text, final_text):
     """
     Search for tables within a specific range in an HTML document.
 
+    The document is tokenized once and the cells are read while tokenizing, so there is no
+    intermediate tree, no serialization of the tables and no second parse.
+
     Args:
         html_content (str): The HTML content to search within.
         initial_text (str): The text of the initial h2 tag to start the range.
         final_text (str): The text of the final h2 tag to end the range.
 
     Returns:
-        list: A list of tuples containing the preceding h2 tag text and the corresponding table (str).
-
+        list: A list of tuples containing the preceding h2 tag text and the rows of the table.
+              Every row is a list of (cell_text, has_h1) tuples.
     """
-    info_logger.info(f"Searching for tables within the range '{initial_text}' - '{final_text}'")
-
-    # Create the BeautifulSoup object
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # Find the initial h2 tag with specific text
-    initial_h2_tag = soup.find('h2', string=initial_text)
+    info_logger.info("Searching for tables within the range '%s' - '%s'", initial_text, final_text)
 
-    # Find the final h2 tag with specific text
-    final_h2_tag = soup.find('h2', string=final_text)
-
-    # Find all tables within the range and save the preceding h2 tag for each table
     tables_in_range = []
-    current_tag = initial_h2_tag
-
-    while current_tag and current_tag != final_h2_tag:
-        # Check if the current tag is an h2 tag
-        if current_tag.name == 'h2':
-            current_h2_text = current_tag.text  # Save the text of the current h2 tag
-        # Check if the current tag is a table
-        if current_tag.name == 'table':
-            # Remove specific attributes and tags from the table
-            cleaned_table = remove_specific_attributes_and_tags(str(current_tag))
-            tables_in_range.append((current_h2_text, cleaned_table))  # Save the h2 text and the table as a tuple
-        # Move to the next sibling tag
-        current_tag = current_tag.find_next_sibling()
-
+    in_range = False
+    for h2_text, tables in build_section_index(html_content, stop_at=final_text):
+        if h2_text == initial_text:
+            in_range = True
+        if in_range:
+            tables_in_range.extend((h2_text, table) for table in tables)
     return tables_in_range
 
-def extract_columns_from_row(row_soup_obj):
+def extract_columns_from_row(cells):
     """
-    Extracts specific columns from a row represented by a BeautifulSoup object.
+    Extracts specific columns from the cells of a row.
 
     Args:
-    - row_soup_obj (BeautifulSoup Tag): The BeautifulSoup object representing the row.
+    - cells (list): The (cell_text, has_h1) tuples of the row.
 
     Returns:
-    - list: A list containing the extracted data from the row, structured as [support_preferred, release, release_date, comments].
+    - list: A list containing the extracted data from the row, structured as [release, release_date, comments].
       If the row does not have exactly 4 <td> elements, returns an empty list.
-
-    Prints:
-    - Message indicating if the row does not have the expected format (not 4 <td> elements).
     """
     data_row = []  # List to store the extracted data from the row
 
-    # Find all <td> elements within the row
-    tds = row_soup_obj.find_all('td')
-
     # Extract content from each <td> if there are exactly 4 <td> elements
-    if len(tds) == 4:
-        #support_preferred = tds[0].text.strip()
-        release = tds[1].text.strip()
-        release_date = tds[2].text.strip()
-        comments = tds[3].text.strip()
+    if len(cells) == 4:
+        #support_preferred = cells[0][0].strip()
+        release = cells[1][0].strip()
+        release_date = cells[2][0].strip()
+        comments = cells[3][0].strip()
         # Append the extracted data to the list 
         data_row = [release, datetime.datetime.strptime(release_date, '%m/%d/%y').strftime('%d/%m/%Y'), comments]
     else:
@@ -158,36 +257,33 @@ def extract_columns_from_row(row_soup_obj):
     return data_row
 
 
-def extract_info_from_table(table_str):
+def extract_info_from_table(table_rows):
     """
-    Extracts information from a HTML table represented as a string.
+    Extracts information from the rows of a release table.
 
     Args:
-    - table_str (str): The HTML string of the table.
+    - table_rows (list): The rows returned by `search_tables` for one table.
 
     Returns:
-    - dict: A dictionary where keys are version numbers and values are lists of BeautifulSoup objects representing rows.
-
-    Note:
-    - This function assumes the presence of BeautifulSoup (bs4) for HTML parsing.
+    - dict: A dictionary where keys are version numbers and values are the [release, release_date, comments]
+      data of the preferred releases.
     """
-    # Convert the string back to a BeautifulSoup object
-    table_soup = BeautifulSoup(table_str, 'html.parser')
     # Initialize the dictionary to store the ordered rows
     ordered_rows = {}
     # Initialize the current version
-    for row in table_soup.find_all('tr'):
-        cell = row.find('td')
-        if cell:
-            # Extract the all content of the cell
-            content = cell.text.strip()
-            if cell.find('h1'):
+    current_version = None
+    for cells in table_rows:
+        if cells:
+            # Extract the all content of the first cell
+            cell_text, has_h1 = cells[0]
+            content = cell_text.strip()
+            if has_h1:
                 # Found a new version
                 current_version = extract_version(content)[0] # Extract the version number without the rest of the content like comments
                 ordered_rows[current_version] = []
-            elif content == 'P':
+            elif content == 'P' and current_version in ordered_rows:
                 # Found a row with data
-                row_data = extract_columns_from_row(row)
+                row_data = extract_columns_from_row(cells)
                 if row_data:  # Check if row_data is not empty
                     ordered_rows[current_version].extend(row_data)
 
@@ -212,17 +308,16 @@ def process_info_from_tables(tables_data):
     return list_of_dicts
         
 
-def save_to_json(list_of_dicts):
+def save_to_json(list_of_dicts, content_hash=None):
     """
     Save a list of dictionaries to a JSON file.
 
     Args:
-        source_dir_parent (str): The parent directory of the source directory.
-        folder_name (str): The name of the directory where the JSON file will be saved.
         list_of_dicts (list): The list of dictionaries to be saved.
+        content_hash (str, optional): The hash of the extracted content, added to the file name.
 
     Returns:
-        None
+        str: The path of the JSON file.
     """
     # Get the source directory for the JSON files
     source_dir_json = get_source_dir('json')
@@ -230,17 +325,56 @@ def save_to_json(list_of_dicts):
     source_dir_json_exist = ensure_dir_exists(source_dir_json)
     # Check if the directory was created
     if not source_dir_json_exist:
-        info_logger.info(f"Directory {source_dir_json} created.")
+        info_logger.info("Directory %s created.", source_dir_json)
     # Current directory + Source parent directory + JSON directory + name.json
-    complete_name = os.path.join(source_dir_json, f'data_html_{datetime.date.today()}.json')
+    file_name = f'data_html_{datetime.date.today()}_{content_hash[:12]}.json' if content_hash else f'data_html_{datetime.date.today()}.json'
+    complete_name = os.path.join(source_dir_json, file_name)
     try:
         # Save the list of dictionaries in a file
         with open(complete_name, 'w') as file:
             json.dump(list_of_dicts, file, indent=4)
-        info_logger.info(f"Data saved to {complete_name}")
+        info_logger.info("Data saved to %s", complete_name)
     except Exception as e:
-        error_logger.error(f"Error saving data to {complete_name}")
+        error_logger.error("Error saving data to %s", complete_name)
         raise e
+    return complete_name
+
+def get_manifest_path():
+    """
+    Returns the path of the manifest that maps every HTML hash to its extracted JSON.
+    """
+    return os.path.join(get_source_dir('cache'), MANIFEST_FILENAME)
+
+def load_manifest():
+    """
+    Load the HTML hash -> JSON file manifest.
+
+    Returns:
+        dict: The manifest, empty if it does not exist or cannot be read.
+    """
+    manifest_path = get_manifest_path()
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        error_logger.error("Could not read the manifest %s: %s", manifest_path, e)
+        return {}
+
+def save_manifest(manifest):
+    """
+    Save the HTML hash -> JSON file manifest.
+
+    Args:
+        manifest (dict): The manifest to save.
+    """
+    manifest_path = get_manifest_path()
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(temp_path, manifest_path)
 
 def get_source_dir(subdir=''):
     """
@@ -260,60 +394,100 @@ def get_source_dir(subdir=''):
         source_dir = source_dir_parent
     return source_dir
 
-def extract_and_process_html_tables():
+def extract_release_json(force=False, sections=None):
     """
-    Extracts and processes HTML tables within a specified range.
+    Return the JSON extracted from the most recent HTML file, extracting it only if needed.
 
-    This function performs the following steps:
-    1. Starts the HTML data extraction process.
-    2. Gets the source directory for the HTML files.
-    3. Retrieves the content of the most recently modified HTML file.
-    4. Searches for tables within a specific range.
-    5. Checks if there are tables within the specified range.
-    6. If tables are found, processes the information from the tables and saves it to a JSON file.
-    7. If no tables are found, raises a ValueError.
+    The JSON is keyed in a small manifest by the SHA-256 hash of the HTML and the requested
+    sections: if neither changed, the cost is one hash; otherwise (or if `force` is True) the
+    document is indexed in a single walk, every requested section is extracted from that index
+    and the manifest is updated.
+
+    Args:
+        force (bool, optional): Extract the tables even if the HTML did not change. Defaults to False.
+        sections (list, optional): The product sections to extract. Defaults to `get_release_sections()`.
 
     Returns:
-        None
+        str or None: The path of the JSON file, or None if it could not be extracted.
     """
-    # Initialize the variable to check if the process is completed
-    is_completed = False
+    json_file = None
     # Start the HTML data extraction process
     info_logger.info("Starting the HTML data extraction process...")
     # Get the source directory for the HTML files
     source_dir_html = get_source_dir('html')
     source_dir_html_exist = ensure_dir_exists(source_dir_html)
     if not source_dir_html_exist:
-        info_logger.error(f"Directory {source_dir_html} created. Put the HTML file in this directory with info.")
+        info_logger.error("Directory %s created. Put the HTML file in this directory with info.", source_dir_html)
+        return None
+    # Get the most recently modified HTML file
+    html_file = get_most_recent_file(source_dir_html, '.html')
+    if not html_file:
+        error_logger.error("FileNotFoundError: No HTML files found in %s directory.", source_dir_html)
+        return None
+
+    if sections is None:
+        sections = get_release_sections()
+    # Check if the JSON of this exact HTML and sections was already extracted
+    html_hash = compute_file_hash(html_file)
+    extraction_key = hashlib.sha256(f"{html_hash}\n{'|'.join(sections)}".encode('utf-8')).hexdigest()
+    manifest = load_manifest()
+    cached_json = manifest.get(extraction_key)
+    if not force and cached_json and os.path.exists(cached_json):
+        info_logger.info("HTML %s unchanged (sha256 %s), using %s", os.path.basename(html_file), html_hash[:12], cached_json)
+        return cached_json
+
+    with open(html_file, 'r', encoding='utf-8') as file:
+        html_content = file.read()
+    # Index every h2 section in a single walk and take the requested ones
+    section_index = build_section_index(html_content)
+    info_logger.info("Indexed %s sections, extracting: %s", len(section_index) - 1, ', '.join(sections))
+    tuple_of_tables_data = extract_sections(section_index, sections)
+    # Check if there are tables in the requested sections
+    if len(tuple_of_tables_data) > 0:
+        info_logger.info("Found %s tables within the requested sections.", len(tuple_of_tables_data)) 
+        found_sections = {h2_text for h2_text, _ in tuple_of_tables_data}
+        for section in sections:
+            if section not in found_sections:
+                error_logger.error("No tables found for the section '%s'.", section)
+        # Create a list to store the dictionaries
+        list_of_dicts = process_info_from_tables(tuple_of_tables_data)
+        if len(list_of_dicts) > 0:
+            info_logger.info("Processed %s tables.", len(list_of_dicts))
+            # Save the list of dictionaries to a JSON file and record it in the manifest
+            json_file = save_to_json(list_of_dicts, extraction_key)
+            manifest[extraction_key] = json_file
+            save_manifest(manifest)
     else:
-        # Get the content of the most recently modified HTML file
-        html_content = search_last_modified_html_file(source_dir_html)
-        if html_content:
-            # Search for tables within a specific range
-            tuple_of_tables_data = search_tables(html_content, 'PAN-OS for Firewalls', 'Prisma Access for Panorama')
-            # Check if there are tables within the specified range
-            if len(tuple_of_tables_data) > 0:
-                info_logger.info(f"Found {len(tuple_of_tables_data)} tables within the specified range.") 
-                # Create a list to store the dictionaries
-                list_of_dicts = process_info_from_tables(tuple_of_tables_data)
-                if len(list_of_dicts) > 0:
-                    info_logger.info(f"Processed {len(list_of_dicts)} tables.")
-                    # Save the list of dictionaries to a JSON file
-                    save_to_json(list_of_dicts)
-                    is_completed = True
-            else:
-                error_logger.error("No tables found within the specified range.")                
-        else:
-            error_logger.error(f'FileNotFoundError: No HTML files found in {source_dir_html} directory.')
+        error_logger.error("No tables found within the requested sections.")
+    return json_file
+
+def extract_and_process_html_tables(force=False):
+    """
+    Extracts and processes HTML tables within a specified range.
+
+    This function performs the following steps:
+    1. Starts the HTML data extraction process.
+    2. Gets the most recently modified HTML file and its hash.
+    3. If the JSON of that HTML was already extracted, it is reused.
+    4. Otherwise searches for tables within a specific range, processes them and saves them to a JSON file.
+
+    Args:
+        force (bool, optional): Extract the tables even if the HTML did not change. Defaults to False.
+
+    Returns:
+        bool: True if the JSON of the current HTML is available, False otherwise.
+    """
+    is_completed = extract_release_json(force) is not None
     # Check if the process is completed           
     if is_completed:
         info_logger.info("HTML data extraction process completed.")
     else:
         info_logger.error("HTML data extraction process failed. Check the error logs for more information.")
     # End the HTML data extraction process
-    info_logger.info(f"{'-'*50}")
+    info_logger.info('-' * 50)
     return is_completed
     
 if __name__ == '__main__':
+    configure_logging()
     can_complete_the_process = extract_and_process_html_tables()
     print(f"Can complete the process: {can_complete_the_process}")
\ No newline at end of file
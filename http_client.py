@@ -0,0 +1,319 @@
+# Importaciones de bibliotecas estándar de Python
+import os
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Importaciones de bibliotecas externas
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from urllib3.util.ssl_ import create_urllib3_context
+
+# Importaciones locales
+from logger import info_logger
+
+# Deshabilitar la advertencia de solicitud HTTPS no verificada
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Valores por defecto de la sesión HTTP (se pueden sobreescribir en el .env)
+DEFAULT_POOL_HOSTS = 100
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 1
+DEFAULT_BACKOFF = 0.5
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 10
+
+# Fallos consecutivos de un host que abren su circuito (0 lo desactiva) y segundos hasta volver a intentarlo
+DEFAULT_CIRCUIT_BREAKER_THRESHOLD = 2
+DEFAULT_CIRCUIT_BREAKER_RESET = 300
+
+# Las respuestas XML de los firewalls se comprimen muy bien
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class ConnectionStats:
+    """
+    Thread-safe counters of the connections opened and the requests sent by the shared session.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+
+    def record_open(self):
+        with self._lock:
+            self.opened += 1
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def reused(self):
+        # Every request that did not need a new connection reused one from the pool
+        return max(0, self.requests - self.opened)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'connections_opened': self.opened,
+            'connections_reused': self.reused
+        }
+
+    def reset(self):
+        with self._lock:
+            self.opened = 0
+            self.requests = 0
+
+
+connection_stats = ConnectionStats()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of sending a request to a host whose circuit is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker of the shared session.
+
+    After `threshold` consecutive transport failures (connection errors and timeouts) of a host,
+    its circuit opens and the following requests to it fail immediately with CircuitOpenError.
+    After `reset_after` seconds one request is let through again: a success closes the circuit
+    and a failure keeps it open for another period. Any HTTP response counts as a success.
+
+    Args:
+        threshold (int, optional): Consecutive failures that open the circuit. Defaults to
+            `CIRCUIT_BREAKER_THRESHOLD` (2); 0 disables the breaker.
+        reset_after (float, optional): Seconds before an open circuit is retried. Defaults to
+            `CIRCUIT_BREAKER_RESET` (300).
+    """
+    def __init__(self, threshold=None, reset_after=None):
+        if threshold is None:
+            threshold = int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', DEFAULT_CIRCUIT_BREAKER_THRESHOLD))
+        if reset_after is None:
+            reset_after = float(os.getenv('CIRCUIT_BREAKER_RESET', DEFAULT_CIRCUIT_BREAKER_RESET))
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._opened_at = {}
+
+    def is_open(self, host):
+        """
+        Check if the requests to a host must be skipped.
+        """
+        if self.threshold <= 0:
+            return False
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return False
+            if time.monotonic() - opened_at >= self.reset_after:
+                # Half-open: let one request through; a new failure opens the circuit again
+                self._opened_at[host] = time.monotonic()
+                return False
+            return True
+
+    def tripped(self, host):
+        """
+        Check if a host reached the failure threshold, without letting a half-open request through.
+        """
+        with self._lock:
+            return self.threshold > 0 and host in self._opened_at
+
+    def record_success(self, host):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def record_failure(self, host):
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if self.threshold > 0 and failures >= self.threshold:
+                if host not in self._opened_at:
+                    info_logger.info("Circuit opened for %s after %s consecutive failures", host, failures)
+                self._opened_at[host] = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._failures.clear()
+            self._opened_at.clear()
+
+
+circuit_breaker = CircuitBreaker()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        connection_stats.record_open()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        connection_stats.record_open()
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pools count every new connection in `connection_stats`.
+
+    If an `ssl_context` is given it is shared by every HTTPS connection. Otherwise urllib3 builds
+    a new context per connection and loads the system CA bundle into it, even when the
+    certificates are not verified.
+    """
+    def __init__(self, *args, ssl_context=None, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.ssl_context is not None:
+            kwargs.setdefault('ssl_context', self.ssl_context)
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool
+        }
+
+
+def get_http_settings():
+    """
+    Read the HTTP session settings from the environment variables.
+
+    Returns:
+        dict: The pool, retry and timeout settings of the shared session.
+    """
+    return {
+        'pool_hosts': int(os.getenv('HTTP_POOL_HOSTS', DEFAULT_POOL_HOSTS)),
+        'pool_size': int(os.getenv('HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)),
+        'retries': int(os.getenv('HTTP_RETRIES', DEFAULT_RETRIES)),
+        'backoff': float(os.getenv('HTTP_BACKOFF', DEFAULT_BACKOFF)),
+        'timeout': (float(os.getenv('HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+                    float(os.getenv('HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)))
+    }
+
+
+def create_session(settings=None):
+    """
+    Create a requests Session with connection pooling, keep-alive, retries and gzip enabled.
+
+    Args:
+        settings (dict, optional): The settings returned by `get_http_settings`. Defaults to the environment.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    if settings is None:
+        settings = get_http_settings()
+    retry = Retry(
+        total=settings['retries'],
+        connect=settings['retries'],
+        read=settings['retries'],
+        status=settings['retries'],
+        backoff_factor=settings['backoff'],
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'POST']),
+        raise_on_status=False
+    )
+    adapter = PooledHTTPAdapter(
+        pool_connections=settings['pool_hosts'],
+        pool_maxsize=settings['pool_size'],
+        max_retries=retry,
+        # The certificates of the devices are not verified, so one context serves every connection
+        ssl_context=create_urllib3_context(cert_reqs=ssl.CERT_NONE)
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'})
+    session.verify = False
+    return session
+
+
+_session = None
+_session_timeout = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the shared session, creating it the first time it is needed.
+
+    Returns:
+        tuple: A tuple (session, timeout) with the shared session and its (connect, read) timeout.
+    """
+    global _session, _session_timeout
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                settings = get_http_settings()
+                _session_timeout = settings['timeout']
+                _session = create_session(settings)
+                info_logger.info("HTTP session created: %s", settings)
+    return _session, _session_timeout
+
+
+def close_session():
+    """
+    Close the shared session and all its pooled connections.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def post(url, **kwargs):
+    """
+    Send a POST request through the shared session.
+
+    Args:
+        url (str): The URL of the request.
+        **kwargs: Extra arguments for `requests.Session.post`.
+
+    Returns:
+        requests.Response: The response of the request.
+
+    Raises:
+        CircuitOpenError: If the circuit of the host is open (see `CircuitBreaker`).
+        requests.exceptions.RequestException: If the request fails.
+    """
+    host = urlsplit(url).netloc
+    if circuit_breaker.is_open(host):
+        raise CircuitOpenError(f"Circuit open for {host}, request skipped")
+    session, timeout = get_session()
+    kwargs.setdefault('timeout', timeout)
+    # requests replaces session.verify with REQUESTS_CA_BUNDLE / CURL_CA_BUNDLE unless it is passed per request
+    kwargs.setdefault('verify', session.verify)
+    connection_stats.record_request()
+    try:
+        response = session.post(url, **kwargs)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        circuit_breaker.record_failure(host)
+        raise
+    circuit_breaker.record_success(host)
+    return response
+
+
+def log_connection_stats():
+    """
+    Log the number of requests sent and connections opened / reused by the shared session.
+
+    Returns:
+        dict: The current connection counters.
+    """
+    stats = connection_stats.to_dict()
+    info_logger.info(
+        "HTTP requests: %s, connections opened: %s, connections reused: %s", stats['requests'], stats['connections_opened'], stats['connections_reused']
+    )
+    return stats
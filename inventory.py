@@ -0,0 +1,240 @@
+# Importaciones de bibliotecas estándar de Python
+import csv
+import ipaddress
+import os
+import re
+import socket
+
+# Importaciones locales
+from logger import error_logger
+
+# Máximo de direcciones que puede generar una sola entrada (una /16); se puede cambiar en el .env
+DEFAULT_MAX_EXPANSION = 65536
+
+# Columnas con significado propio; el resto de columnas del CSV se guardan en `metadata`
+IP_COLUMN = 'ip'
+TARGET_COLUMNS = ('site', 'profile', 'priority')
+
+# Prefijo de las variables de credenciales de un perfil: USER_IP_<PERFIL> y PASSWORD_IP_<PERFIL>
+PROFILE_NAME_PATTERN = re.compile(r'[^A-Za-z0-9]+')
+
+
+class InventoryTarget:
+    """
+    A device to collect, with the optional metadata of its inventory row.
+
+    Args:
+        ip (str): The address of the device (IP, host name, optionally followed by ':port').
+        site (str, optional): The site of the device.
+        profile (str, optional): The credentials profile (see `get_credentials`).
+        priority (int, optional): The priority of the device. Defaults to 0.
+        metadata (dict, optional): The other columns of the row.
+    """
+    __slots__ = ('ip', 'site', 'profile', 'priority', 'metadata')
+
+    def __init__(self, ip, site=None, profile=None, priority=0, metadata=None):
+        self.ip = ip
+        self.site = site
+        self.profile = profile
+        self.priority = priority
+        self.metadata = metadata
+
+    def __repr__(self):
+        return f"InventoryTarget({self.ip!r}, site={self.site!r}, profile={self.profile!r}, priority={self.priority})"
+
+
+def get_max_expansion():
+    return int(os.getenv('INVENTORY_MAX_EXPANSION', DEFAULT_MAX_EXPANSION))
+
+
+def expand_entry(entry, max_expansion=None):
+    """
+    Lazily expand an inventory entry into (key, address) pairs.
+
+    Accepted entries: a single address ('10.0.0.1', '10.0.0.1:8443', 'fw01.example.com'), a CIDR
+    range ('10.0.0.0/24', only the usable hosts) or an address range ('10.0.0.1-10.0.0.20' or
+    '10.0.0.1-20'). The key identifies the address for the deduplication: the integer value of
+    IPv4 addresses, so '10.0.0.1' written twice or inside a range is only collected once.
+
+    Args:
+        entry (str): The inventory entry.
+        max_expansion (int, optional): Maximum addresses of a range. Defaults to `INVENTORY_MAX_EXPANSION` (65536).
+
+    Yields:
+        tuple: A tuple (key, address).
+
+    Raises:
+        ValueError: If the entry is not valid or the range is larger than `max_expansion`.
+    """
+    if max_expansion is None:
+        max_expansion = get_max_expansion()
+    if '/' in entry:
+        network = ipaddress.ip_network(entry, strict=False)
+        if network.num_addresses > max_expansion:
+            raise ValueError(f"{entry} has {network.num_addresses} addresses, more than {max_expansion}")
+        for address in network.hosts():
+            yield _address_key(address), str(address)
+        return
+    first, separator, last = entry.partition('-')
+    if separator:
+        start = _parse_address(first)
+        if start is not None:
+            end = _parse_range_end(start, last)
+            count = int(end) - int(start) + 1
+            if count < 1:
+                raise ValueError(f"{entry} is an empty range")
+            if count > max_expansion:
+                raise ValueError(f"{entry} has {count} addresses, more than {max_expansion}")
+            for value in range(int(start), int(end) + 1):
+                address = ipaddress.ip_address(value) if start.version == 4 else ipaddress.IPv6Address(value)
+                yield _address_key(address), str(address)
+            return
+    # A single address, 'address:port' or a host name (which may contain '-')
+    try:
+        # Camino rápido para las IPv4: inet_pton es mucho más rápido que ipaddress
+        yield int.from_bytes(socket.inet_pton(socket.AF_INET, entry), 'big'), entry
+        return
+    except OSError:
+        pass
+    address = _parse_address(entry)
+    if address is not None:
+        yield _address_key(address), str(address)
+    else:
+        yield entry.lower(), entry
+
+
+def _parse_address(text):
+    try:
+        return ipaddress.ip_address(text.strip())
+    except ValueError:
+        return None
+
+
+def _parse_range_end(start, text):
+    text = text.strip()
+    # '10.0.0.1-20': the end only gives the last octet
+    if start.version == 4 and text.isdigit():
+        return ipaddress.IPv4Address(f"{str(start).rsplit('.', 1)[0]}.{text}")
+    end = _parse_address(text)
+    if end is None or end.version != start.version:
+        raise ValueError(f"Invalid end of range: {text}")
+    return end
+
+
+def _address_key(address):
+    return int(address) if address.version == 4 else str(address)
+
+
+def _iter_csv_rows(file):
+    reader = csv.DictReader(file)
+    fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    if IP_COLUMN not in fieldnames:
+        raise ValueError(f"The inventory has no '{IP_COLUMN}' column")
+    reader.fieldnames = fieldnames
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _iter_text_rows(file):
+    # One entry per line, optionally followed by key=value pairs: '10.0.0.0/24 site=mad priority=2'
+    for line_number, line in enumerate(file, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        entry, *pairs = line.split()
+        row = {IP_COLUMN: entry}
+        for pair in pairs:
+            key, _, value = pair.partition('=')
+            row[key.lower()] = value
+        yield line_number, row
+
+
+def iter_inventory(path, max_expansion=None):
+    """
+    Read an inventory one row at a time and yield its targets, without duplicates and in file order.
+
+    CSV files (`.csv`) need an `ip` column and may have `site`, `profile` and `priority` columns;
+    any other column is kept in the target metadata. Other files are read as plain text, one entry
+    per line followed by optional `key=value` pairs, with `#` comments. Every entry can be a single
+    address, a CIDR range or an address range (see `expand_entry`); ranges are expanded lazily, so
+    the first targets are available as soon as the first line is read. Invalid rows are logged and
+    skipped.
+
+    Args:
+        path (str): The inventory file.
+        max_expansion (int, optional): Maximum addresses of a range. Defaults to `INVENTORY_MAX_EXPANSION`.
+
+    Yields:
+        InventoryTarget: Every target of the inventory.
+
+    Raises:
+        ValueError: If a CSV inventory has no `ip` column.
+    """
+    # utf-8-sig ignora el BOM que añade Excel
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        rows = _iter_csv_rows(file) if path.lower().endswith('.csv') else _iter_text_rows(file)
+        yield from _iter_targets(rows, path, max_expansion)
+
+
+def iter_targets(entries, max_expansion=None):
+    """
+    Expand a list of entries (e.g. given on the command line) into targets, like `iter_inventory`.
+
+    Args:
+        entries (iterable): Addresses, CIDR ranges or address ranges.
+        max_expansion (int, optional): Maximum addresses of a range. Defaults to `INVENTORY_MAX_EXPANSION`.
+
+    Yields:
+        InventoryTarget: Every target, without duplicates.
+    """
+    yield from _iter_targets(enumerate(({IP_COLUMN: entry} for entry in entries), 1), 'the arguments', max_expansion)
+
+
+def _iter_targets(rows, source, max_expansion):
+    if max_expansion is None:
+        max_expansion = get_max_expansion()
+    # Sólo se guarda la clave de cada dirección (un entero para IPv4), no los objetos
+    seen = set()
+    for line_number, row in rows:
+        entry = (row.get(IP_COLUMN) or '').strip()
+        if not entry:
+            continue
+        try:
+            priority = int(row.get('priority') or 0)
+            addresses = expand_entry(entry, max_expansion)
+            site, profile = row.get('site') or None, row.get('profile') or None
+            metadata = {key: value for key, value in row.items() if key not in (IP_COLUMN, *TARGET_COLUMNS) and key} or None
+            for key, address in addresses:
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield InventoryTarget(address, site, profile, priority, metadata)
+        except ValueError as e:
+            error_logger.error("Invalid inventory entry in %s line %s (%s): %s", source, line_number, entry, e)
+
+
+def get_credentials(profile=None):
+    """
+    Return the credentials of a profile: `USER_IP_<PROFILE>` and `PASSWORD_IP_<PROFILE>`, or
+    `USER_IP` and `PASSWORD_IP` if the profile is empty or not configured.
+
+    Args:
+        profile (str, optional): The credentials profile of the target, e.g. 'branch' or 'dc-east'.
+
+    Returns:
+        tuple: A tuple (user, password).
+    """
+    if profile:
+        suffix = PROFILE_NAME_PATTERN.sub('_', profile).strip('_').upper()
+        user, password = os.getenv(f'USER_IP_{suffix}'), os.getenv(f'PASSWORD_IP_{suffix}')
+        if user and password:
+            return user, password
+        error_logger.error("Credentials profile %s not configured, using USER_IP and PASSWORD_IP", profile)
+    return os.getenv('USER_IP'), os.getenv('PASSWORD_IP')
+
+
+def target_address(target):
+    """
+    Return the address of a target, which may be an InventoryTarget or a plain string.
+    """
+    return target.ip if isinstance(target, InventoryTarget) else target
@@ -0,0 +1,112 @@
+# Importaciones de bibliotecas estándar de Python
+import os
+import threading
+import time
+
+# Importaciones locales
+from kv_store import KeyValueStore
+from logger import info_logger
+from utils import get_source_dir
+
+# Las API keys de PAN-OS son válidas hasta que cambia la contraseña del usuario
+DEFAULT_API_KEY_TTL = 30 * 24 * 60 * 60
+KEY_CACHE_FILENAME = 'api_keys.sqlite'
+# Archivo de la caché antes de guardarse en SQLite, se importa una vez
+LEGACY_KEY_CACHE_FILENAME = 'api_keys.json'
+
+
+class ApiKeyCache:
+    """
+    On-disk store of API keys keyed by device IP and user.
+
+    The keys live in a SQLite file (see `kv_store.KeyValueStore`) that is only readable and
+    writable by its owner (0600), and are read one at a time, so the cache does not grow in
+    memory with the size of the fleet. Every entry expires after `ttl` seconds. A TTL of 0
+    disables the cache.
+    """
+    def __init__(self, path=None, ttl=None):
+        if path is None:
+            path = os.path.join(get_source_dir('cache'), KEY_CACHE_FILENAME)
+        if ttl is None:
+            ttl = int(os.getenv('API_KEY_TTL', DEFAULT_API_KEY_TTL))
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._store = None
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @staticmethod
+    def _entry_key(ip, user):
+        return f"{user}@{ip}"
+
+    def load(self):
+        """
+        Open the key file, importing the JSON file of older versions and discarding the expired keys.
+        """
+        with self._lock:
+            if self._store is None:
+                store = KeyValueStore(self.path, mode=0o600)
+                store.import_json(
+                    os.path.join(os.path.dirname(self.path), LEGACY_KEY_CACHE_FILENAME),
+                    lambda key, entry: [(key, entry, entry.get('created_at', 0))]
+                )
+                expired = store.purge(time.time() - self.ttl)
+                self._store = store
+                info_logger.info("Opened the API key cache %s (%s expired keys removed)", self.path, expired)
+        return self._store
+
+    def get(self, ip, user):
+        """
+        Return the cached key for a device, or None if there is no valid key.
+        """
+        if not self.enabled:
+            return None
+        entry = (self._store or self.load()).get(self._entry_key(ip, user))
+        if entry and time.time() - entry['created_at'] < self.ttl:
+            return entry['key']
+        return None
+
+    def set(self, ip, user, key):
+        """
+        Store a new key for a device.
+        """
+        if not self.enabled or not key:
+            return
+        created_at = time.time()
+        (self._store or self.load()).set(self._entry_key(ip, user), {'key': key, 'created_at': created_at}, created_at)
+
+    def invalidate(self, ip, user):
+        """
+        Remove the key of a device, e.g. after the device rejected it.
+        """
+        if not self.enabled:
+            return
+        (self._store or self.load()).delete(self._entry_key(ip, user))
+
+    def save(self):
+        """
+        Commit the new keys to disk.
+        """
+        if self._store is not None:
+            self._store.commit()
+
+
+_key_cache = None
+_key_cache_lock = threading.Lock()
+
+
+def get_key_cache():
+    """
+    Return the shared API key cache of the process.
+
+    The first call may come from several worker threads at once, so the cache is created under a lock.
+    """
+    global _key_cache
+    if _key_cache is None:
+        with _key_cache_lock:
+            if _key_cache is None:
+                _key_cache = ApiKeyCache()
+    return _key_cache
@@ -0,0 +1,133 @@
+# Importaciones de bibliotecas estándar de Python
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Importaciones locales
+from logger import info_logger, error_logger
+
+# Escrituras acumuladas en una transacción antes de confirmarla
+DEFAULT_COMMIT_EVERY = 500
+
+
+class KeyValueStore:
+    """
+    Persistent mapping of JSON values in a SQLite file, for the stores that keep one entry per
+    device (API keys, cached results, latencies).
+
+    The entries stay on disk and every read is a lookup by primary key, so memory does not grow
+    with the size of the fleet. The writes are grouped in a transaction that is committed every
+    `commit_every` writes and by `commit`. It can be used from several threads at once.
+
+    Args:
+        path (str): The database file.
+        mode (int, optional): Permissions of the file when it is created, e.g. 0o600.
+        commit_every (int, optional): Writes per transaction. Defaults to 500.
+    """
+    def __init__(self, path, mode=None, commit_every=DEFAULT_COMMIT_EVERY):
+        self.path = path
+        self.commit_every = max(1, commit_every)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        # The file is created with its permissions before SQLite opens it
+        if mode is not None and not os.path.exists(path):
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, mode))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS entries_updated_at ON entries (updated_at)')
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def get(self, key):
+        """
+        Return the value of a key, or None.
+        """
+        with self._lock:
+            row = self.connection.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key, value, updated_at=None):
+        """
+        Store the value of a key.
+        """
+        self.update([(key, value, updated_at)])
+
+    def update(self, items):
+        """
+        Store several (key, value, updated_at) tuples; `updated_at` defaults to now.
+        """
+        with self._lock:
+            for key, value, updated_at in items:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO entries (key, value, updated_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), updated_at if updated_at is not None else time.time())
+                )
+                self._pending += 1
+                if self._pending >= self.commit_every:
+                    self._commit()
+
+    def delete(self, key):
+        """
+        Remove a key and return True if it existed.
+        """
+        with self._lock:
+            cursor = self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._pending += 1
+        return cursor.rowcount > 0
+
+    def purge(self, older_than):
+        """
+        Remove the entries updated before the `older_than` timestamp and return how many were removed.
+        """
+        with self._lock:
+            cursor = self.connection.execute('DELETE FROM entries WHERE updated_at < ?', (older_than,))
+            self._commit()
+        return cursor.rowcount
+
+    def commit(self):
+        """
+        Commit the pending writes.
+        """
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        self.connection.commit()
+        self._pending = 0
+
+    def import_json(self, json_path, convert):
+        """
+        Import, once, the JSON file that a store used before it moved to SQLite, and remove it.
+
+        Args:
+            json_path (str): The legacy JSON file, a dictionary of entries.
+            convert (callable): Maps a (key, value) pair of the file to a list of (key, value, updated_at) tuples.
+        """
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+            self.update(item for key, value in entries.items() for item in convert(key, value))
+            self.commit()
+            os.remove(json_path)
+            info_logger.info("Imported %s entries of %s into %s", len(entries), json_path, self.path)
+        except (OSError, ValueError) as e:
+            error_logger.error("Could not import %s into %s: %s", json_path, self.path, e)
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self.connection.close()
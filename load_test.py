@@ -0,0 +1,326 @@
+# Importaciones de bibliotecas estándar de Python
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Importaciones locales
+from panos_simulator import DEFAULT_LATENCY, DEFAULT_PORT, DEFAULT_SLOW_LATENCY, LICENSE_INFO_CMD, SYSTEM_INFO_CMD, raise_open_files_limit
+
+SIMULATOR_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'panos_simulator.py')
+
+
+def run_threads_engine(list_ips, max_workers, max_per_host):
+    from device_data_collector import process_device_list
+
+    return process_device_list(list_ips, max_workers, max_per_host)
+
+
+def run_scheduled_engine(list_ips, max_workers, max_per_host):
+    from device_data_collector import get_concurrency_settings, process_device_list
+    from scheduler import AdaptiveScheduler
+
+    max_workers, max_per_host = get_concurrency_settings(max_workers, max_per_host)
+    scheduler = AdaptiveScheduler(max_workers)
+    return process_device_list(scheduler.order(list_ips), max_workers, max_per_host, scheduler=scheduler)
+
+
+# Motores de recolección que se pueden comparar con --engine
+ENGINES = {
+    'threads': run_threads_engine,
+    # Longest-job-first con la latencia de las ejecuciones anteriores y concurrencia AIMD
+    'scheduled': run_scheduled_engine,
+}
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of values.
+
+    Args:
+        values (list): The values.
+        fraction (float): The percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float or None: The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def get_peak_rss_mb():
+    """
+    Peak resident set size of the current process in MB, or None if it cannot be measured.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB and macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def configure_environment(scheme, user, password, connect_timeout=None, read_timeout=None):
+    """
+    Point the collector at the simulator: scheme, credentials and URIs, with both caches disabled
+    so every run sends the same requests.
+    """
+    os.environ.update({
+        'API_SCHEME': scheme,
+        'USER_IP': user,
+        'PASSWORD_IP': password,
+        'URIS': f'{SYSTEM_INFO_CMD}|{LICENSE_INFO_CMD}',
+        'URIS_TTL': '0|0',
+        'API_KEY_TTL': '0',
+    })
+    if connect_timeout is not None:
+        os.environ['HTTP_CONNECT_TIMEOUT'] = str(connect_timeout)
+    if read_timeout is not None:
+        os.environ['HTTP_READ_TIMEOUT'] = str(read_timeout)
+
+
+def run_collection(inventory, engine='threads', max_workers=None, max_per_host=None):
+    """
+    Run the collector in this process against the devices of an inventory and measure it.
+
+    The per-request latency is taken from every HTTP response received by the shared session
+    (time until the headers arrive); requests without a response (refused connections and
+    timeouts) are counted as failed requests.
+
+    Args:
+        inventory (str): The CSV file with the device addresses.
+        engine (str, optional): The collection engine, see `ENGINES`. Defaults to 'threads'.
+        max_workers (int, optional): Devices processed at the same time. Defaults to `MAX_WORKERS`.
+        max_per_host (int, optional): Simultaneous requests per device. Defaults to `MAX_PER_HOST`.
+
+    Returns:
+        dict: The throughput, latency, connection and memory figures of the run.
+    """
+    import logging
+    logging.getLogger('info_logger').disabled = True
+    logging.getLogger('error_logger').disabled = True
+
+    from dataframes import read_from_csv
+    from device_data_collector import get_concurrency_settings
+    from http_client import close_session, connection_stats, get_session
+
+    list_ips = read_from_csv(inventory)
+    max_workers, max_per_host = get_concurrency_settings(max_workers, max_per_host)
+    raise_open_files_limit(max_workers * max_per_host * 2 + 1024)
+
+    latencies = []
+    close_session()
+    connection_stats.reset()
+    session, _ = get_session()
+    session.hooks['response'].append(lambda response, *args, **kwargs: latencies.append(response.elapsed.total_seconds()))
+
+    start = time.perf_counter()
+    # The collector prints its progress for every device
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        devices = ENGINES[engine](list_ips, max_workers, max_per_host)
+    elapsed = time.perf_counter() - start
+    stats = connection_stats.to_dict()
+    close_session()
+    # Unreachable and circuit-open devices are reported with their own status
+    ok = sum(1 for device in devices if device.status == 'ok')
+
+    return {
+        'engine': engine,
+        'max_workers': max_workers,
+        'max_per_host': max_per_host,
+        'devices': len(list_ips),
+        'devices_ok': ok,
+        'devices_skipped': len(devices) - ok,
+        'devices_failed': len(list_ips) - len(devices),
+        'elapsed_s': elapsed,
+        'devices_per_s': ok / elapsed if elapsed else None,
+        'requests': stats['requests'],
+        'responses': len(latencies),
+        'failed_requests': stats['requests'] - len(latencies),
+        'connections_opened': stats['connections_opened'],
+        'connections_reused': stats['connections_reused'],
+        'latency_ms': {
+            'p50': _to_ms(percentile(latencies, 0.50)),
+            'p90': _to_ms(percentile(latencies, 0.90)),
+            'p99': _to_ms(percentile(latencies, 0.99)),
+            'max': _to_ms(max(latencies) if latencies else None),
+            'mean': _to_ms(statistics.fmean(latencies) if latencies else None),
+        },
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+
+
+def _to_ms(value):
+    return value * 1000 if value is not None else None
+
+
+def format_result(result):
+    latency = result['latency_ms']
+    p50 = f"{latency['p50']:.1f}" if latency['p50'] is not None else '-'
+    p99 = f"{latency['p99']:.1f}" if latency['p99'] is not None else '-'
+    return (
+        f"{result['engine']:<10} workers={result['max_workers']:<4} per_host={result['max_per_host']:<3} "
+        f"{result['devices_ok']}/{result['devices']} devices ({result['devices_skipped']} skipped) in {result['elapsed_s']:.2f} s "
+        f"-> {result['devices_per_s']:.1f} devices/s | latency p50 {p50} ms p99 {p99} ms | "
+        f"requests {result['requests']} (failed {result['failed_requests']}) | "
+        f"connections {result['connections_opened']} | peak RSS {result['peak_rss_mb']:.1f} MB"
+    )
+
+
+def start_simulator(args, inventory):
+    """
+    Start the simulator in a child process and wait until it is listening.
+
+    Returns:
+        tuple: A tuple (process, ready) where `ready` is the ready event printed by the simulator.
+    """
+    command = [
+        sys.executable, SIMULATOR_SCRIPT, '--devices', str(args.devices), '--mode', args.mode, '--port', str(args.port),
+        '--latency', args.latency, '--error-rate', str(args.error_rate), '--timeout-rate', str(args.timeout_rate),
+        '--timeout-delay', str(args.timeout_delay), '--unreachable-rate', str(args.unreachable_rate),
+        '--filtered-rate', str(args.filtered_rate), '--hang-rate', str(args.hang_rate),
+        '--slow-rate', str(args.slow_rate), '--slow-latency', args.slow_latency,
+        '--response-kb', str(args.response_kb), '--licenses', str(args.licenses), '--seed', str(args.seed),
+        '--user', args.user, '--password', args.password, '--inventory', inventory
+    ]
+    if args.http:
+        command.append('--http')
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f"The simulator exited with code {process.returncode}")
+    return process, json.loads(line)
+
+
+def stop_simulator(process):
+    """
+    Stop the simulator and return the request counters it prints when it exits.
+    """
+    process.terminate()
+    try:
+        output, _ = process.communicate(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        output, _ = process.communicate()
+    for line in reversed(output.splitlines()):
+        event = json.loads(line)
+        if event.get('event') == 'stopped':
+            return event['stats']
+    return None
+
+
+def _parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _parse_ints(value):
+    return [int(item) for item in _parse_list(value)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test of the collector against the local PAN-OS simulator.')
+    simulator_group = parser.add_argument_group('simulator')
+    simulator_group.add_argument('--devices', type=int, default=1000, help='Number of simulated devices (default: 1000).')
+    simulator_group.add_argument('--mode', choices=('loopback', 'ports'), default='loopback', help='Address mode of the simulator.')
+    simulator_group.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port of the simulator (default: 8443).')
+    simulator_group.add_argument('--http', action='store_true', help='Use plain HTTP instead of HTTPS.')
+    simulator_group.add_argument('--latency', default=DEFAULT_LATENCY, help=f'Latency distribution (default: {DEFAULT_LATENCY}).')
+    simulator_group.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500.')
+    simulator_group.add_argument('--timeout-rate', type=float, default=0.0, help='Fraction of requests never answered.')
+    simulator_group.add_argument('--timeout-delay', type=float, default=30.0, help='Seconds a timed-out request is held.')
+    simulator_group.add_argument('--unreachable-rate', type=float, default=0.0, help='Fraction of devices that refuse connections.')
+    simulator_group.add_argument('--filtered-rate', type=float, default=0.0, help='Fraction of devices that drop connection attempts.')
+    simulator_group.add_argument('--hang-rate', type=float, default=0.0, help='Fraction of devices that accept connections but never answer.')
+    simulator_group.add_argument('--slow-rate', type=float, default=0.0, help='Fraction of devices that always answer with --slow-latency.')
+    simulator_group.add_argument('--slow-latency', default=DEFAULT_SLOW_LATENCY,
+                                 help=f'Latency distribution of the slow devices (default: {DEFAULT_SLOW_LATENCY}).')
+    simulator_group.add_argument('--response-kb', type=int, default=0, help='Extra KB in the system info response.')
+    simulator_group.add_argument('--licenses', type=int, default=10, help='Licenses per device (default: 10).')
+    simulator_group.add_argument('--seed', type=int, default=0, help='Seed of the simulator (default: 0).')
+    simulator_group.add_argument('--user', default='admin', help='Username of the simulated devices (default: admin).')
+    simulator_group.add_argument('--password', default='admin', help='Password of the simulated devices (default: admin).')
+
+    collector_group = parser.add_argument_group('collector')
+    collector_group.add_argument('--engine', type=_parse_list, default=['threads'],
+                                 help=f"Comma separated collection engines: {', '.join(ENGINES)} (default: threads).")
+    collector_group.add_argument('--max-workers', type=_parse_ints, default=[None], help='Comma separated MAX_WORKERS values.')
+    collector_group.add_argument('--max-per-host', type=_parse_ints, default=[None], help='Comma separated MAX_PER_HOST values.')
+    collector_group.add_argument('--connect-timeout', type=float, help='HTTP_CONNECT_TIMEOUT of the collector.')
+    collector_group.add_argument('--read-timeout', type=float, help='HTTP_READ_TIMEOUT of the collector.')
+    collector_group.add_argument('--inventory',
+                                 help='Run one configuration in this process against an already running simulator.')
+    collector_group.add_argument('--json', action='store_true', help='Print the result of --inventory as JSON.')
+    parser.add_argument('--output', default='load_test_results.json', help='File where the results are written.')
+    args = parser.parse_args(argv)
+
+    for engine in args.engine:
+        if engine not in ENGINES:
+            parser.error(f"Unknown engine: {engine}")
+    scheme = 'http' if args.http else 'https'
+
+    if args.inventory:
+        configure_environment(scheme, args.user, args.password, args.connect_timeout, args.read_timeout)
+        result = run_collection(args.inventory, args.engine[0], args.max_workers[0], args.max_per_host[0])
+        print(json.dumps(result) if args.json else format_result(result))
+        return 0
+
+    # Every configuration runs in its own process, so the peak RSS belongs to that run only
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        process, ready = start_simulator(args, os.path.join(work_dir, 'inventory.csv'))
+        print(
+            f"Simulator listening: {ready['devices']} devices ({ready['unreachable']} unreachable, "
+            f"{ready['filtered']} filtered) over {ready['scheme']}"
+        )
+        try:
+            for engine, max_workers, max_per_host in itertools.product(args.engine, args.max_workers, args.max_per_host):
+                command = [sys.executable, os.path.abspath(__file__), '--inventory', ready['inventory'], '--json',
+                           '--engine', engine, '--user', args.user, '--password', args.password]
+                if args.http:
+                    command.append('--http')
+                for flag, value in (('--max-workers', max_workers), ('--max-per-host', max_per_host),
+                                    ('--connect-timeout', args.connect_timeout), ('--read-timeout', args.read_timeout)):
+                    if value is not None:
+                        command.extend([flag, str(value)])
+                completed = subprocess.run(command, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    print(completed.stderr, file=sys.stderr)
+                    raise RuntimeError(f"The load test run failed with code {completed.returncode}")
+                result = json.loads(completed.stdout.splitlines()[-1])
+                results.append(result)
+                print(format_result(result))
+        finally:
+            simulator_stats = stop_simulator(process)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'simulator': {
+            'devices': args.devices, 'mode': args.mode, 'scheme': scheme, 'latency': args.latency,
+            'error_rate': args.error_rate, 'timeout_rate': args.timeout_rate, 'timeout_delay': args.timeout_delay,
+            'unreachable_rate': args.unreachable_rate, 'filtered_rate': args.filtered_rate, 'hang_rate': args.hang_rate,
+            'slow_rate': args.slow_rate, 'slow_latency': args.slow_latency, 'response_kb': args.response_kb, 'licenses': args.licenses,
+            'stats': simulator_stats
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,37 +1,143 @@
+import atexit
+import copy
+import datetime
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
 
-# Crea la carpeta para los logs si no existe
-log_folder = 'logs'
-if not os.path.exists(log_folder):
-    os.makedirs(log_folder)
+# Valores por defecto (se pueden sobreescribir en el .env)
+DEFAULT_LOG_DIR = 'logs'
+DEFAULT_LOG_FORMAT = 'text'
+DEFAULT_LOG_LEVEL = 'INFO'
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Campos estructurados que se pueden pasar con `extra=` y que el formato JSON incluye
+STRUCTURED_FIELDS = ('device', 'uri', 'latency', 'status')
 
 # Crea un logger para los errores
 error_logger = logging.getLogger('error_logger')
 error_logger.setLevel(logging.ERROR)
-
-# Crea un handler para escribir los errores en un archivo
-error_handler = logging.FileHandler(os.path.join(log_folder, 'error.log'), encoding='utf-8')
-error_handler.setLevel(logging.ERROR)
-
-# Crea un formatter y añádelo al handler
-error_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-error_handler.setFormatter(error_formatter)
-
-# Añade el handler al logger
-error_logger.addHandler(error_handler)
+error_logger.propagate = False
 
 # Crea un logger para la información del proceso
 info_logger = logging.getLogger('info_logger')
 info_logger.setLevel(logging.INFO)
+info_logger.propagate = False
+
+# Sin configure_logging() los mensajes se descartan
+for _logger in (error_logger, info_logger):
+    _logger.addHandler(logging.NullHandler())
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format every record as one JSON object per line, including the structured fields
+    (device, uri, latency, status) passed with `extra=`.
+    """
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves most of the formatting to the listener thread.
+
+    The standard QueueHandler formats the whole record in the calling thread so it can be
+    pickled; the queue here never leaves the process, so only the message is merged with its
+    arguments (which may be changed by the caller after the call) and the formatter, the
+    timestamp and the traceback are left to the listener.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener = None
+_queue_handler = None
+_lock = threading.Lock()
+
+
+def configure_logging(log_dir=None, log_format=None, level=None):
+    """
+    Create the log files and start the background thread that writes them.
+
+    The loggers only put the records in a queue; a QueueListener thread formats them and
+    writes `error.log` (error_logger) and `proceso.log` (info_logger), so the workers never
+    wait for the disk. Calling it again has no effect until `shutdown_logging` is called.
+
+    Args:
+        log_dir (str, optional): The directory of the log files. Defaults to `LOG_DIR` ('logs').
+        log_format (str, optional): 'text' or 'json'. Defaults to `LOG_FORMAT` ('text').
+        level (str, optional): Level of info_logger, e.g. 'WARNING' to drop the info messages.
+            Defaults to `LOG_LEVEL` ('INFO').
+
+    Returns:
+        logging.handlers.QueueListener: The running listener.
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return _listener
+        log_dir = log_dir or os.getenv('LOG_DIR', DEFAULT_LOG_DIR)
+        log_format = (log_format or os.getenv('LOG_FORMAT', DEFAULT_LOG_FORMAT)).lower()
+        level = (level or os.getenv('LOG_LEVEL', DEFAULT_LOG_LEVEL)).upper()
+
+        # Crea la carpeta para los logs si no existe
+        os.makedirs(log_dir, exist_ok=True)
+        formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+
+        # Cada archivo sólo recibe los mensajes de su logger, como antes
+        error_handler = logging.FileHandler(os.path.join(log_dir, 'error.log'), encoding='utf-8')
+        error_handler.setLevel(logging.ERROR)
+        error_handler.addFilter(logging.Filter(error_logger.name))
+        info_handler = logging.FileHandler(os.path.join(log_dir, 'proceso.log'), encoding='utf-8')
+        info_handler.setLevel(logging.INFO)
+        info_handler.addFilter(logging.Filter(info_logger.name))
+        for handler in (error_handler, info_handler):
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        _queue_handler = DeferredQueueHandler(log_queue)
+        for logger in (error_logger, info_logger):
+            logger.addHandler(_queue_handler)
+        info_logger.setLevel(level)
 
-# Crea un handler para escribir la información del proceso en un archivo
-info_handler = logging.FileHandler(os.path.join(log_folder, 'proceso.log'), encoding='utf-8')
-info_handler.setLevel(logging.INFO)
+        _listener = logging.handlers.QueueListener(log_queue, error_handler, info_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
 
-# Crea un formatter y añádelo al handler
-info_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-info_handler.setFormatter(info_formatter)
 
-# Añade el handler al logger
-info_logger.addHandler(info_handler)
\ No newline at end of file
+def shutdown_logging():
+    """
+    Write the queued records, stop the listener thread and close the log files.
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        for logger in (error_logger, info_logger):
+            logger.removeHandler(_queue_handler)
+        _listener = None
+        _queue_handler = None
@@ -1,62 +1,107 @@
 import os
-import json
-from dataframes import save_to_excel
-from device_data_collector import collect_data_from_devices
-from html_data_extractor import extract_and_process_html_tables
+from analytics import load_sites
+from device_data_collector import MissingCredentialsError, get_default_credentials
+from html_data_extractor import extract_release_json
+from logger import configure_logging
+from metrics import export_metrics, metrics
+from pipeline import run_pipeline
+from preferred_versions import enrich_devices, load_preferred_version_index
+from sinks import DEFAULT_OUTPUT_DIR, ExcelSink, abort_sinks, close_sinks, open_sinks
 from utils import get_most_recent_file, get_source_dir
 
 
 def update_device_with_json(json_file, devices):
-    with open(json_file, 'r') as file:
-        data = json.load(file)
-
-    for device in devices:
-        model_type = device.identify_model()
-        if model_type:
-            for item in data:
-                if model_type in item:
-                    prefered_version = item[model_type].get(device.sw_version.rsplit('.', 1)[0], [None])[0]
-                    if prefered_version and prefered_version != device.sw_version:
-                        device.sw_version_prefered = prefered_version
-                    else:
-                        device.sw_version_prefered = 'is up to date with prefered version'
-    return devices
+    """
+    Set the preferred software version of every device from the release notes JSON.
+
+    Args:
+        json_file (str): The path of the JSON extracted from the release notes.
+        devices (list): The list of Device objects.
+
+    Returns:
+        list: The same list of devices, enriched.
+    """
+    index = load_preferred_version_index(json_file)
+    return enrich_devices(devices, index)
 
 
 def process_json_file(json_source_dir):
-    while not os.path.exists(json_source_dir) or not os.listdir(json_source_dir):
-        print('No JSON files found. Attempting to extract data from HTML tables.')
-        is_completed = extract_and_process_html_tables()
-        
-        if is_completed:
-            print('Data extracted from HTML tables and saved in JSON file.')
-        else:
-            print('Could not extract data from HTML tables. Check the logs for more information.')
-            return None
+    # The JSON is keyed by the hash of the HTML, so an unchanged page is not parsed again
+    json_file = extract_release_json()
+    if json_file:
+        print('Release data of the current HTML file is available.')
+        return json_file
+
+    if os.path.exists(json_source_dir) and os.listdir(json_source_dir):
+        print('Could not extract data from HTML tables. Using the most recent JSON file.')
+        return get_most_recent_file(json_source_dir, '.json')
+
+    print('Could not extract data from HTML tables. Check the logs for more information.')
+    return None
+
 
-    json_file = get_most_recent_file(json_source_dir, '.json')
-    return json_file
+def collect_devices(json_file):
+    """
+    Collect the devices of the most recent inventory and write them to the outputs.
+
+    The inventory and the credentials are checked before the outputs are opened, and the outputs
+    of a failed run are discarded (see `sinks.abort_sinks`), so the previous report, history run
+    and delta baseline are kept.
+
+    Args:
+        json_file (str): The path of the JSON extracted from the release notes.
+    """
+    csv_file_path = get_most_recent_file(get_source_dir(), '.csv')
+    if not csv_file_path:
+        print('No inventory found. Add a CSV file to the source directory.')
+        return
+    try:
+        get_default_credentials()
+    except MissingCredentialsError as e:
+        print(f'{e} Exiting.')
+        return
+
+    # Every device flows from the inventory to the output sinks as soon as it is collected and enriched
+    index = load_preferred_version_index(json_file)
+    sinks = open_sinks()
+    # The Excel report is spooled to JSONL while the devices arrive and built when the sink is closed
+    spool_path = os.path.join(os.getenv('OUTPUT_DIR', DEFAULT_OUTPUT_DIR), 'output_report.jsonl')
+    # The compliance summaries (per model, train, content age and site) load the whole fleet in a
+    # DataFrame and the sites of the whole inventory, outside the memory ceiling, so they are opt-in
+    compliance_sheets = os.getenv('COMPLIANCE_SHEETS', 'false').strip().lower() in ('1', 'true', 'yes')
+    sinks.append(ExcelSink(
+        'output.xlsx', spool_path=spool_path, compliance_sheets=compliance_sheets, index=index,
+        sites=load_sites(csv_file_path) if compliance_sheets else None
+    ))
+    stats = None
+    try:
+        stats = run_pipeline(csv_file_path, sinks, enrich=lambda device: enrich_devices([device], index))
+    finally:
+        if stats is None:
+            abort_sinks(sinks)
+        else:
+            with metrics.timer('panos_export_seconds', 'output.xlsx', output='excel_report', stage='total'):
+                close_sinks(sinks)
+    if stats['written']:
+        print(f"{stats['written']} devices collected, updated with JSON data and saved to the Excel file.")
+    else:
+        print('No devices found. Check the logs for more information.')
 
 
 def main():
+    configure_logging()
     print('Starting main process...')
     json_source_dir = get_source_dir('json')
-    json_file = process_json_file(json_source_dir)
+    with metrics.timer('panos_release_extract_seconds'):
+        json_file = process_json_file(json_source_dir)
     
     if json_file:
         print('Proceeding to collect data from devices...')
-        devices = collect_data_from_devices(get_most_recent_file(get_source_dir(), '.csv'))
-        if devices:
-            print('Data collected from devices. Updating devices with JSON data...')
-            processed_devices = update_device_with_json(json_file, devices)
-            print('Devices updated with JSON data. Saving data to Excel file...')
-            save_to_excel(processed_devices, 'output.xlsx')
-            print('Data saved to Excel file.')
-        else:
-            print('No devices found. Check the logs for more information.')
+        collect_devices(json_file)
     else:
         print('Failed to process JSON file. Exiting.')
-    
+    # Timing and throughput of every phase of the run
+    export_metrics()
 
 
 if __name__ == "__main__":
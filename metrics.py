@@ -0,0 +1,313 @@
+# Importaciones de bibliotecas estándar de Python
+import bisect
+import datetime
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Importaciones locales
+from logger import info_logger, error_logger
+
+DEFAULT_METRICS_DIR = 'output'
+PROMETHEUS_FILENAME = 'metrics.prom'
+
+# Límites (le) de los buckets de los histogramas
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Observaciones más lentas (o más grandes) que se guardan por serie para encontrar equipos y URIs lentos
+SLOWEST_SIZE = 10
+
+# Descripción de cada métrica (# HELP del formato de Prometheus)
+METRIC_HELP = {
+    'panos_keygen_seconds': 'Time to generate the API key of a device.',
+    'panos_request_seconds': 'Time to send a request and receive the whole response, per URI.',
+    'panos_response_bytes': 'Size of the (decompressed) response body, per URI.',
+    'panos_xml_parse_seconds': 'CPU time spent parsing the XML response, per URI.',
+    'panos_request_errors_total': 'Requests that failed or returned an unsuccessful response, per URI.',
+    'panos_device_seconds': 'Total time to process a device.',
+    'panos_device_build_seconds': 'Time to build the Device object from the parsed responses.',
+    'panos_enrich_seconds': 'Time to set the preferred version of the devices.',
+    'panos_export_seconds': 'Time to write the devices to an output.',
+    'panos_release_extract_seconds': 'Time to extract the preferred versions from the release notes.',
+    'panos_probe_seconds': 'Time of the TCP reachability probe of a host.',
+    'panos_devices_total': 'Devices processed, per status.',
+    'panos_delta_changes_total': 'Changes since the previous snapshot of the fleet, per kind.',
+    'panos_run_duration_seconds': 'Duration of the collection.',
+    'panos_run_devices': 'Devices in the input list of the collection.',
+    'panos_run_devices_per_second': 'Devices successfully processed per second.',
+    'panos_http_requests': 'HTTP requests sent by the shared session.',
+    'panos_http_connections_opened': 'Connections opened by the shared session.',
+    'panos_http_connections_reused': 'Requests that reused a pooled connection.',
+    'panos_scheduler_concurrency': 'Devices processed at the same time at the end of the collection.',
+    'panos_daemon_polls_total': 'Collections run by the daemon.',
+    'panos_pipeline_memory_pauses_total': 'Times the pipeline stopped submitting devices above the memory ceiling.',
+    'panos_pipeline_peak_rss_mb': 'Peak resident memory of the process during the pipeline, in MB.',
+    'panos_pipeline_first_result_seconds': 'Seconds from the start of the pipeline to the first device written.',
+    'panos_scheduler_backoffs_total': 'Times the scheduler reduced the concurrency after a failed or slow device.',
+}
+
+
+class Histogram:
+    """
+    Cumulative histogram with Prometheus semantics, plus the slowest observations and their exemplars.
+
+    Args:
+        buckets (tuple): The upper bounds of the buckets, in increasing order (+Inf is implicit).
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._slowest = []
+
+    def observe(self, value, exemplar=None):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if exemplar is not None:
+            entry = (value, exemplar)
+            if len(self._slowest) < SLOWEST_SIZE:
+                heapq.heappush(self._slowest, entry)
+            elif value > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def cumulative_counts(self):
+        """
+        Return the cumulative count of every bucket, the last one being +Inf.
+        """
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile by linear interpolation inside its bucket, like `histogram_quantile`.
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        lower = 0.0
+        previous = 0
+        for bound, cumulative in zip(self.buckets + (math.inf,), self.cumulative_counts()):
+            if cumulative >= rank:
+                if bound == math.inf:
+                    return self.max
+                in_bucket = cumulative - previous
+                value = lower + (bound - lower) * ((rank - previous) / in_bucket if in_bucket else 0)
+                return min(max(value, self.min), self.max)
+            lower, previous = bound, cumulative
+        return self.max
+
+    def to_dict(self):
+        cumulative = self.cumulative_counts()
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {_format_bound(bound): count for bound, count in zip(self.buckets + (math.inf,), cumulative)},
+            'slowest': [{'value': value, 'exemplar': exemplar} for value, exemplar in sorted(self._slowest, reverse=True)]
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of the histograms, counters and gauges of a run.
+
+    Every series is identified by its metric name and its labels.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+            self.started_at = time.time()
+
+    def observe(self, name, value, exemplar=None, **labels):
+        """
+        Record a value in a histogram. Metrics ending in `_bytes` use size buckets, the rest time buckets.
+
+        Args:
+            name (str): The metric name.
+            value (float): The observed value.
+            exemplar (str, optional): What the value belongs to (e.g. the device IP), kept for the slowest values.
+            **labels: The labels of the series.
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(SIZE_BUCKETS if name.endswith('_bytes') else TIME_BUCKETS)
+            histogram.observe(value, exemplar)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    @contextmanager
+    def timer(self, name, exemplar=None, **labels):
+        """
+        Context manager that records the time spent inside it in a histogram.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, exemplar, **labels)
+
+    def to_dict(self):
+        """
+        Return the JSON summary of the run: the statistics of every histogram and the counters and gauges.
+        """
+        with self._lock:
+            summary = {
+                'started_at': datetime.datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+                'histograms': {}, 'counters': {}, 'gauges': {}
+            }
+            for section, series in (('histograms', self.histograms), ('counters', self.counters), ('gauges', self.gauges)):
+                for (name, labels), value in sorted(series.items()):
+                    entry = value.to_dict() if isinstance(value, Histogram) else {'value': value}
+                    summary[section].setdefault(name, []).append({'labels': dict(labels), **entry})
+        return summary
+
+    def to_prometheus(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for metric_type, series in (('histogram', self.histograms), ('counter', self.counters), ('gauge', self.gauges)):
+                current = None
+                for (name, labels), value in sorted(series.items()):
+                    if name != current:
+                        current = name
+                        if name in METRIC_HELP:
+                            lines.append(f'# HELP {name} {METRIC_HELP[name]}')
+                        lines.append(f'# TYPE {name} {metric_type}')
+                    if metric_type != 'histogram':
+                        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                        continue
+                    for bound, cumulative in zip(value.buckets + (math.inf,), value.cumulative_counts()):
+                        bucket_labels = labels + (('le', _format_bound(bound)),)
+                        lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value.sum)}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {value.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def uri_label(uri):
+    """
+    Short label of a URI (command), e.g. 'show system info' for '<show><system><info></info></system></show>'.
+    """
+    if not uri:
+        return 'unknown'
+    tags = re.findall(r'<([A-Za-z][^\s/>]*)', uri)
+    return ' '.join(tags) if tags else uri
+
+
+# Registro compartido por todo el proceso
+metrics = MetricsRegistry()
+
+
+def export_metrics(output_dir=None, registry=None):
+    """
+    Write the JSON summary (`metrics_<timestamp>.json`) and the Prometheus text file (`metrics.prom`).
+
+    The Prometheus file keeps the same name between runs, so it can be picked up by the
+    textfile collector of node_exporter; it is replaced atomically.
+
+    Args:
+        output_dir (str, optional): The output directory. Defaults to `METRICS_DIR` ('output').
+        registry (MetricsRegistry, optional): The registry to export. Defaults to the shared one.
+
+    Returns:
+        tuple: A tuple (json_path, prometheus_path), or None if the files could not be written.
+    """
+    registry = registry or metrics
+    if output_dir is None:
+        output_dir = os.getenv('METRICS_DIR', DEFAULT_METRICS_DIR)
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    json_path = os.path.join(output_dir, f'metrics_{timestamp}.json')
+    prometheus_path = os.path.join(output_dir, PROMETHEUS_FILENAME)
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(json_path, 'w', encoding='utf-8') as file:
+            json.dump(registry.to_dict(), file, indent=4)
+        temp_path = f'{prometheus_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(registry.to_prometheus())
+        os.replace(temp_path, prometheus_path)
+    except OSError as e:
+        error_logger.error("Could not write the metrics to %s: %s", output_dir, e)
+        return None
+    info_logger.info("Metrics written to %s and %s", json_path, prometheus_path)
+    return json_path, prometheus_path
+
+
+class MeteredChunks:
+    """
+    Iterator over the byte chunks of a response that counts the bytes and the time spent waiting
+    for them, so the parse time of a streamed response can be separated from the network time.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.bytes = 0
+        self.wait_seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            chunk = next(self._chunks)
+        finally:
+            self.wait_seconds += time.perf_counter() - start
+        self.bytes += len(chunk)
+        return chunk
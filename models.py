@@ -1,25 +1,74 @@
+from array import array
 from datetime import datetime
+from functools import lru_cache
+
+# Familia (sección de las release notes) de cada prefijo de modelo
+MODEL_FAMILIES = {
+    'PA': 'PAN-OS for Firewalls',
+    'VM': 'Panorama on VM / M-series',
+}
+
+LICENSE_ISSUED_FORMAT = "%B %d, %Y"
+DATE_FORMAT = "%d/%m/%Y"
+DATETIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# Estado de cada dispositivo en el reporte
+STATUS_OK = 'ok'
+STATUS_UNREACHABLE = 'unreachable'
+STATUS_CIRCUIT_OPEN = 'circuit_open'
+
+
+@lru_cache(maxsize=None)
+def identify_model_family(model):
+    # The family only depends on the first two characters of the model
+    if not model:
+        return None
+    return MODEL_FAMILIES.get(model[0:2])
+
+
+@lru_cache(maxsize=None)
+def parse_license_date(issued):
+    # A fleet only has a handful of distinct issue dates, so every string is parsed once
+    return datetime.strptime(issued, LICENSE_ISSUED_FORMAT).date()
+
+
+@lru_cache(maxsize=None)
+def format_date(value):
+    return value.strftime(DATE_FORMAT)
+
+
+def format_datetime(value):
+    return value.strftime(DATETIME_FORMAT) if value is not None else None
+
 
 class License:
+    __slots__ = ('feature', 'issued', 'expired')
+
     def __init__(self, feature, issued, expired):
         self.feature = feature
-        self.issued = datetime.strptime(issued, "%B %d, %Y").strftime("%d/%m/%Y")
-        self.expired = True if expired == 'yes' else False
+        self.issued = parse_license_date(issued)
+        self.expired = expired == 'yes'
 
     def to_dict(self):
         return {
             'feature': self.feature,
-            'issued': self.issued,
+            'issued': format_date(self.issued),
             'expired': self.expired
-        }    
-    
+        }
+
     def __str__(self):
-        return f"Feature: {self.feature}\nIssued: {self.issued}\nExpired: {self.expired}"        
+        return f"Feature: {self.feature}\nIssued: {format_date(self.issued)}\nExpired: {self.expired}"
 
 
 class Device:
+    __slots__ = (
+        'create_report_datetime', 'hostname', 'model', 'serial', 'ip_address', 'sw_version', 'sw_version_prefered',
+        'gpc_version', 'app_version', 'av_version', 'threat_version', 'wildfire_version', 'url_filtering_version',
+        'device_certificate_status', 'licenses', 'data_fetched_at', 'cached_sections', 'status'
+    )
+
     def __init__(self, hostname, model, serial, ip_address, sw_version, gpc_version, app_version, av_version, threat_version, wildfire_version, url_filtering_version, device_certificate_status):
-        self.create_report_datetime = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        self.create_report_datetime = datetime.now()
         self.hostname = hostname
         self.model = model
         self.serial = serial
@@ -34,25 +83,50 @@ class Device:
         self.url_filtering_version = url_filtering_version
         self.device_certificate_status = device_certificate_status
         self.licenses = []
-    
+        # Fecha en la que se obtuvo cada sección de datos y secciones servidas desde la caché
+        self.data_fetched_at = {}
+        self.cached_sections = []
+        self.status = STATUS_OK
+
+    @classmethod
+    def skipped(cls, ip_address, status):
+        """
+        Create the report entry of a device whose data could not be collected.
+
+        Args:
+            ip_address (str): The address of the device in the input list.
+            status (str): Why it was skipped, e.g. `STATUS_UNREACHABLE` or `STATUS_CIRCUIT_OPEN`.
+
+        Returns:
+            Device: A device with only the IP address and the status.
+        """
+        device = cls(None, None, None, ip_address, None, None, None, None, None, None, None, None)
+        device.status = status
+        return device
+
     def identify_model(self):
-        type_model = self.model[0:2]
-        match type_model:
-            case 'PA':
-                type_model = 'PAN-OS for Firewalls'
-            case 'VM':
-                type_model = 'Panorama on VM / M-series'
-            case _:
-                type_model = None
-        return type_model
-    
+        return identify_model_family(self.model)
+
+    def set_data_fetched_at(self, fetched_at):
+        """
+        Record when every section of the device data was retrieved and which ones came from the cache.
+
+        Args:
+            fetched_at (dict): A dictionary mapping every section name to a tuple (timestamp, from_cache).
+        """
+        self.data_fetched_at = {
+            section: datetime.fromtimestamp(timestamp)
+            for section, (timestamp, _) in fetched_at.items()
+        }
+        self.cached_sections = [section for section, (_, from_cache) in fetched_at.items() if from_cache]
+
     def add_license(self, feature, issued, expired):
         self.licenses.append(License(feature, issued, expired))
 
     def to_dict(self):
         licenses_dict = [license.to_dict() for license in self.licenses]
         return {
-            'create_report_datetime': self.create_report_datetime,
+            'create_report_datetime': format_datetime(self.create_report_datetime),
             'hostname': self.hostname,
             'model': self.model,
             'serial': self.serial,
@@ -66,6 +140,9 @@ class Device:
             'wildfire_version': self.wildfire_version,
             'url_filtering_version': self.url_filtering_version,
             'device_certificate_status': self.device_certificate_status,
+            'data_fetched_at': {section: format_datetime(value) for section, value in self.data_fetched_at.items()},
+            'cached_sections': ', '.join(self.cached_sections),
+            'status': self.status,
             'licenses': licenses_dict
         }
 
@@ -75,4 +152,171 @@ class Device:
                 f"Serial: {self.serial}\nGlobal Protect Client Package Version: {self.gpc_version}\n"
                 f"App Version: {self.app_version}\nAV Version: {self.av_version}\nThreat Version: {self.threat_version}\n"
                 f"Wildfire Version: {self.wildfire_version}\nURL Filtering Version: {self.url_filtering_version}\n"
-                f"Device Certificate Status: {self.device_certificate_status}\nLicenses:\n{licenses_str}")
\ No newline at end of file
+                f"Device Certificate Status: {self.device_certificate_status}\nLicenses:\n{licenses_str}")
+
+
+class FleetTable:
+    """
+    Columnar storage of a fleet of devices.
+
+    Every device attribute is a column (a list for text, an `array` for numbers and dates) and
+    the licenses live in a child table whose `device_index` column points to the device row.
+    Exporters can consume the columns directly instead of converting every Device to a dict.
+    """
+    # Columnas de texto de cada dispositivo
+    TEXT_COLUMNS = (
+        'hostname', 'model', 'serial', 'ip_address', 'sw_version', 'sw_version_prefered', 'gpc_version',
+        'app_version', 'av_version', 'threat_version', 'wildfire_version', 'url_filtering_version',
+        'device_certificate_status', 'cached_sections', 'status'
+    )
+    # Columnas que Device.to_dict pone después de data_fetched_at
+    TAIL_COLUMNS = ('cached_sections', 'status')
+
+    def __init__(self):
+        self.text_columns = {name: [] for name in self.TEXT_COLUMNS}
+        # Timestamps (segundos) del reporte y de cada sección de datos, NaN si no existe
+        self.create_report_datetime = array('d')
+        self.data_fetched_at = {}
+        # Tabla hija de licencias
+        self.license_device_index = array('l')
+        self.license_feature = []
+        self.license_issued = array('l')
+        self.license_expired = array('b')
+
+    def __len__(self):
+        return len(self.create_report_datetime)
+
+    @classmethod
+    def from_devices(cls, devices):
+        table = cls()
+        for device in devices:
+            table.append(device)
+        return table
+
+    def append(self, device):
+        """
+        Append a Device to the table.
+
+        Args:
+            device (Device): The device to append.
+
+        Returns:
+            int: The row index of the new device.
+        """
+        index = len(self)
+        for name, column in self.text_columns.items():
+            value = getattr(device, name)
+            if name == 'cached_sections':
+                value = ', '.join(value)
+            column.append(value)
+        self.create_report_datetime.append(device.create_report_datetime.timestamp())
+        # Keep every data_fetched_at column with one value per device
+        for section in device.data_fetched_at:
+            if section not in self.data_fetched_at:
+                self.data_fetched_at[section] = array('d', [float('nan')] * index)
+        for section, column in self.data_fetched_at.items():
+            value = device.data_fetched_at.get(section)
+            column.append(value.timestamp() if value is not None else float('nan'))
+        for license in device.licenses:
+            self.license_device_index.append(index)
+            self.license_feature.append(license.feature)
+            self.license_issued.append(license.issued.toordinal())
+            self.license_expired.append(license.expired)
+        return index
+
+    def set_column(self, name, values):
+        """
+        Replace a text column, e.g. `sw_version_prefered` after the enrichment.
+        """
+        values = list(values)
+        if len(values) != len(self):
+            raise ValueError(f"Column {name} has {len(values)} values, expected {len(self)}")
+        self.text_columns[name] = values
+
+    def columns(self):
+        """
+        Return the device columns in the same order as `Device.to_dict`, with the dates as text.
+
+        Returns:
+            dict: A dictionary mapping every column name to its list of values.
+        """
+        columns = {'create_report_datetime': [_format_timestamp(value) for value in self.create_report_datetime]}
+        for name in self.TEXT_COLUMNS:
+            if name not in self.TAIL_COLUMNS:
+                columns[name] = self.text_columns[name]
+        for section, values in self.data_fetched_at.items():
+            columns[f'data_fetched_at_{section}'] = [_format_timestamp(value) for value in values]
+        for name in self.TAIL_COLUMNS:
+            columns[name] = self.text_columns[name]
+        return columns
+
+    def license_columns(self):
+        """
+        Return the license child table in long format, with the dates as text.
+
+        Returns:
+            dict: A dictionary with the 'device_index', 'feature', 'issued' and 'expired' columns.
+        """
+        return {
+            'device_index': self.license_device_index,
+            'feature': self.license_feature,
+            'issued': [_format_ordinal(value) for value in self.license_issued],
+            'expired': [bool(value) for value in self.license_expired]
+        }
+
+    def as_numpy(self):
+        """
+        Return the numeric columns as NumPy arrays without copying them.
+
+        Returns:
+            dict: A dictionary mapping the column names to NumPy arrays.
+        """
+        import numpy as np
+
+        arrays = {
+            'create_report_datetime': np.frombuffer(self.create_report_datetime, dtype=np.float64),
+            'license_device_index': np.frombuffer(self.license_device_index, dtype=np.dtype(f'i{self.license_device_index.itemsize}')),
+            'license_issued': np.frombuffer(self.license_issued, dtype=np.dtype(f'i{self.license_issued.itemsize}')),
+            'license_expired': np.frombuffer(self.license_expired, dtype=np.int8).astype(bool),
+        }
+        for section, values in self.data_fetched_at.items():
+            arrays[f'data_fetched_at_{section}'] = np.frombuffer(values, dtype=np.float64)
+        return arrays
+
+    def iter_dicts(self):
+        """
+        Yield every device as a dictionary with the same shape as `Device.to_dict`.
+        """
+        licenses_by_device = {}
+        license_columns = self.license_columns()
+        for position, index in enumerate(license_columns['device_index']):
+            licenses_by_device.setdefault(index, []).append({
+                'feature': license_columns['feature'][position],
+                'issued': license_columns['issued'][position],
+                'expired': license_columns['expired'][position]
+            })
+        for index in range(len(self)):
+            row = {'create_report_datetime': _format_timestamp(self.create_report_datetime[index])}
+            for name in self.TEXT_COLUMNS:
+                if name not in self.TAIL_COLUMNS:
+                    row[name] = self.text_columns[name][index]
+            row['data_fetched_at'] = {
+                section: _format_timestamp(values[index])
+                for section, values in self.data_fetched_at.items() if values[index] == values[index]
+            }
+            for name in self.TAIL_COLUMNS:
+                row[name] = self.text_columns[name][index]
+            row['licenses'] = licenses_by_device.get(index, [])
+            yield row
+
+
+def _format_timestamp(value):
+    # NaN marks a missing value
+    if value != value:
+        return None
+    return format_datetime(datetime.fromtimestamp(value))
+
+
+@lru_cache(maxsize=None)
+def _format_ordinal(value):
+    return format_date(datetime.fromordinal(value).date())
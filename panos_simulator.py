@@ -0,0 +1,535 @@
+# Importaciones de bibliotecas estándar de Python
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import selectors
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+# Importaciones locales
+from benchmark import SYNTHETIC_MODELS, SYNTHETIC_VERSIONS, make_license_xml, make_system_info_xml
+from xml_parser import normalize_uri
+
+# Comandos `type=op` que responde el simulador
+SYSTEM_INFO_CMD = '<show><system><info></info></system></show>'
+LICENSE_INFO_CMD = '<request><license><info></info></license></request>'
+
+DEFAULT_PORT = 8443
+DEFAULT_LATENCY = 'lognormal:0.05,0.5'
+DEFAULT_TIMEOUT_DELAY = 30.0
+DEFAULT_SLOW_LATENCY = 'fixed:2'
+
+# Respuestas de error con el mismo formato que PAN-OS
+INVALID_CREDENTIAL_XML = b"<response status = 'error' code = '403'><result><msg>Invalid Credential</msg></result></response>"
+UNKNOWN_COMMAND_XML = b"<response status = 'error' code = '17'><msg><line>Unknown command</line></msg></response>"
+BAD_REQUEST_XML = b"<response status = 'error' code = '400'><result><msg>Missing or invalid request type</msg></result></response>"
+INTERNAL_ERROR_XML = b"<response status = 'error'><msg><line>Internal error</line></msg></response>"
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution specification.
+
+    Supported specifications (values in seconds):
+    - 'fixed:0.05'
+    - 'uniform:0.01,0.2'
+    - 'lognormal:0.05,0.5' (median and sigma, the long tail of real devices)
+    - 'exponential:0.05' (mean)
+
+    Args:
+        spec (str): The distribution specification.
+
+    Returns:
+        callable: A function that receives a `random.Random` and returns a latency in seconds.
+
+    Raises:
+        ValueError: If the specification is not valid.
+    """
+    name, _, values = spec.partition(':')
+    try:
+        params = [float(value) for value in values.split(',') if value]
+    except ValueError:
+        raise ValueError(f"Invalid latency specification: {spec}")
+    if name == 'fixed' and len(params) == 1:
+        return lambda rng: params[0]
+    if name == 'uniform' and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if name == 'lognormal' and len(params) == 2 and params[0] > 0:
+        mu = math.log(params[0])
+        return lambda rng: rng.lognormvariate(mu, params[1])
+    if name == 'exponential' and len(params) == 1 and params[0] > 0:
+        return lambda rng: rng.expovariate(1 / params[0])
+    raise ValueError(f"Invalid latency specification: {spec}")
+
+
+def generate_addresses(count, mode='loopback', port=DEFAULT_PORT):
+    """
+    Generate the listening addresses of the simulated devices.
+
+    Args:
+        count (int): The number of devices.
+        mode (str, optional): 'loopback' gives every device its own 127.x.y.z address on the same
+            port (Linux routes the whole 127.0.0.0/8 to the loopback interface); 'ports' uses
+            127.0.0.1 with consecutive ports, for systems that only have 127.0.0.1. Defaults to 'loopback'.
+        port (int, optional): The port, or the first port in 'ports' mode. Defaults to 8443.
+
+    Returns:
+        list: A list of (host, port) tuples.
+    """
+    if mode == 'ports':
+        return [('127.0.0.1', port + index) for index in range(count)]
+    return [(f'127.{1 + index // 64516}.{1 + index // 254 % 254}.{1 + index % 254}', port) for index in range(count)]
+
+
+def raise_open_files_limit(needed):
+    """
+    Raise the soft limit of open files of the process (up to the hard limit) if it is below `needed`.
+
+    Returns:
+        int: The resulting soft limit, or None if the platform has no `resource` module.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        soft = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    return soft
+
+
+def create_self_signed_cert(directory):
+    """
+    Create a self-signed certificate for the simulator with the openssl command line tool.
+
+    Args:
+        directory (str): The directory where the certificate and the key are written.
+
+    Returns:
+        tuple: A tuple (cert_file, key_file).
+
+    Raises:
+        RuntimeError: If openssl is not available.
+    """
+    cert_file = os.path.join(directory, 'simulator.crt')
+    key_file = os.path.join(directory, 'simulator.key')
+    try:
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2',
+             '-subj', '/CN=panos-simulator', '-keyout', key_file, '-out', cert_file],
+            check=True, capture_output=True
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"Could not create a self-signed certificate with openssl ({e}); use --cert and --key") from e
+    return cert_file, key_file
+
+
+class SimulatedDevice:
+    """
+    A simulated firewall: its identity, its API key and its pre-rendered responses.
+    """
+    __slots__ = ('index', 'address', 'serial', 'api_key', 'responses', 'hangs', 'latency')
+
+    def __init__(self, index, address, user, password, rng, response_kb=0, licenses=10, hangs=False, latency=None):
+        self.index = index
+        self.address = address
+        # Accepts connections but never answers
+        self.hangs = hangs
+        # Own latency distribution (e.g. a branch behind a WAN link), None for the fleet default
+        self.latency = latency
+        self.serial = f'{index:012d}'
+        self.api_key = hashlib.sha256(f'{user}:{password}:{self.serial}'.encode('utf-8')).hexdigest()
+        self.responses = {
+            SYSTEM_INFO_CMD: make_system_info_xml(
+                self.serial, rng.choice(SYNTHETIC_MODELS), rng.choice(SYNTHETIC_VERSIONS), response_kb
+            ),
+            LICENSE_INFO_CMD: make_license_xml(licenses),
+        }
+
+    def keygen_response(self):
+        return f"<response status = 'success'><result><key>{self.api_key}</key></result></response>".encode('utf-8')
+
+
+class SimulatorStats:
+    """
+    Thread-safe counters of the requests answered by the simulator.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'keygen': 0, 'op': 0, 'errors': 0, 'timeouts': 0, 'auth_errors': 0}
+
+    def add(self, *names):
+        with self._lock:
+            for name in names:
+                self.counts[name] += 1
+
+    def to_dict(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+class PanOSSimulator:
+    """
+    The behaviour of the simulated fleet: it answers `type=keygen` and `type=op&cmd=...` requests
+    like the PAN-OS XML API, with configurable latency, error and timeout rates.
+
+    Args:
+        devices (dict): The SimulatedDevice of every listening (host, port) address.
+        user (str): The valid username.
+        password (str): The valid password.
+        latency (callable): Latency distribution, see `parse_latency`.
+        error_rate (float): Fraction of requests answered with HTTP 500.
+        timeout_rate (float): Fraction of requests that are never answered.
+        timeout_delay (float): Seconds a timed-out request holds the connection before closing it.
+        seed (int): Seed of the random generator.
+    """
+    def __init__(self, devices, user, password, latency, error_rate=0.0, timeout_rate=0.0,
+                 timeout_delay=DEFAULT_TIMEOUT_DELAY, seed=0):
+        self.devices = devices
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+        self.rng = random.Random(seed)
+        self.stats = SimulatorStats()
+
+    def respond(self, address, params):
+        """
+        Build the answer to an API request.
+
+        Args:
+            address (tuple): The (host, port) address the request was received on.
+            params (dict): The query parameters of the request, as returned by `parse_qs`.
+
+        Returns:
+            tuple: A tuple (http_status, body, delay). `body` is None if the request must time out.
+        """
+        self.stats.add('requests')
+        device = self.devices.get(address)
+        latency = device.latency if device is not None and device.latency is not None else self.latency
+        delay = max(0.0, latency(self.rng))
+        draw = self.rng.random()
+        if draw < self.timeout_rate or (device is not None and device.hangs):
+            self.stats.add('timeouts')
+            return 0, None, self.timeout_delay
+        if draw < self.timeout_rate + self.error_rate:
+            self.stats.add('errors')
+            return 500, INTERNAL_ERROR_XML, delay
+
+        request_type = _first(params, 'type')
+        if device is None:
+            return 400, BAD_REQUEST_XML, delay
+        if request_type == 'keygen':
+            self.stats.add('keygen')
+            if _first(params, 'user') != self.user or _first(params, 'password') != self.password:
+                self.stats.add('auth_errors')
+                return 403, INVALID_CREDENTIAL_XML, delay
+            return 200, device.keygen_response(), delay
+        if request_type == 'op':
+            self.stats.add('op')
+            if _first(params, 'key') != device.api_key:
+                self.stats.add('auth_errors')
+                return 403, INVALID_CREDENTIAL_XML, delay
+            body = device.responses.get(normalize_uri(_first(params, 'cmd') or ''))
+            return (200, body, delay) if body else (200, UNKNOWN_COMMAND_XML, delay)
+        return 400, BAD_REQUEST_XML, delay
+
+
+def _first(params, name):
+    values = params.get(name)
+    return values[0] if values else None
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler of the simulator. PAN-OS accepts the parameters in the query string of GET
+    and POST requests and in the form body of POST requests.
+    """
+    server_version = 'PanOSSimulator/1.0'
+    # HTTP/1.1 keeps the connections alive, like the management interface of the firewalls
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without TCP_NODELAY every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.handle_api_request()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.handle_api_request(self.rfile.read(length) if length else b'')
+
+    def handle_api_request(self, body=b''):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        if body:
+            params.update(parse_qs(body.decode('utf-8', 'replace')))
+        address = self.connection.getsockname()[:2]
+        status, payload, delay = self.server.simulator.respond(address, params)
+        time.sleep(delay)
+        if payload is None:
+            # Timed out request: the connection is closed without an answer
+            self.close_connection = True
+            return
+        if url.path.rstrip('/') != '/api':
+            status, payload = 404, BAD_REQUEST_XML
+        headers = {'Content-Type': 'application/xml; charset=UTF-8'}
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            payload = gzip.compress(payload, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class SimulatorServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP(S) server listening on many addresses at the same time, one per simulated device.
+
+    The listening sockets are multiplexed with a selector in a single thread and every
+    connection is handled in its own thread.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, addresses, simulator, ssl_context=None, verbose=False, filtered=()):
+        self.simulator = simulator
+        self.ssl_context = ssl_context
+        self.verbose = verbose
+        self._stopped = threading.Event()
+        self.filtered_sockets = []
+        super().__init__(addresses[0], SimulatorRequestHandler)
+        self.listeners = [self.socket]
+        try:
+            for address in addresses[1:]:
+                listener = socket.socket(self.address_family, self.socket_type)
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                listener.bind(address)
+                listener.listen(self.request_queue_size)
+                self.listeners.append(listener)
+            for address in filtered:
+                self.filtered_sockets.extend(_create_filtered_socket(address))
+        except OSError:
+            self.server_close()
+            raise
+
+    def server_bind(self):
+        # HTTPServer.server_bind resolves the FQDN of the address, which is not needed here
+        self.socket.bind(self.server_address)
+        self.server_address = self.socket.getsockname()
+        self.server_name, self.server_port = self.server_address[:2]
+
+    def serve_forever(self, poll_interval=0.5):
+        with selectors.DefaultSelector() as selector:
+            for listener in self.listeners:
+                listener.setblocking(False)
+                selector.register(listener, selectors.EVENT_READ)
+            while not self._stopped.is_set():
+                for key, _ in selector.select(poll_interval):
+                    try:
+                        request, client_address = key.fileobj.accept()
+                    except OSError:
+                        continue
+                    request.setblocking(True)
+                    self.process_request(request, client_address)
+
+    def shutdown(self):
+        self._stopped.set()
+
+    def finish_request(self, request, client_address):
+        if self.ssl_context is None:
+            return super().finish_request(request, client_address)
+        try:
+            request = self.ssl_context.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError):
+            return
+        try:
+            super().finish_request(request, client_address)
+        finally:
+            request.close()
+
+    def server_close(self):
+        for listener in getattr(self, 'listeners', [])[1:] + self.filtered_sockets:
+            listener.close()
+        super().server_close()
+
+
+def _create_filtered_socket(address):
+    """
+    Make an address drop the new connections, like a firewall filtering the management port.
+
+    The socket listens with a backlog of 0 that is filled by connections that are never
+    accepted, so the kernel ignores any further SYN and the clients wait for their connect timeout.
+
+    Returns:
+        list: The sockets that must be kept open.
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(address)
+    listener.listen(0)
+    sockets = [listener]
+    for _ in range(2):
+        filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        filler.setblocking(False)
+        filler.connect_ex(address)
+        sockets.append(filler)
+    return sockets
+
+
+def create_simulator(count, mode='loopback', port=DEFAULT_PORT, user='admin', password='admin',
+                     latency=DEFAULT_LATENCY, error_rate=0.0, timeout_rate=0.0, timeout_delay=DEFAULT_TIMEOUT_DELAY,
+                     unreachable_rate=0.0, filtered_rate=0.0, hang_rate=0.0, response_kb=0, licenses=10, seed=0,
+                     slow_rate=0.0, slow_latency=DEFAULT_SLOW_LATENCY):
+    """
+    Build the simulated fleet.
+
+    Args:
+        count (int): The number of devices, including the unreachable ones.
+        mode (str, optional): Address mode, see `generate_addresses`. Defaults to 'loopback'.
+        port (int, optional): The port (or first port). Defaults to 8443.
+        user (str, optional): The valid username. Defaults to 'admin'.
+        password (str, optional): The valid password. Defaults to 'admin'.
+        latency (str, optional): Latency distribution, see `parse_latency`.
+        error_rate (float, optional): Fraction of requests answered with HTTP 500. Defaults to 0.
+        timeout_rate (float, optional): Fraction of requests never answered. Defaults to 0.
+        timeout_delay (float, optional): Seconds a timed-out request is held. Defaults to 30.
+        unreachable_rate (float, optional): Fraction of devices without a listening socket. Defaults to 0.
+        filtered_rate (float, optional): Fraction of devices that drop the connection attempts. Defaults to 0.
+        hang_rate (float, optional): Fraction of devices that accept connections but never answer. Defaults to 0.
+        response_kb (int, optional): Extra KB of fields in the system info response. Defaults to 0.
+        licenses (int, optional): Licenses of every device. Defaults to 10.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+        slow_rate (float, optional): Fraction of devices that always answer with `slow_latency`. Defaults to 0.
+        slow_latency (str, optional): Latency distribution of the slow devices. Defaults to 'fixed:2'.
+
+    Returns:
+        tuple: A tuple (simulator, inventory, filtered) with the PanOSSimulator, every address in
+            order (listening or not) and the addresses that drop connections.
+    """
+    rng = random.Random(seed)
+    devices = {}
+    inventory = generate_addresses(count, mode, port)
+    filtered = []
+    slow = parse_latency(slow_latency)
+    for index, address in enumerate(inventory):
+        draw = rng.random()
+        if draw < unreachable_rate:
+            continue
+        if draw < unreachable_rate + filtered_rate:
+            filtered.append(address)
+            continue
+        hangs = draw < unreachable_rate + filtered_rate + hang_rate
+        # The extra draw only happens with slow devices, so the fleets of the existing seeds do not change
+        device_latency = slow if slow_rate and rng.random() < slow_rate else None
+        devices[address] = SimulatedDevice(index, address, user, password, rng, response_kb, licenses, hangs, device_latency)
+    simulator = PanOSSimulator(
+        devices, user, password, parse_latency(latency), error_rate, timeout_rate, timeout_delay, seed
+    )
+    return simulator, inventory, filtered
+
+
+def write_inventory(path, addresses):
+    """
+    Write the inventory CSV (an 'ip' column with 'host:port' values) read by the collector.
+    """
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['ip'])
+        for host, port in addresses:
+            writer.writerow([f'{host}:{port}'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local simulator of the PAN-OS XML API for load testing.')
+    parser.add_argument('--devices', type=int, default=1000, help='Number of simulated devices (default: 1000).')
+    parser.add_argument('--mode', choices=('loopback', 'ports'), default='loopback',
+                        help="'loopback': one 127.x.y.z address per device; 'ports': 127.0.0.1 and one port per device.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port, or first port in ports mode (default: 8443).')
+    parser.add_argument('--http', action='store_true', help='Serve plain HTTP instead of HTTPS.')
+    parser.add_argument('--cert', help='Certificate file (default: a self-signed certificate).')
+    parser.add_argument('--key', help='Private key file of the certificate.')
+    parser.add_argument('--user', default='admin', help='Valid username (default: admin).')
+    parser.add_argument('--password', default='admin', help='Valid password (default: admin).')
+    parser.add_argument('--latency', default=DEFAULT_LATENCY,
+                        help=f'Latency distribution: fixed:S, uniform:A,B, lognormal:MEDIAN,SIGMA, exponential:MEAN (default: {DEFAULT_LATENCY}).')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500.')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Fraction of requests never answered.')
+    parser.add_argument('--timeout-delay', type=float, default=DEFAULT_TIMEOUT_DELAY,
+                        help='Seconds a timed-out request holds the connection (default: 30).')
+    parser.add_argument('--unreachable-rate', type=float, default=0.0, help='Fraction of devices that refuse connections.')
+    parser.add_argument('--filtered-rate', type=float, default=0.0,
+                        help='Fraction of devices that drop connection attempts (clients wait for their connect timeout).')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Fraction of devices that accept connections but never answer.')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='Fraction of devices that always answer with --slow-latency.')
+    parser.add_argument('--slow-latency', default=DEFAULT_SLOW_LATENCY,
+                        help=f'Latency distribution of the slow devices (default: {DEFAULT_SLOW_LATENCY}).')
+    parser.add_argument('--response-kb', type=int, default=0, help='Extra KB of fields in the system info response.')
+    parser.add_argument('--licenses', type=int, default=10, help='Licenses per device (default: 10).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0).')
+    parser.add_argument('--inventory', default='simulator_inventory.csv',
+                        help='CSV file where the device addresses are written (default: simulator_inventory.csv).')
+    parser.add_argument('--verbose', action='store_true', help='Log every request to stderr.')
+    args = parser.parse_args(argv)
+
+    simulator, inventory, filtered = create_simulator(
+        args.devices, args.mode, args.port, args.user, args.password, args.latency, args.error_rate,
+        args.timeout_rate, args.timeout_delay, args.unreachable_rate, args.filtered_rate, args.hang_rate,
+        args.response_kb, args.licenses, args.seed, args.slow_rate, args.slow_latency
+    )
+    addresses = list(simulator.devices)
+    if not addresses:
+        parser.error('Every simulated device is unreachable')
+    raise_open_files_limit(len(addresses) * 2 + len(filtered) * 3 + 1024)
+
+    ssl_context = None
+    with tempfile.TemporaryDirectory() as cert_dir:
+        if not args.http:
+            cert_file, key_file = (args.cert, args.key) if args.cert else create_self_signed_cert(cert_dir)
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ssl_context.load_cert_chain(cert_file, key_file)
+
+        server = SimulatorServer(addresses, simulator, ssl_context, args.verbose, filtered)
+        write_inventory(args.inventory, inventory)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+        signal.signal(signal.SIGINT, lambda signum, frame: server.shutdown())
+        # Machine-readable lines for the load-test harness
+        print(json.dumps({
+            'event': 'ready', 'scheme': 'http' if args.http else 'https', 'inventory': os.path.abspath(args.inventory),
+            'devices': len(addresses), 'filtered': len(filtered),
+            'unreachable': len(inventory) - len(addresses) - len(filtered)
+        }), flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            print(json.dumps({'event': 'stopped', 'stats': simulator.stats.to_dict()}), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+# Importaciones de bibliotecas estándar de Python
+import os
+import queue
+import threading
+import time
+
+# Importaciones locales
+from device_data_collector import enrich_device, get_concurrency_settings, get_default_credentials, iter_processed_devices, write_device_to_sinks
+from inventory import iter_inventory
+from logger import info_logger, error_logger
+from metrics import metrics
+from models import STATUS_OK, STATUS_UNREACHABLE
+from scheduler import AdaptiveScheduler, get_scheduler_settings
+
+DEFAULT_QUEUE_SIZE = 256
+# 0 = sin techo de memoria
+DEFAULT_MEMORY_LIMIT_MB = 0
+# Cada cuántos equipos enviados se lee el RSS del proceso
+MEMORY_CHECK_EVERY = 64
+
+# Marca de fin de cada cola
+_END = object()
+
+
+def get_pipeline_settings():
+    """
+    Read the pipeline settings from the environment variables.
+
+    Returns:
+        dict: 'queue_size' (items between two stages) and 'memory_limit_mb' (0 disables the ceiling).
+    """
+    return {
+        'queue_size': int(os.getenv('PIPELINE_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+        'memory_limit_mb': float(os.getenv('PIPELINE_MEMORY_MB', DEFAULT_MEMORY_LIMIT_MB)),
+    }
+
+
+def get_rss_mb():
+    """
+    Return the current resident memory of the process in MB, or None if it cannot be read.
+
+    Only Linux exposes the current (not the peak) RSS without extra dependencies, through `/proc/self/statm`.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as file:
+            pages = int(file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class MemoryGuard:
+    """
+    Hold back new devices while the process uses more than `limit_mb` of resident memory.
+
+    It is the `throttle` of the collection (see `device_data_collector.iter_processed_devices`):
+    above the ceiling no new device is submitted until one finishes, so the concurrency shrinks
+    while the devices in flight release their memory. With no device in flight the collection
+    goes on anyway, so memory that Python keeps after freeing it never stalls the run.
+
+    Args:
+        limit_mb (float): The memory ceiling in MB; 0 disables it.
+    """
+    def __init__(self, limit_mb):
+        self.limit_mb = limit_mb
+        self.pauses = 0
+        self._checks = 0
+        self._paused = False
+        if limit_mb and get_rss_mb() is None:
+            error_logger.error("The memory ceiling needs /proc/self/statm; PIPELINE_MEMORY_MB is ignored")
+            self.limit_mb = 0
+
+    def __call__(self):
+        """
+        Return True if a new device may be submitted.
+        """
+        if not self.limit_mb:
+            return True
+        # Mientras está en pausa se lee el RSS en cada llamada; si no, cada MEMORY_CHECK_EVERY equipos
+        self._checks += 1
+        if not self._paused and self._checks % MEMORY_CHECK_EVERY:
+            return True
+        paused = get_rss_mb() > self.limit_mb
+        if paused and not self._paused:
+            self.pauses += 1
+            metrics.inc('panos_pipeline_memory_pauses_total')
+        self._paused = paused
+        return not paused
+
+
+class Pipeline:
+    """
+    Streaming run from the inventory to the sinks: inventory -> collect -> enrich -> sink.
+
+    Every stage runs in its own thread and the stages are connected by bounded queues, so a slow
+    stage blocks the ones before it (backpressure) instead of letting devices pile up: the
+    collection stops submitting devices while the enrich queue is full, and the inventory stops
+    being read while the collection is busy. Above the memory ceiling the collection also stops
+    submitting devices until the ones in flight finish (see `MemoryGuard`). Every device flows to
+    the sinks as soon as it is polled and nothing keeps the whole fleet, so memory depends on the
+    queue sizes and the concurrency, not on the size of the inventory. The XML responses are parsed
+    incrementally while they are received, inside the collection stage (see `xml_parser.py`).
+
+    Args:
+        targets (iterable): IP addresses or InventoryTarget objects, e.g. `inventory.iter_inventory`.
+        sinks (list, optional): The output sinks (see `sinks.py`).
+        enrich (callable, optional): Function applied to every collected device.
+        max_workers (int, optional): Devices processed at the same time. Defaults to `MAX_WORKERS`.
+        max_per_host (int, optional): Simultaneous requests per device. Defaults to `MAX_PER_HOST`.
+        scheduler (AdaptiveScheduler, optional): Orders every window of the inventory longest-job-first
+            and adapts the concurrency (see `scheduler.py`).
+        queue_size (int, optional): Devices between two stages. Defaults to `PIPELINE_QUEUE_SIZE` (256).
+        memory_limit_mb (float, optional): Memory ceiling, see `MemoryGuard`. Defaults to `PIPELINE_MEMORY_MB`.
+    """
+    def __init__(self, targets, sinks=None, enrich=None, max_workers=None, max_per_host=None, scheduler=None,
+                 queue_size=None, memory_limit_mb=None):
+        settings = get_pipeline_settings()
+        self.targets = targets
+        self.sinks = sinks or []
+        self.enrich = enrich
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.scheduler = scheduler
+        self.queue_size = max(1, queue_size or settings['queue_size'])
+        self.memory_limit_mb = settings['memory_limit_mb'] if memory_limit_mb is None else memory_limit_mb
+        self._target_queue = queue.Queue(self.queue_size)
+        self._enrich_queue = queue.Queue(self.queue_size)
+        self._sink_queue = queue.Queue(self.queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+        self._lock = threading.Lock()
+        self.stats = {'admitted': 0, 'written': 0, 'ok': 0, 'failed': 0, 'first_result_seconds': None}
+        self.guard = MemoryGuard(self.memory_limit_mb)
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def _put(self, target_queue, item):
+        # A failed stage sets `_stop`, so the others never block forever on a full queue
+        while not self._stop.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, source_queue):
+        while not self._stop.is_set():
+            try:
+                item = source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _stage(self, function, next_queue):
+        def run():
+            try:
+                function()
+            except BaseException as e:
+                # SystemExit and KeyboardInterrupt too, so a stage never stops without failing the run
+                error_logger.error("Pipeline stage %s failed: %r", threading.current_thread().name, e)
+                self._errors.append(e)
+                self._stop.set()
+            finally:
+                if next_queue is not None:
+                    self._put(next_queue, _END)
+        return run
+
+    def _read_inventory(self):
+        targets = self.targets
+        # Longest job first inside every window of the inventory, so the stream stays bounded;
+        # the first window only fills the pool, so the first devices start early
+        if self.scheduler is not None:
+            targets = self.scheduler.iter_ordered(targets, first_window=self.scheduler.max_limit)
+        for target in targets:
+            self._count(admitted=1)
+            if not self._put(self._target_queue, target):
+                return
+
+    def _collect(self):
+        for _, device in iter_processed_devices(
+            self._drain(self._target_queue), self.max_workers, self.max_per_host, self.scheduler, self.guard
+        ):
+            if device is None:
+                self._count(failed=1)
+            elif not self._put(self._enrich_queue, device):
+                return
+
+    def _enrich(self):
+        for device in self._drain(self._enrich_queue):
+            if self.enrich and device.status != STATUS_UNREACHABLE:
+                enrich_device(device, self.enrich)
+            if not self._put(self._sink_queue, device):
+                return
+
+    def _write(self, start):
+        for device in self._drain(self._sink_queue):
+            write_device_to_sinks(device, self.sinks)
+            if self.stats['first_result_seconds'] is None:
+                self.stats['first_result_seconds'] = time.perf_counter() - start
+            self._count(written=1, ok=int(device.status == STATUS_OK))
+
+    def run(self):
+        """
+        Run every stage until the inventory is exhausted and the last device is written.
+
+        Returns:
+            dict: The counters of the run: devices 'admitted', 'written', 'ok' and 'failed',
+            'first_result_seconds', 'elapsed_seconds', 'memory_pauses' and 'peak_rss_mb'.
+
+        Raises:
+            BaseException: The first error of a stage, after the other stages stopped.
+        """
+        start = time.perf_counter()
+        stages = [
+            threading.Thread(target=self._stage(self._read_inventory, self._target_queue), name='pipeline-inventory'),
+            threading.Thread(target=self._stage(self._collect, self._enrich_queue), name='pipeline-collect'),
+            threading.Thread(target=self._stage(self._enrich, self._sink_queue), name='pipeline-enrich'),
+            threading.Thread(target=self._stage(lambda: self._write(start), None), name='pipeline-sink'),
+        ]
+        peak_rss = get_rss_mb()
+        for stage in stages:
+            stage.start()
+        # The main thread samples the memory until the last stage finishes
+        while stages[-1].is_alive():
+            stages[-1].join(0.5)
+            rss = get_rss_mb()
+            if rss is not None:
+                peak_rss = max(peak_rss or 0.0, rss)
+        self._stop.set()
+        for stage in stages:
+            stage.join()
+        stats = dict(
+            self.stats, elapsed_seconds=time.perf_counter() - start, memory_pauses=self.guard.pauses, peak_rss_mb=peak_rss
+        )
+        if stats['peak_rss_mb'] is not None:
+            metrics.set_gauge('panos_pipeline_peak_rss_mb', stats['peak_rss_mb'])
+        if stats['first_result_seconds'] is not None:
+            metrics.set_gauge('panos_pipeline_first_result_seconds', stats['first_result_seconds'])
+        info_logger.info(
+            "Pipeline finished: %s devices written (%s ok, %s failed) in %.1f s, first result after %s s, "
+            "peak RSS %s MB, %s memory pauses",
+            stats['written'], stats['ok'], stats['failed'], stats['elapsed_seconds'],
+            f"{stats['first_result_seconds']:.2f}" if stats['first_result_seconds'] is not None else '-',
+            f"{peak_rss:.0f}" if peak_rss is not None else '-', stats['memory_pauses']
+        )
+        if self._errors:
+            raise self._errors[0]
+        return stats
+
+
+def run_pipeline(inventory_path, sinks=None, enrich=None, max_workers=None, max_per_host=None, queue_size=None, memory_limit_mb=None):
+    """
+    Stream the devices of an inventory file to the sinks, see `Pipeline`.
+
+    Unless `SCHEDULER_ENABLED` is false the scheduler adapts the concurrency and the devices are
+    sorted longest-job-first within windows of `SCHEDULER_WINDOW` targets (see
+    `AdaptiveScheduler.iter_ordered`), because sorting the whole inventory would read it all
+    before the first device starts.
+
+    Args:
+        inventory_path (str): The inventory file (see `inventory.iter_inventory`).
+        sinks (list, optional): The output sinks.
+        enrich (callable, optional): Function applied to every collected device.
+        max_workers (int, optional): Devices processed at the same time. Defaults to `MAX_WORKERS`.
+        max_per_host (int, optional): Simultaneous requests per device. Defaults to `MAX_PER_HOST`.
+        queue_size (int, optional): Devices between two stages. Defaults to `PIPELINE_QUEUE_SIZE`.
+        memory_limit_mb (float, optional): Memory ceiling. Defaults to `PIPELINE_MEMORY_MB`.
+
+    Returns:
+        dict: The counters of the run, see `Pipeline.run`.
+
+    Raises:
+        MissingCredentialsError: If `USER_IP` or `PASSWORD_IP` is not set, before any device is read.
+    """
+    get_default_credentials()
+    max_workers, max_per_host = get_concurrency_settings(max_workers, max_per_host)
+    scheduler = AdaptiveScheduler(max_workers) if get_scheduler_settings()['enabled'] else None
+    info_logger.info("Start the pipeline of %s", inventory_path)
+    pipeline = Pipeline(
+        iter_inventory(inventory_path), sinks, enrich, max_workers, max_per_host, scheduler, queue_size, memory_limit_mb
+    )
+    return pipeline.run()
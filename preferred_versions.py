@@ -0,0 +1,212 @@
+# Importaciones de bibliotecas estándar de Python
+import json
+import os
+import re
+from functools import lru_cache
+
+# Importaciones locales
+from models import identify_model_family
+
+UP_TO_DATE_MESSAGE = 'is up to date with prefered version'
+
+# Versiones de PAN-OS: 10.2.9, 10.2.9-h1, 11.1.2-h3, ...
+VERSION_PATTERN = re.compile(r'^(\d+(?:\.\d+)*)(?:-h(\d+))?')
+
+
+@lru_cache(maxsize=None)
+def parse_version(version):
+    """
+    Parse a PAN-OS version string into a tuple of integers that compares numerically.
+
+    The hotfix number is appended as the last element (0 if there is none), so
+    '10.2.9-h1' becomes (10, 2, 9, 1) and '10.2.10' becomes (10, 2, 10, 0).
+
+    Args:
+        version (str): The version string.
+
+    Returns:
+        tuple or None: The parsed version, or None if the string is not a version.
+    """
+    if not version:
+        return None
+    match = VERSION_PATTERN.match(version.strip())
+    if not match:
+        return None
+    numbers = tuple(int(part) for part in match.group(1).split('.'))
+    return numbers + (int(match.group(2) or 0),)
+
+
+def get_train(version):
+    """
+    Get the major.minor train of a version, e.g. (10, 2) for '10.2.9-h1'.
+
+    Args:
+        version (str): The version string.
+
+    Returns:
+        tuple or None: The (major, minor) tuple, or None if the string is not a version.
+    """
+    parsed = parse_version(version)
+    if not parsed or len(parsed) < 3:
+        return None
+    return parsed[:2]
+
+
+def build_preferred_version_index(release_data):
+    """
+    Build the preferred version index from the data extracted from the release notes.
+
+    Args:
+        release_data (list): The list of {section: {train: [release, date, comments]}} dictionaries.
+
+    Returns:
+        dict: A dictionary mapping every model family to a dictionary {(major, minor): release}.
+    """
+    index = {}
+    for item in release_data:
+        for family, trains in item.items():
+            family_index = index.setdefault(family, {})
+            for train, rows in trains.items():
+                parsed_train = parse_version(train)
+                if parsed_train and rows:
+                    family_index[parsed_train[:2]] = rows[0]
+    return index
+
+
+def get_preferred_version(index, family, sw_version):
+    """
+    Resolve the value of `sw_version_prefered` for a device.
+
+    Args:
+        index (dict): The index returned by `build_preferred_version_index`.
+        family (str): The model family of the device (see `Device.identify_model`).
+        sw_version (str): The software version of the device.
+
+    Returns:
+        str or None: The preferred version, `UP_TO_DATE_MESSAGE`, or None if the family is not in the index.
+    """
+    family_index = index.get(family)
+    if family_index is None:
+        return None
+    preferred_version = family_index.get(get_train(sw_version))
+    if preferred_version and parse_version(preferred_version) != parse_version(sw_version):
+        return preferred_version
+    return UP_TO_DATE_MESSAGE
+
+
+def enrich_devices(devices, index):
+    """
+    Set `sw_version_prefered` on every device in one batched pass.
+
+    Devices are grouped by (family, sw_version), so the index is queried once per group
+    instead of once per device.
+
+    Args:
+        devices (list): The list of Device objects.
+        index (dict): The index returned by `build_preferred_version_index`.
+
+    Returns:
+        list: The same list of devices.
+    """
+    groups = {}
+    for device in devices:
+        groups.setdefault((identify_model_family(device.model), device.sw_version), []).append(device)
+    for (family, sw_version), group in groups.items():
+        if family is None:
+            continue
+        preferred_version = get_preferred_version(index, family, sw_version)
+        if preferred_version is None:
+            continue
+        for device in group:
+            device.sw_version_prefered = preferred_version
+    return devices
+
+
+def enrich_fleet_table(table, index):
+    """
+    Fill the `sw_version_prefered` column of a FleetTable in one batched pass.
+
+    Args:
+        table (FleetTable): The columnar fleet.
+        index (dict): The index returned by `build_preferred_version_index`.
+
+    Returns:
+        FleetTable: The same table.
+    """
+    columns = table.text_columns
+    resolved = {}
+    values = []
+    for model, sw_version, current in zip(columns['model'], columns['sw_version'], columns['sw_version_prefered']):
+        key = (model, sw_version)
+        if key not in resolved:
+            family = identify_model_family(model)
+            resolved[key] = get_preferred_version(index, family, sw_version) if family else None
+        values.append(resolved[key] if resolved[key] is not None else current)
+    table.set_column('sw_version_prefered', values)
+    return table
+
+
+def enrich_device_dicts(device_dicts, index):
+    """
+    Set `sw_version_prefered` on device dictionaries (e.g. read back from a JSONL sink) as they are iterated.
+
+    Every (model, sw_version) pair is resolved once, like `enrich_fleet_table`.
+
+    Args:
+        device_dicts (iterable): Dictionaries with the shape of `Device.to_dict`.
+        index (dict): The index returned by `build_preferred_version_index`.
+
+    Yields:
+        dict: Every device dictionary, enriched.
+    """
+    resolved = {}
+    for device_dict in device_dicts:
+        key = (device_dict.get('model'), device_dict.get('sw_version'))
+        if key not in resolved:
+            family = identify_model_family(key[0])
+            resolved[key] = get_preferred_version(index, family, key[1]) if family else None
+        if resolved[key] is not None:
+            device_dict['sw_version_prefered'] = resolved[key]
+        yield device_dict
+
+
+def load_release_data(json_file):
+    """
+    Load the JSON extracted from the release notes.
+
+    The content is memoized per process and keyed by the path, modification time and size
+    of the file, so repeated calls do not read it again unless it changed.
+
+    Args:
+        json_file (str): The path of the JSON file.
+
+    Returns:
+        list: The release data. It is shared between callers and must not be modified.
+    """
+    stat = os.stat(json_file)
+    return _load_release_data(os.path.abspath(json_file), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=8)
+def _load_release_data(json_file, mtime_ns, size):
+    with open(json_file, 'r') as file:
+        return json.load(file)
+
+
+def load_preferred_version_index(json_file):
+    """
+    Load the JSON extracted from the release notes and build its preferred version index.
+
+    Args:
+        json_file (str): The path of the JSON file.
+
+    Returns:
+        dict: The preferred version index, memoized like `load_release_data`.
+    """
+    stat = os.stat(json_file)
+    return _load_preferred_version_index(os.path.abspath(json_file), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=8)
+def _load_preferred_version_index(json_file, mtime_ns, size):
+    return build_preferred_version_index(_load_release_data(json_file, mtime_ns, size))
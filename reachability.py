@@ -0,0 +1,162 @@
+# Importaciones de bibliotecas estándar de Python
+import errno
+import os
+import selectors
+import socket
+import time
+
+# Importaciones locales
+from logger import info_logger, error_logger
+from models import STATUS_UNREACHABLE
+
+# Valores por defecto del sondeo TCP (se pueden sobreescribir en el .env)
+DEFAULT_PROBE_TIMEOUT = 1.0
+DEFAULT_PROBE_CONCURRENCY = 500
+DEFAULT_PORTS = {'https': 443, 'http': 80}
+
+
+class ProbeResult:
+    """
+    Result of the TCP probe of a host.
+    """
+    __slots__ = ('ip', 'reachable', 'elapsed', 'error')
+
+    def __init__(self, ip, reachable, elapsed, error=None):
+        self.ip = ip
+        self.reachable = reachable
+        self.elapsed = elapsed
+        self.error = error
+
+    def __repr__(self):
+        return f"ProbeResult({self.ip!r}, reachable={self.reachable}, elapsed={self.elapsed:.3f}, error={self.error!r})"
+
+
+def get_probe_settings():
+    """
+    Read the probe settings from the environment variables.
+
+    Returns:
+        dict: 'enabled', 'timeout', 'concurrency' and 'port' (the default port of `API_SCHEME` unless `PROBE_PORT` is set).
+    """
+    scheme = os.getenv('API_SCHEME', 'https')
+    return {
+        'enabled': os.getenv('PROBE_ENABLED', 'true').strip().lower() not in ('0', 'false', 'no'),
+        'timeout': float(os.getenv('PROBE_TIMEOUT', DEFAULT_PROBE_TIMEOUT)),
+        'concurrency': int(os.getenv('PROBE_CONCURRENCY', DEFAULT_PROBE_CONCURRENCY)),
+        'port': int(os.getenv('PROBE_PORT', DEFAULT_PORTS.get(scheme, 443)))
+    }
+
+
+def split_host_port(ip, default_port):
+    """
+    Split an inventory entry ('10.0.0.1', '10.0.0.1:8443', '[::1]:8443') into host and port.
+    """
+    if ip.startswith('['):
+        host, _, rest = ip[1:].partition(']')
+        return host, int(rest[1:]) if rest.startswith(':') else default_port
+    if ip.count(':') == 1:
+        host, port = ip.split(':')
+        return host, int(port)
+    return ip, default_port
+
+
+def probe_hosts(ips, timeout=None, concurrency=None, port=None):
+    """
+    Check concurrently that every host accepts TCP connections on its API port.
+
+    The connections are opened without blocking and multiplexed with a selector in the calling
+    thread, so thousands of hosts are probed in about `timeout` seconds per `concurrency` hosts.
+    The connection is closed as soon as it is established; no data is sent.
+
+    Args:
+        ips (list): The inventory entries (IP or host, optionally followed by ':port').
+        timeout (float, optional): Seconds to wait for every connection. Defaults to `PROBE_TIMEOUT` (1 s).
+        concurrency (int, optional): Connections in progress at the same time. Defaults to `PROBE_CONCURRENCY` (500).
+        port (int, optional): Port of the entries without one. Defaults to the port of `API_SCHEME`.
+
+    Returns:
+        dict: A dictionary mapping every entry to its ProbeResult.
+    """
+    settings = get_probe_settings()
+    timeout = settings['timeout'] if timeout is None else timeout
+    concurrency = max(1, settings['concurrency'] if concurrency is None else concurrency)
+    port = settings['port'] if port is None else port
+
+    results = {}
+    pending = list(dict.fromkeys(ips))
+    pending.reverse()
+    in_progress = {}
+    with selectors.DefaultSelector() as selector:
+        while pending or in_progress:
+            # Start new connections up to the concurrency limit
+            while pending and len(in_progress) < concurrency:
+                ip = pending.pop()
+                started = time.perf_counter()
+                try:
+                    sock = _start_connection(ip, port)
+                except (OSError, ValueError) as e:
+                    results[ip] = ProbeResult(ip, False, time.perf_counter() - started, str(e))
+                    continue
+                in_progress[sock] = (ip, started)
+                selector.register(sock, selectors.EVENT_WRITE)
+
+            # Wait until the oldest connection in progress times out at the latest
+            oldest = min(started for _, started in in_progress.values()) if in_progress else time.perf_counter()
+            wait = max(0.0, oldest + timeout - time.perf_counter())
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                ip, started = in_progress.pop(sock)
+                selector.unregister(sock)
+                error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                sock.close()
+                results[ip] = ProbeResult(
+                    ip, error == 0, time.perf_counter() - started, None if error == 0 else os.strerror(error)
+                )
+
+            # Close the connections that did not finish in time
+            now = time.perf_counter()
+            for sock, (ip, started) in list(in_progress.items()):
+                if now - started >= timeout:
+                    del in_progress[sock]
+                    selector.unregister(sock)
+                    sock.close()
+                    results[ip] = ProbeResult(ip, False, now - started, 'timed out')
+    return results
+
+
+def _start_connection(ip, default_port):
+    host, port = split_host_port(ip, default_port)
+    family, socktype, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    sock = socket.socket(family, socktype, proto)
+    sock.setblocking(False)
+    code = sock.connect_ex(address)
+    if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)):
+        sock.close()
+        raise OSError(code, os.strerror(code))
+    return sock
+
+
+def filter_reachable(ips, **kwargs):
+    """
+    Probe the hosts and split them into reachable and unreachable ones, logging a summary.
+
+    Args:
+        ips (list): The inventory entries.
+        **kwargs: Arguments for `probe_hosts`.
+
+    Returns:
+        tuple: A tuple (reachable, results) with the reachable entries (in the input order) and every ProbeResult.
+    """
+    start = time.perf_counter()
+    results = probe_hosts(ips, **kwargs)
+    reachable = [ip for ip in ips if results[ip].reachable]
+    unreachable = len(results) - len(set(reachable))
+    info_logger.info(
+        "Reachability probe: %s reachable, %s unreachable in %.2f s", len(set(reachable)), unreachable, time.perf_counter() - start
+    )
+    for result in results.values():
+        if not result.reachable:
+            error_logger.error(
+                "Host %s is unreachable: %s", result.ip, result.error, extra={'device': result.ip, 'status': STATUS_UNREACHABLE}
+            )
+    return reachable, results
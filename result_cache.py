@@ -0,0 +1,121 @@
+# Importaciones de bibliotecas estándar de Python
+import os
+import threading
+import time
+
+# Importaciones locales
+from kv_store import KeyValueStore
+from logger import info_logger
+from utils import get_source_dir
+
+RESULT_CACHE_FILENAME = 'results.sqlite'
+# Archivo de la caché antes de guardarse en SQLite, se importa una vez
+LEGACY_RESULT_CACHE_FILENAME = 'results.json'
+
+
+def get_uri_ttls(uris):
+    """
+    Get the freshness window of every URI from the `URIS_TTL` environment variable.
+
+    `URIS_TTL` uses the same `|` separator and order as `URIS`. Missing or empty values
+    mean 0 seconds, i.e. the URI is always requested to the device.
+
+    Args:
+        uris (list): The list of URIs.
+
+    Returns:
+        dict: A dictionary mapping every URI to its freshness window in seconds.
+    """
+    ttls = os.getenv('URIS_TTL', '').split('|')
+    uri_ttls = {}
+    for position, uri in enumerate(uris):
+        value = ttls[position].strip() if position < len(ttls) else ''
+        uri_ttls[uri] = int(value) if value else 0
+    return uri_ttls
+
+
+class ResultCache:
+    """
+    On-disk cache of the 'result' section of every URI, keyed by device IP and URI.
+
+    The entries live in a SQLite file (see `kv_store.KeyValueStore`) and are read one at a
+    time, so the cache does not grow in memory with the size of the fleet.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(get_source_dir('cache'), RESULT_CACHE_FILENAME)
+        self.path = path
+        self._lock = threading.Lock()
+        self._store = None
+
+    def load(self):
+        """
+        Open the cache file, importing the JSON cache of older versions.
+        """
+        with self._lock:
+            if self._store is None:
+                store = KeyValueStore(self.path)
+                store.import_json(os.path.join(os.path.dirname(self.path), LEGACY_RESULT_CACHE_FILENAME), _convert_legacy)
+                self._store = store
+                info_logger.info("Opened the result cache %s with %s cached results", self.path, len(store))
+        return self._store
+
+    def get(self, ip, uri, ttl):
+        """
+        Return the cached entry of a URI if it is still fresh.
+
+        Args:
+            ip (str): The IP address of the device.
+            uri (str): The URI (command).
+            ttl (int): The freshness window of the URI in seconds.
+
+        Returns:
+            dict or None: A dictionary with the 'result' and its 'fetched_at' timestamp, or None.
+        """
+        if ttl <= 0:
+            return None
+        entry = (self._store or self.load()).get(_entry_key(ip, uri))
+        if entry and time.time() - entry['fetched_at'] < ttl:
+            return entry
+        return None
+
+    def set(self, ip, uri, result, fetched_at=None):
+        """
+        Store the result of a URI for a device.
+        """
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        (self._store or self.load()).set(_entry_key(ip, uri), {'fetched_at': fetched_at, 'result': result}, fetched_at)
+
+    def save(self):
+        """
+        Commit the new results to disk.
+        """
+        if self._store is not None:
+            self._store.commit()
+
+
+def _entry_key(ip, uri):
+    # '|' separates the URIs of the URIS variable, so it never appears in a URI
+    return f"{ip}|{uri}"
+
+
+def _convert_legacy(ip, entries):
+    return [(_entry_key(ip, uri), entry, entry.get('fetched_at')) for uri, entry in entries.items()]
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    Return the shared result cache of the process.
+
+    The first call may come from several worker threads at once, so the cache is created under a lock.
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
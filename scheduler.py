@@ -0,0 +1,261 @@
+# Importaciones de bibliotecas estándar de Python
+import itertools
+import os
+import threading
+import time
+
+# Importaciones locales
+from inventory import InventoryTarget, target_address
+from kv_store import KeyValueStore
+from logger import info_logger
+from metrics import metrics
+from models import STATUS_OK
+from utils import get_source_dir
+
+LATENCY_FILENAME = 'latency.sqlite'
+# Archivo de latencias antes de guardarse en SQLite, se importa una vez
+LEGACY_LATENCY_FILENAME = 'latency.json'
+
+# Peso de la última ejecución en la media móvil de la latencia de cada equipo
+DEFAULT_LATENCY_ALPHA = 0.3
+# Límites del control AIMD de la concurrencia
+DEFAULT_MIN_WORKERS = 2
+DEFAULT_BACKOFF = 0.5
+# Un equipo que tarda más que SLOW_FACTOR veces su latencia habitual cuenta como congestión
+DEFAULT_SLOW_FACTOR = 3.0
+# Equipos que se ordenan juntos cuando el inventario se lee en streaming
+DEFAULT_WINDOW = 1000
+
+
+def get_scheduler_settings():
+    """
+    Read the scheduler settings from the environment variables.
+
+    Returns:
+        dict: 'enabled', 'min_workers', 'backoff', 'slow_factor', 'alpha' and 'window'.
+    """
+    return {
+        'enabled': os.getenv('SCHEDULER_ENABLED', 'true').strip().lower() not in ('0', 'false', 'no'),
+        'min_workers': int(os.getenv('SCHEDULER_MIN_WORKERS', DEFAULT_MIN_WORKERS)),
+        'backoff': float(os.getenv('SCHEDULER_BACKOFF', DEFAULT_BACKOFF)),
+        'slow_factor': float(os.getenv('SCHEDULER_SLOW_FACTOR', DEFAULT_SLOW_FACTOR)),
+        'alpha': float(os.getenv('LATENCY_ALPHA', DEFAULT_LATENCY_ALPHA)),
+        'window': int(os.getenv('SCHEDULER_WINDOW', DEFAULT_WINDOW)),
+    }
+
+
+class LatencyHistory:
+    """
+    On-disk record of the time every device took to be processed, keyed by device IP.
+
+    Every new measurement is blended into an exponentially weighted moving average, so a
+    single slow run moves the estimate without replacing it. The latencies live in a SQLite
+    file (see `kv_store.KeyValueStore`) and are read one at a time, so the history does not
+    grow in memory with the size of the fleet.
+
+    Args:
+        path (str, optional): The database file. Defaults to `source/cache/latency.sqlite`.
+        alpha (float, optional): Weight of the new measurement. Defaults to `LATENCY_ALPHA` (0.3).
+    """
+    def __init__(self, path=None, alpha=None):
+        if path is None:
+            path = os.path.join(get_source_dir('cache'), LATENCY_FILENAME)
+        if alpha is None:
+            alpha = get_scheduler_settings()['alpha']
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._store = None
+
+    def load(self):
+        """
+        Open the latency file, importing the JSON file of older versions.
+        """
+        with self._lock:
+            if self._store is None:
+                store = KeyValueStore(self.path)
+                store.import_json(
+                    os.path.join(os.path.dirname(self.path), LEGACY_LATENCY_FILENAME),
+                    lambda ip, entry: [(ip, entry, entry.get('updated_at'))]
+                )
+                self._store = store
+                info_logger.info("Opened the latency history %s with %s devices", self.path, len(store))
+        return self._store
+
+    def get(self, ip):
+        """
+        Return the expected processing time of a device in seconds, or None if it was never measured.
+        """
+        entry = (self._store or self.load()).get(ip)
+        return entry['seconds'] if entry else None
+
+    def record(self, ip, seconds):
+        """
+        Blend a new measurement of a device into its moving average.
+        """
+        store = self._store or self.load()
+        # The read and the write of the average are one step for the other threads
+        with self._lock:
+            entry = store.get(ip)
+            if entry is None:
+                entry = {'seconds': seconds}
+            else:
+                entry['seconds'] += self.alpha * (seconds - entry['seconds'])
+            entry['updated_at'] = time.time()
+            store.set(ip, entry, entry['updated_at'])
+
+    def save(self):
+        """
+        Commit the new latencies to disk.
+        """
+        if self._store is not None:
+            self._store.commit()
+
+
+_latency_history = None
+_latency_history_lock = threading.Lock()
+
+
+def get_latency_history():
+    """
+    Return the shared latency history of the process.
+
+    The first call may come from several threads at once, so the history is created under a lock.
+    """
+    global _latency_history
+    if _latency_history is None:
+        with _latency_history_lock:
+            if _latency_history is None:
+                _latency_history = LatencyHistory()
+    return _latency_history
+
+
+class AdaptiveScheduler:
+    """
+    Order the devices longest-job-first and adapt the number of devices processed at the same time.
+
+    `order` starts the devices that took longest in previous runs first, so the slowest ones are
+    not left for the end of the sweep; `iter_ordered` does the same one window at a time for an
+    inventory that is streamed. The concurrency follows an AIMD (additive increase,
+    multiplicative decrease) rule: it starts at `max_workers`, is multiplied by `backoff` when a
+    device fails, times out or takes `slow_factor` times its usual latency, and grows back by about
+    one worker per `limit` healthy devices. Only one decrease is applied per round trip (the
+    duration of the device that triggered it), so the devices that were already in flight do
+    not reduce it again.
+
+    Args:
+        max_workers (int): The maximum concurrency (the size of the thread pool).
+        history (LatencyHistory, optional): Defaults to `get_latency_history()`.
+        settings (dict, optional): Defaults to `get_scheduler_settings()`.
+    """
+    def __init__(self, max_workers, history=None, settings=None):
+        settings = settings or get_scheduler_settings()
+        self.history = history if history is not None else get_latency_history()
+        self.max_limit = max(1, max_workers)
+        self.min_limit = max(1, min(settings['min_workers'], self.max_limit))
+        self.backoff = settings['backoff']
+        self.slow_factor = settings['slow_factor']
+        self.window = max(1, settings['window'])
+        self._limit = float(self.max_limit)
+        self._hold_until = 0.0
+        self.backoffs = 0
+
+    @property
+    def limit(self):
+        """
+        The number of devices that may be processed at the same time.
+        """
+        return int(self._limit)
+
+    def order(self, targets):
+        """
+        Return the targets sorted by priority (highest first) and then by expected duration (longest first).
+
+        The devices without a recorded latency are assumed to be as slow as the slowest known one, so
+        a new WAN device is never the straggler. Ties keep the inventory order.
+
+        Args:
+            targets (iterable): IP addresses or InventoryTarget objects.
+
+        Returns:
+            list: The sorted targets.
+        """
+        targets = list(targets)
+        sorted_targets, known = self._sort(targets)
+        info_logger.info("Scheduling %s devices longest first (%s with a recorded latency)", len(targets), known)
+        return sorted_targets
+
+    def iter_ordered(self, targets, window=None, first_window=None):
+        """
+        Yield the targets like `order`, but sorted one window of targets at a time.
+
+        Only one window is held in memory, so a streamed inventory is never read whole. The first
+        window has `first_window` targets, so the first devices start early, and every next one
+        doubles up to `window`. The price is that the ordering is local: a slow device is started
+        first within its window, but still after the devices of the windows before it.
+
+        Args:
+            targets (iterable): IP addresses or InventoryTarget objects.
+            window (int, optional): Largest number of targets sorted together. Defaults to `SCHEDULER_WINDOW` (1000).
+            first_window (int, optional): Targets of the first window. Defaults to `window`.
+        """
+        window = max(1, window or self.window)
+        size = min(window, max(1, first_window or window))
+        info_logger.info("Scheduling the devices longest first in windows of up to %s", window)
+        targets = iter(targets)
+        while True:
+            batch = list(itertools.islice(targets, size))
+            if not batch:
+                return
+            yield from self._sort(batch)[0]
+            size = min(window, size * 2)
+
+    def _sort(self, targets):
+        expected = [self.history.get(target_address(target)) for target in targets]
+        unknown = max((seconds for seconds in expected if seconds is not None), default=0.0)
+        known = sum(1 for seconds in expected if seconds is not None)
+        keys = {
+            id(target): (
+                -(target.priority if isinstance(target, InventoryTarget) else 0),
+                -(seconds if seconds is not None else unknown)
+            )
+            for target, seconds in zip(targets, expected)
+        }
+        return sorted(targets, key=lambda target: keys[id(target)]), known
+
+    def record(self, ip, seconds, device):
+        """
+        Record the duration of a finished device and adapt the concurrency.
+
+        Args:
+            ip (str): The IP address of the device.
+            seconds (float): The time it took to process the device.
+            device (Device or None): The processed device, None if it failed.
+        """
+        # Served entirely from the result cache: says nothing about the device or the network
+        if device is not None and device.data_fetched_at and len(device.cached_sections) == len(device.data_fetched_at):
+            return
+        expected = self.history.get(ip)
+        self.history.record(ip, seconds)
+        healthy = device is not None and device.status == STATUS_OK
+        if healthy and (expected is None or seconds <= expected * self.slow_factor):
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            return
+        now = time.monotonic()
+        if now < self._hold_until:
+            return
+        previous = self.limit
+        self._limit = max(self.min_limit, self._limit * self.backoff)
+        self._hold_until = now + seconds
+        if self.limit < previous:
+            self.backoffs += 1
+            metrics.inc('panos_scheduler_backoffs_total')
+            info_logger.info("%s failed or slowed down (%.2f s), concurrency reduced from %s to %s", ip, seconds, previous, self.limit)
+
+    def finish(self):
+        """
+        Save the latency history for the next run and publish the final concurrency.
+        """
+        self.history.save()
+        metrics.set_gauge('panos_scheduler_concurrency', self.limit)
+        info_logger.info("Scheduler finished with a concurrency of %s (%s backoffs)", self.limit, self.backoffs)
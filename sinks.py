@@ -0,0 +1,428 @@
+# Importaciones de bibliotecas estándar de Python
+import csv
+import datetime
+import itertools
+import json
+import os
+
+# Importaciones locales
+from logger import info_logger, error_logger
+from metrics import metrics
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_OUTPUT_DIR = 'output'
+DEFAULT_OUTPUT_SINKS = 'jsonl,history,delta'
+
+# Columnas de texto de cada dispositivo (mismo orden que Device.to_dict)
+DEVICE_COLUMNS = (
+    'create_report_datetime', 'hostname', 'model', 'serial', 'ip_address', 'sw_version', 'sw_version_prefered',
+    'gpc_version', 'app_version', 'av_version', 'threat_version', 'wildfire_version', 'url_filtering_version',
+    'device_certificate_status', 'cached_sections', 'status'
+)
+LICENSE_DEVICE_COLUMNS = ('serial', 'hostname', 'ip_address')
+LICENSE_FIELDS = ('feature', 'issued', 'expired')
+
+
+class DeviceSink:
+    """
+    Base class of the output sinks fed by the collector as every device is completed.
+
+    Devices are converted to dictionaries and buffered; every `batch_size` devices the
+    buffer is written and flushed to disk, so memory stays bounded and a crash only loses
+    the last partial batch. A sink is committed with `close`, or discarded with `abort` when the
+    run failed. Subclasses implement `_write_batch` and optionally `_close` and `_abort`.
+    """
+    def __init__(self, path, batch_size=None):
+        self.path = path
+        self.batch_size = batch_size or DEFAULT_BATCH_SIZE
+        self.count = 0
+        self._batch = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, device):
+        """
+        Add a device (a Device object or its dictionary) to the sink.
+        """
+        self._batch.append(device if isinstance(device, dict) else device.to_dict())
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered devices to disk.
+
+        A batch that cannot be written is dropped and the error is raised, so it is never
+        sent again and the buffer never grows past `batch_size`.
+        """
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._write_batch(batch)
+            self.count += len(batch)
+
+    def close(self):
+        """
+        Flush the pending devices and close the output.
+        """
+        self.flush()
+        self._close()
+        info_logger.info("%s devices written to %s", self.count, self.path)
+
+    def abort(self):
+        """
+        Discard the output of a failed run: the buffered devices are dropped and the partial
+        files are removed, so a later run never takes them as the previous snapshot.
+        """
+        self._batch = []
+        self._abort()
+        error_logger.error("Output %s discarded after %s devices because the run failed", self.path, self.count)
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def _abort(self):
+        self._close()
+        _remove_file(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JsonlSink(DeviceSink):
+    """
+    Write every device as one JSON line (the same shape as `Device.to_dict`).
+    """
+    def __init__(self, path, batch_size=None):
+        super().__init__(path, batch_size)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def _write_batch(self, batch):
+        self._file.write(''.join(json.dumps(device, ensure_ascii=False) + '\n' for device in batch))
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class CsvSink(DeviceSink):
+    """
+    Write the devices to a CSV file and their licenses, in long format, to a second CSV file.
+
+    `data_fetched_at` is written as a JSON object because its sections depend on the URIs.
+    """
+    def __init__(self, path, licenses_path=None, batch_size=None):
+        super().__init__(path, batch_size)
+        if licenses_path is None:
+            licenses_path = f"{os.path.splitext(path)[0]}_licenses.csv"
+        self.licenses_path = licenses_path
+        self._device_file = open(path, 'w', encoding='utf-8', newline='')
+        self._license_file = open(licenses_path, 'w', encoding='utf-8', newline='')
+        self._device_writer = csv.writer(self._device_file)
+        self._license_writer = csv.writer(self._license_file)
+        self._device_writer.writerow(DEVICE_COLUMNS + ('data_fetched_at',))
+        self._license_writer.writerow(LICENSE_DEVICE_COLUMNS + LICENSE_FIELDS)
+
+    def _write_batch(self, batch):
+        for device in batch:
+            self._device_writer.writerow(
+                [device.get(column) for column in DEVICE_COLUMNS] + [json.dumps(device.get('data_fetched_at') or {})]
+            )
+            device_values = [device.get(column) for column in LICENSE_DEVICE_COLUMNS]
+            for license in device.get('licenses') or []:
+                self._license_writer.writerow(device_values + [license.get(field) for field in LICENSE_FIELDS])
+        self._device_file.flush()
+        self._license_file.flush()
+
+    def _close(self):
+        self._device_file.close()
+        self._license_file.close()
+
+    def _abort(self):
+        self._close()
+        _remove_file(self.path)
+        _remove_file(self.licenses_path)
+
+
+class ParquetSink(DeviceSink):
+    """
+    Write the devices to a Parquet file, one row group per batch. Requires `pyarrow`.
+    """
+    def __init__(self, path, batch_size=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("The Parquet sink requires pyarrow: pip install pyarrow") from e
+        super().__init__(path, batch_size)
+        self._pa = pa
+        license_type = pa.struct([('feature', pa.string()), ('issued', pa.string()), ('expired', pa.bool_())])
+        self.schema = pa.schema(
+            [(column, pa.string()) for column in DEVICE_COLUMNS]
+            + [('data_fetched_at', pa.map_(pa.string(), pa.string())), ('licenses', pa.list_(license_type))]
+        )
+        self._writer = pq.ParquetWriter(path, self.schema)
+
+    def _write_batch(self, batch):
+        rows = []
+        for device in batch:
+            row = {column: _to_text(device.get(column)) for column in DEVICE_COLUMNS}
+            row['data_fetched_at'] = list((device.get('data_fetched_at') or {}).items())
+            row['licenses'] = device.get('licenses') or []
+            rows.append(row)
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self.schema))
+
+    def _close(self):
+        self._writer.close()
+
+
+class HistorySink(DeviceSink):
+    """
+    Append the devices to the SQLite history (see `history_store.py`) as a new run,
+    one transaction per batch. The run is finished when the sink is closed, or marked as
+    aborted if the run failed or wrote no device.
+    """
+    def __init__(self, path, batch_size=None):
+        from history_store import HistoryStore
+
+        super().__init__(path, batch_size)
+        self.store = HistoryStore(path)
+        self.run_id, self.collected_at = self.store.start_run()
+
+    def _write_batch(self, batch):
+        self.store.add_snapshots(self.run_id, self.collected_at, batch)
+
+    def _close(self):
+        # Only a run that wrote devices becomes the previous snapshot of the next delta
+        if self.count:
+            self.store.finish_run(self.run_id, self.count)
+        else:
+            self.store.abort_run(self.run_id, self.count)
+        self.store.close()
+
+    def _abort(self):
+        self.store.abort_run(self.run_id, self.count)
+        self.store.close()
+
+
+class DeltaSink(DeviceSink):
+    """
+    Write the changes since the previous snapshot of the fleet (see `delta_report.py`),
+    one JSON line per change.
+
+    Every device is compared as soon as it is written, against its previous snapshot looked up
+    in the history (see `delta_report.open_previous_snapshot`); the devices of the previous
+    snapshot that did not appear are reported as missing, in batches, when the sink is closed.
+    """
+    def __init__(self, path, batch_size=None):
+        from delta_report import open_previous_snapshot
+
+        super().__init__(path, batch_size)
+        # The JSONL output of the same run is named devices_<timestamp>.jsonl
+        current_name = os.path.basename(path).replace('delta_', 'devices_', 1)
+        self.source, self.tracker = open_previous_snapshot(os.path.dirname(path), current_name, batch_size=self.batch_size)
+        self.summary = {}
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def _write_changes(self, changes):
+        from delta_report import write_changes
+
+        for change in changes:
+            self.summary[change['change']] = self.summary.get(change['change'], 0) + 1
+        write_changes(changes, self._file)
+
+    def _write_batch(self, batch):
+        self._write_changes(self.tracker.compare_batch(batch))
+        self._file.flush()
+
+    def _close(self):
+        from delta_report import log_summary
+
+        missing = iter(self.tracker.missing())
+        while True:
+            changes = list(itertools.islice(missing, self.batch_size))
+            if not changes:
+                break
+            self._write_changes(changes)
+        self.tracker.close()
+        self._file.close()
+        log_summary(self.summary, self.source, self.path)
+
+    def _abort(self):
+        self.tracker.close()
+        self._file.close()
+        _remove_file(self.path)
+
+
+class ExcelSink(JsonlSink):
+    """
+    Build the Excel report when the sink is closed.
+
+    The devices are spooled to a JSONL file as they arrive and the workbook is written
+    from it at the end, so the report never needs the whole fleet in memory. The compliance
+    sheets (see `analytics.py`) are built from the spool too, but in a DataFrame of the whole fleet.
+    """
+    def __init__(self, path, spool_path=None, licenses_sheet=False, batch_size=None, compliance_sheets=False, index=None, sites=None):
+        self.excel_path = path
+        self.licenses_sheet = licenses_sheet
+        self.compliance_sheets = compliance_sheets
+        self.index = index
+        self.sites = sites
+        super().__init__(spool_path or f"{os.path.splitext(path)[0]}_report.jsonl", batch_size)
+
+    def _close(self):
+        super()._close()
+        build_excel_from_jsonl(
+            self.path, self.excel_path, self.licenses_sheet, self.compliance_sheets, self.index, self.sites
+        )
+
+    def _abort(self):
+        # The workbook of the previous run is kept
+        super()._close()
+        _remove_file(self.path)
+
+
+class JsonlReader:
+    """
+    Re-iterable reader of a JSONL file: every iteration reads the file again from disk.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class ParquetReader:
+    """
+    Re-iterable reader of a Parquet file written by ParquetSink, one row group at a time.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(self.path)
+        for batch in parquet_file.iter_batches():
+            for row in batch.to_pylist():
+                row['data_fetched_at'] = dict(row.get('data_fetched_at') or [])
+                yield row
+
+
+def build_excel_from_jsonl(jsonl_path, filename='output.xlsx', licenses_sheet=False, compliance_sheets=False, index=None, sites=None):
+    """
+    Build the Excel report from the output of a JsonlSink.
+    """
+    from dataframes import save_to_excel
+
+    save_to_excel(JsonlReader(jsonl_path), filename, licenses_sheet, compliance_sheets, index, sites)
+
+
+def build_excel_from_parquet(parquet_path, filename='output.xlsx', licenses_sheet=False, compliance_sheets=False, index=None, sites=None):
+    """
+    Build the Excel report from the output of a ParquetSink.
+    """
+    from dataframes import save_to_excel
+
+    save_to_excel(ParquetReader(parquet_path), filename, licenses_sheet, compliance_sheets, index, sites)
+
+
+# Sinks disponibles para la variable OUTPUT_SINKS y nombre de su archivo
+SINK_TYPES = {
+    'jsonl': (JsonlSink, 'devices_{timestamp}.jsonl'),
+    'csv': (CsvSink, 'devices_{timestamp}.csv'),
+    'parquet': (ParquetSink, 'devices_{timestamp}.parquet'),
+    'excel': (ExcelSink, 'devices_{timestamp}.xlsx'),
+    'delta': (DeltaSink, 'delta_{timestamp}.jsonl'),
+    # La historia es una única base de datos que acumula todas las ejecuciones
+    'history': (HistorySink, None),
+}
+
+
+def open_sinks(names=None, output_dir=None, batch_size=None):
+    """
+    Open the sinks listed in `names` (or in the `OUTPUT_SINKS` environment variable).
+
+    Every sink writes to `<output_dir>/devices_<timestamp>.<extension>` (the delta report to
+    `delta_<timestamp>.jsonl`), except the history, which appends to `HISTORY_DB`
+    (`<output_dir>/history.sqlite` by default).
+
+    Args:
+        names (list, optional): The sink names, e.g. ['jsonl', 'csv']. Defaults to `OUTPUT_SINKS` ('jsonl,history,delta').
+        output_dir (str, optional): The output directory. Defaults to `OUTPUT_DIR` ('output').
+        batch_size (int, optional): Devices per flush. Defaults to `SINK_BATCH_SIZE`.
+
+    Returns:
+        list: The opened sinks.
+    """
+    if names is None:
+        names = [name.strip() for name in os.getenv('OUTPUT_SINKS', DEFAULT_OUTPUT_SINKS).split(',') if name.strip()]
+    if output_dir is None:
+        output_dir = os.getenv('OUTPUT_DIR', DEFAULT_OUTPUT_DIR)
+    if batch_size is None:
+        batch_size = int(os.getenv('SINK_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    sinks = []
+    for name in names:
+        if name not in SINK_TYPES:
+            error_logger.error("Unknown output sink: %s", name)
+            continue
+        sink_class, filename = SINK_TYPES[name]
+        if filename is None:
+            from history_store import get_history_path
+
+            path = get_history_path(output_dir)
+        else:
+            path = os.path.join(output_dir, filename.format(timestamp=timestamp))
+        try:
+            sinks.append(sink_class(path, batch_size=batch_size))
+            info_logger.info("Writing devices to %s", path)
+        except Exception as e:
+            # A missing optional dependency or an unusable file only disables that sink
+            error_logger.error("Could not open the %s sink: %s", name, e)
+    return sinks
+
+
+def close_sinks(sinks):
+    """
+    Close every sink, logging (and not raising) the errors.
+    """
+    for sink in sinks:
+        try:
+            # Closing flushes the last batch (and builds the workbook of the Excel sink)
+            with metrics.timer('panos_export_seconds', sink.path, output=type(sink).__name__, stage='close'):
+                sink.close()
+        except Exception as e:
+            error_logger.error("Error closing the sink %s: %s", sink.path, e)
+
+
+def abort_sinks(sinks):
+    """
+    Abort every sink after a failed run, logging (and not raising) the errors.
+    """
+    for sink in sinks:
+        try:
+            sink.abort()
+        except Exception as e:
+            error_logger.error("Error aborting the sink %s: %s", sink.path, e)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _to_text(value):
+    return value if value is None or isinstance(value, str) else str(value)
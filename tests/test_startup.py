@@ -0,0 +1,55 @@
+# Importaciones de bibliotecas estándar de Python
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# Importaciones locales
+from benchmark import DEFAULT_STARTUP_BUDGET, STARTUP_COMMANDS, bench_startup, check_startup_budget
+
+# Módulos pesados que sólo se importan cuando se escribe un reporte o se arma un DataFrame
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'pyarrow')
+RUN_SCRIPT = """
+import runpy, sys
+sys.argv = {arguments!r}
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+"""
+LIST_HEAVY_MODULES = """
+import sys
+print('heavy:' + ','.join(module for module in {modules!r} if module in sys.modules))
+"""
+
+
+class StartupBudgetTest(unittest.TestCase):
+    """
+    Start-up budget of `cli.py --help` and of the imports of the collect command (see `benchmark.py`).
+
+    `STARTUP_BUDGET` overrides the budget in seconds, e.g. on a slow CI runner.
+    """
+    def test_startup_within_budget(self):
+        budget = float(os.getenv('STARTUP_BUDGET', DEFAULT_STARTUP_BUDGET))
+        results = {}
+        bench_startup(results, repeat=5)
+        over_budget = check_startup_budget(results, budget)
+        self.assertEqual(over_budget, [], f"Start-up over the budget of {budget:.3f} s")
+
+    def test_startup_does_not_import_heavy_modules(self):
+        for name, arguments in STARTUP_COMMANDS.items():
+            # A script is run like `python script.py args`, then the loaded modules are listed
+            code = arguments[1] if arguments[0] == '-c' else RUN_SCRIPT.format(arguments=arguments)
+            code += LIST_HEAVY_MODULES.format(modules=HEAVY_MODULES)
+            completed = subprocess.run(
+                [sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+            )
+            lines = [line for line in completed.stdout.splitlines() if line.startswith('heavy:')]
+            self.assertEqual(lines, ['heavy:'], f"{name} imports heavy modules")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import os
 
 from logger import error_logger, info_logger
@@ -14,7 +15,7 @@ def ensure_dir_exists(directory):
     bool: True if the directory already existed, False if it was created.
     """
     if not os.path.exists(directory):
-        error_logger.error(f"Directory {directory} does not exist.")
+        error_logger.error("Directory %s does not exist.", directory)
         os.makedirs(directory)
         return False
     return True
@@ -49,7 +50,7 @@ def get_most_recent_file(directory, file_extension):
         str: The full path of the most recently modified file, or None if no files were found.
     """
     # Log the directory and file extension to search for
-    info_logger.info(f'Directory to search for {file_extension} files: {directory}')
+    info_logger.info("Directory to search for %s files: %s", file_extension, directory)
     # Initialize the variables to store the most recently modified file and its full path
     full_path_last_modified_file = None
     # Get the list of files with the specified extension
@@ -57,13 +58,30 @@ def get_most_recent_file(directory, file_extension):
     
     if not files: # If no files were found
         # Log the error if no files were found
-        error_logger.error(f'No {file_extension} files found in {directory}.')        
+        error_logger.error("No %s files found in %s.", file_extension, directory)        
     else: # If files were found
-        info_logger.info(f'Number of {file_extension} files found: {len(files)}')
+        info_logger.info("Number of %s files found: %s", file_extension, len(files))
         # Get the most recently modified file
         last_modified_file = max(files, key=lambda file: os.path.getmtime(os.path.join(directory, file)))
         # Get the full path of the most recently modified file
         full_path_last_modified_file = os.path.abspath(os.path.join(directory, last_modified_file))
         # Log the most recently modified file
-        info_logger.info(f'Path of the most recently modified ({datetime.datetime.fromtimestamp(os.path.getmtime(full_path_last_modified_file))}) {file_extension} file: {last_modified_file}')
-    return full_path_last_modified_file
\ No newline at end of file
+        info_logger.info("Path of the most recently modified (%s) %s file: %s", datetime.datetime.fromtimestamp(os.path.getmtime(full_path_last_modified_file)), file_extension, last_modified_file)
+    return full_path_last_modified_file
+
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 hash of a file, reading it in blocks.
+
+    Args:
+        file_path (str): The path of the file.
+        chunk_size (int, optional): The size of the blocks read from disk. Defaults to 1 MB.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the file.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
@@ -0,0 +1,145 @@
+# Importaciones de bibliotecas estándar de Python
+import re
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote
+
+# Campos de `show system info` que usa create_device_from_info
+SYSTEM_FIELDS = (
+    'hostname', 'model', 'serial', 'ip-address', 'sw-version', 'global-protect-client-package-version',
+    'app-version', 'av-version', 'threat-version', 'wildfire-version', 'url-filtering-version',
+    'device-certificate-status'
+)
+
+# Clave especial del mapa para la respuesta de `type=keygen`
+KEYGEN_URI = 'keygen'
+
+# Mapa declarativo URI -> campos a extraer.
+# - path: ruta (dentro de <response><result>) del elemento que contiene los campos.
+# - fields: hijos directos de ese elemento que se guardan.
+# - many: si el elemento se repite (p. ej. cada <entry> de las licencias) y se guarda como lista.
+XML_FIELD_MAP = {
+    KEYGEN_URI: {'path': (), 'fields': ('key',)},
+    '<show><system><info></info></system></show>': {'path': ('system',), 'fields': SYSTEM_FIELDS},
+    '<request><license><info></info></license></request>': {
+        'path': ('licenses', 'entry'), 'fields': ('feature', 'issued', 'expired'), 'many': True
+    },
+}
+
+# Tamaño de los bloques de bytes que se entregan al parser
+CHUNK_SIZE = 64 * 1024
+
+
+def normalize_uri(uri):
+    """
+    Normalize a URI (command) so it can be looked up in the field map.
+
+    Args:
+        uri (str): The URI as written in the `URIS` environment variable.
+
+    Returns:
+        str: The URL-decoded URI without whitespace between tags.
+    """
+    return re.sub(r'>\s+<', '><', unquote(uri).strip())
+
+
+def get_field_spec(uri):
+    """
+    Get the declarative field specification of a URI.
+
+    Args:
+        uri (str): The URI (command).
+
+    Returns:
+        dict or None: The field specification, or None if the URI is unknown.
+    """
+    if uri is None:
+        return None
+    return XML_FIELD_MAP.get(normalize_uri(uri))
+
+
+def _set_path(container, path, value, many):
+    # Build the nested dictionaries of the path and store the value at the end
+    for key in path[:-1]:
+        container = container.setdefault(key, {})
+    if many:
+        container.setdefault(path[-1], []).append(value)
+    else:
+        container[path[-1]] = value
+
+
+def parse_selected_fields(chunks, spec):
+    """
+    Parse a PAN-OS XML response incrementally, keeping only the fields declared in `spec`.
+
+    The bytes are fed to the parser as they arrive and every element is discarded as soon as
+    it is closed, so memory does not grow with the size of the response. The result has the same
+    shape that xmltodict would produce for the selected fields, e.g.
+    {'response': {'@status': 'success', 'result': {'system': {'hostname': ..., ...}}}}.
+
+    Args:
+        chunks (iterable): An iterable of bytes with the body of the response.
+        spec (dict): The field specification of the URI (see `XML_FIELD_MAP`).
+
+    Returns:
+        dict: The compact parsed response.
+
+    Raises:
+        xml.etree.ElementTree.ParseError: If the response is not valid XML.
+    """
+    path = ('response', 'result') + tuple(spec['path'])
+    fields = set(spec['fields'])
+    many = spec.get('many', False)
+    record_depth = len(path)
+
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    response = {}
+    result = {}
+    messages = []
+    tags = []
+    elements = []
+    record = None
+
+    def handle_events():
+        nonlocal record
+        for event, element in parser.read_events():
+            if event == 'start':
+                tags.append(element.tag)
+                elements.append(element)
+                depth = len(tags)
+                if depth == 1:
+                    response.update({f'@{name}': value for name, value in element.attrib.items()})
+                elif depth == record_depth and tuple(tags) == path:
+                    record = {}
+                continue
+
+            depth = len(tags)
+            if record is not None and depth == record_depth + 1 and element.tag in fields:
+                text = element.text.strip() if element.text else None
+                record[element.tag] = text or None
+            elif depth == record_depth and record is not None and tuple(tags) == path:
+                if spec['path']:
+                    _set_path(result, spec['path'], record, many)
+                else:
+                    result.update(record)
+                record = None
+            elif element.tag == 'msg' and element.text and element.text.strip():
+                # Mensajes de error de PAN-OS
+                messages.append(element.text.strip())
+            tags.pop()
+            elements.pop()
+            # Discard the closed element so the tree never grows
+            if elements:
+                elements[-1].remove(element)
+
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+            handle_events()
+    parser.close()
+    handle_events()
+
+    if messages:
+        result.setdefault('msg', messages[0] if len(messages) == 1 else messages)
+    if result:
+        response['result'] = result
+    return {'response': response}